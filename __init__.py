@@ -2,9 +2,8 @@
 # anki stuff import
 from aqt.deckchooser import DeckChooser
 from aqt import mw
-from aqt.utils import showInfo, getFile, showText
+from aqt.utils import showInfo, getFile, showText, askUser
 from aqt.qt import *  # This imports QThread, pyqtSignal, QDialog, QPushButton, etc.
-from anki.importing import TextImporter
 
 # some python libs
 import os
@@ -16,6 +15,7 @@ import time
 import string
 from sys import platform
 import getpass
+import traceback
 
 # Simple translation function for compatibility
 _ = lambda text: text
@@ -24,48 +24,99 @@ sys.path.insert(0, os.path.join(mw.pm.addonFolder(), "kind2anki"))
 sys.path.insert(0, os.path.join(mw.pm.addonFolder(), "kind2anki", "kind2anki"))
 sys.path.insert(0, os.path.join(mw.pm.addonFolder(), "kind2anki", "kind2anki", "libs"))
 
-# addon's ui
-from .kind2anki import kind2anki_ui
+# The add-on's own modules (and requests/bs4 through them) are imported when
+# the kind2anki menu action is used, so loading the add-on costs Anki's
+# startup nothing. tests/test_startup.py keeps it that way.
 
-from .kind2anki.kindleimporter import KindleImporter
+# Imports still running; keeps their threads alive after the dialog is gone,
+# so nothing has to block on them
+_running_imports = set()
 
 
 class ThreadTranslate(QThread):
     startProgress = pyqtSignal(object, object)
+    progress = pyqtSignal(object)
     done = pyqtSignal(object, object)
 
     def __init__(self, args=None):
         QThread.__init__(self)
         self.args = args
+        self.kwargs = {}
         self.dialog = None
+        self.importer = None
+        self.error = None
+        from .kind2anki.cancellation import CancellationToken
+        self.cancelToken = CancellationToken()
+        self.cancelTimer = None
 
     def __del__(self):
-        self.wait()
+        # Never block Anki on a running import, just ask it to stop
+        self.cancel()
+
+    def cancel(self):
+        self.cancelToken.cancel()
+
+    def watchForCancel(self):
+        # Closing the progress window cancels the import
+        self.cancelTimer = QTimer()
+        self.cancelTimer.timeout.connect(self.checkCancel)
+        self.cancelTimer.start(200)
+
+    def checkCancel(self):
+        if mw.progress.want_cancel() and not self.cancelToken.cancelled:
+            mw.progress.update(label="Cancelling...")
+            self.cancel()
 
     def run(self):
+        from .kind2anki.kindleimporter import KindleImporter
         self.startProgress.emit(self.dialog, "start")
-        kindleImporter = KindleImporter(*self.args)
-        kindleImporter.translateWordsFromDB()
-        temp_file_path = kindleImporter.createTemporaryFile()
-        self.done.emit(self.dialog, temp_file_path)
+        notes = []
+        try:
+            kindleImporter = KindleImporter(
+                *self.args, progressCallback=self.progress.emit,
+                cancelToken=self.cancelToken, **self.kwargs)
+            self.importer = kindleImporter
+            notes = kindleImporter.exportNotes()
+        except Exception as e:
+            # e.g. a dictionary dump that cannot be read; done is always
+            # emitted, or the progress window would stay open forever
+            traceback.print_exc()
+            self.error = e
+        self.done.emit(self.dialog, notes)
 
 
 # moved from class beacause it cannot work as a slot :(
-def importToAnki(dialog, temp_file_path):
+def importToAnki(dialog, notes):
     mw.progress.finish()
-    if temp_file_path is not None:
+    thread = dialog.t
+    if thread.cancelTimer is not None:
+        thread.cancelTimer.stop()
+    _running_imports.discard(thread)
+
+    if thread.error is not None:
+        showText("Import failed: {}".format(thread.error))
+        return
+    if thread.importer.cancelled and notes:
+        # Keep the finished cards only if the user wants them
+        if not askUser("Import cancelled. Import the {} cards finished so far?".format(len(notes))):
+            notes = []
+    if notes:
         mw.progress.start(immediate=True, label="Importing...")
-        dialog.setupImporter(temp_file_path)
+        dialog.setupImporter()
         dialog.selectDeck()
 
-        dialog.importer.run()
+        dialog.importer.run(notes)
         mw.progress.finish()
 
+        # Remember what was imported so the next run can skip it
+        dialog.t.importer.markImported()
+        dialog.t.importer.writeReport()
+
         txt = _("Importing complete.") + "\n"
         if dialog.importer.log:
             txt += "\n".join(dialog.importer.log)
-
-        os.remove(temp_file_path)
+    elif thread.importer.cancelled:
+        txt = "Import cancelled."
     else:
         txt = "Nothing to import!"
     showText(txt)
@@ -75,17 +126,24 @@ def startProgressBar(dialog, nth):
     mw.progress.start(immediate=True, label="Processing...")
 
 
+def updateProgressBar(event):
+    # event is a kind2anki.progress.ProgressEvent
+    mw.progress.update(label=event.label(), value=event.done, max=event.total or 0)
+
+
 class Kind2AnkiDialog(QDialog):
     def __init__(self):
         global mw
         QDialog.__init__(self, mw, Qt.WindowType.Window)
         self.mw = mw
+        from .kind2anki import kind2anki_ui
         self.frm = kind2anki_ui.Ui_kind2ankiDialog()
         self.frm.setupUi(self)
 
         self.t = ThreadTranslate()
         self.t.done.connect(importToAnki)
         self.t.startProgress.connect(startProgressBar)
+        self.t.progress.connect(updateProgressBar)
 
         b = QPushButton(_("Import"))
         self.frm.buttonBox.addButton(b, QDialogButtonBox.ButtonRole.AcceptRole)
@@ -93,6 +151,8 @@ class Kind2AnkiDialog(QDialog):
             self.mw, self.frm.deckArea, label=False)
         self.frm.importMode.setCurrentIndex(
                     self.mw.pm.profile.get('importMode', 1))
+        self.frm.offlineDictionary.setChecked(
+                    self.mw.pm.profile.get('kind2ankiOfflineDictionary', False))
 
         self.daysSinceLastRun = self.getDaysSinceLastRun()
         self.frm.importDays.setValue(self.daysSinceLastRun)
@@ -100,6 +160,8 @@ class Kind2AnkiDialog(QDialog):
         self.exec()
 
     def accept(self):
+        from .kind2anki.cache import default_cache_path
+        from .kind2anki.note_importer import ADD_MODE, load_first_fields
         try:
             db_path = getDBPath()
             self.writeCurrentTimestampToFile()  # update lastRun timestamp
@@ -109,6 +171,17 @@ class Kind2AnkiDialog(QDialog):
             doTranslate = self.frm.doTranslate.isChecked()
             importDays = self.frm.importDays.value()
             includeDictionary = self.frm.includeDictionary.isChecked()
+            incrementalImport = self.frm.incrementalImport.isChecked()
+            importMode = self.frm.importMode.currentIndex()
+            dictionaryPath = self.getDictionaryPath() if includeDictionary else None
+            instrument = os.environ.get("KIND2ANKI_INSTRUMENT")
+
+            # Words already in the collection are known before any lookup is
+            # made (collection access has to stay on the main thread)
+            existingWords = None
+            if importMode != ADD_MODE:
+                existingWords = set(load_first_fields(
+                    self.mw.col, self.mw.col.models.current()['id']))
 
             #if doTranslate:
             #    showInfo("Translating words from database, it can take a while...")
@@ -119,8 +192,25 @@ class Kind2AnkiDialog(QDialog):
             self.t.args = (
                 db_path, target_language, includeUsage, doTranslate, importDays, includeDictionary
                 )
-
+            self.t.kwargs = {
+                "cachePath": default_cache_path("kind2anki_cache.db"),
+                "ledgerPath": default_cache_path("import_ledger.db") if incrementalImport else None,
+                "mediaIndexPath": default_cache_path("media_index.db"),
+                "journalPath": default_cache_path("import_journal.jsonl"),
+                # Timing report for troubleshooting: set KIND2ANKI_INSTRUMENT=1
+                # (or =profile to also capture a cProfile) before starting Anki
+                "reportPath": default_cache_path("import_report.json") if instrument else None,
+                "profile": instrument == "profile",
+                "existingWords": existingWords,
+                "importMode": importMode,
+                "dictionaryPath": dictionaryPath,
+                "dictionaryIndexPath": default_cache_path("offline_dictionary.db"),
+                "inflectionsPath": default_cache_path("inflections.tsv"),
+            }
+
+            _running_imports.add(self.t)
             self.t.start()
+            self.t.watchForCancel()
 
         except urllib.error.URLError:
             showInfo("Cannot connect")
@@ -132,13 +222,14 @@ class Kind2AnkiDialog(QDialog):
             self.close()
             self.mw.reset()
 
-    def setupImporter(self, temp_file_path):
-        self.importer = TextImporter(self.mw.col, str(temp_file_path))
-        self.importer.initMapping()
-        self.importer.allowHTML = True
-        self.importer.importMode = self.frm.importMode.currentIndex()
-        self.mw.pm.profile['importMode'] = self.importer.importMode
-        self.importer.delimiter = ';'
+    def setupImporter(self):
+        # Notes are added straight to the collection, mapping the card fields
+        # in order onto the current note type (like TextImporter did)
+        importMode = self.frm.importMode.currentIndex()
+        self.mw.pm.profile['importMode'] = importMode
+        from .kind2anki.note_importer import NoteImporter
+        self.importer = NoteImporter(
+            self.mw.col, self.mw.col.models.current(), self.deck.selectedId(), importMode)
 
     def selectDeck(self):
         did = self.deck.selectedId()
@@ -147,6 +238,27 @@ class Kind2AnkiDialog(QDialog):
             self.mw.col.models.save(self.importer.model)
         self.mw.col.decks.select(did)
 
+    def getDictionaryPath(self):
+        # The dictionary file is asked for once and remembered per profile
+        useOffline = self.frm.offlineDictionary.isChecked()
+        self.mw.pm.profile['kind2ankiOfflineDictionary'] = useOffline
+        if not useOffline:
+            return None
+        from .kind2anki.offline_dictionary import READERS
+        path = self.mw.pm.profile.get('kind2ankiDictionaryPath')
+        if not path or not os.path.isfile(path):
+            extensions = [extension for names, _reader in READERS for extension in names]
+            path = getFile(
+                self.mw, _("Select dictionary file"), None,
+                filter=" ".join("*" + extension for extension in extensions),
+                key="kind2ankiDictionary")
+            if not path:
+                showInfo("No dictionary file selected, words are looked up online")
+                return None
+            path = str(path)
+            self.mw.pm.profile['kind2ankiDictionaryPath'] = path
+        return path
+
     def getDaysSinceLastRun(self):
         path = self.getLastRunFilePath()
         if os.path.isfile(path):
@@ -213,7 +325,23 @@ def getKindleVocabPath():
         return ""
 
 
+def showDialog():
+    from .kind2anki.cache import default_cache_path
+    from .kind2anki.dependencies import ensure_dependencies_installed, forget_dependency_check
+
+    marker_path = default_cache_path("dependencies.json")
+    ensure_dependencies_installed(marker_path)
+    try:
+        # Load the importer now, so the import itself doesn't wait for it
+        from .kind2anki import kindleimporter
+    except ImportError as e:
+        # A dependency went missing since it was last checked
+        forget_dependency_check(marker_path)
+        showInfo("kind2anki is missing a dependency: {}".format(e))
+        return
+    Kind2AnkiDialog()
+
 
 action = QAction("kind2anki", mw)
-action.triggered.connect(Kind2AnkiDialog)
+action.triggered.connect(showDialog)
 mw.form.menuTools.addAction(action)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the translate request token (tk) calculation
+
+Compares the original ctypes implementation with the integer-mask version
+in kind2anki/translate.py, uncached and memoized, on short words, long
+phrases and CJK input, and checks both produce the same tokens.
+
+Usage:
+    python benchmarks/bench_calculate_tk.py [repeat]
+"""
+
+import ctypes
+import os
+import sys
+import time
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.translate import _calculate_tk
+
+
+def legacy_calculate_tk(source):
+    """The ctypes implementation translate.py used before"""
+    tkk = [406398, 561666268 + 1526272306]
+    b = tkk[0]
+
+    d = source.encode('utf-8')
+
+    def RL(a, b):
+        for c in range(0, len(b) - 2, 3):
+            d = b[c + 2]
+            d = ord(d) - 87 if d >= 'a' else int(d)
+            xa = ctypes.c_uint32(a).value
+            d = xa >> d if b[c + 1] == '+' else xa << d
+            a = a + d & 4294967295 if b[c] == '+' else a ^ d
+        return ctypes.c_int32(a).value
+
+    a = b
+
+    for di in d:
+        a = RL(a + di, "+-a^+6")
+
+    a = RL(a, "+-3^+b+-f")
+    a ^= tkk[1]
+    a = a if a >= 0 else ((a & 2147483647) + 2147483648)
+    a %= pow(10, 6)
+
+    tk = '{0:d}.{1:d}'.format(a, a ^ b)
+    return tk
+
+
+INPUTS = {
+    'words': ['serene', 'house', 'ubiquitous', 'nothing', 'run'],
+    'long phrases': ['\n'.join(['the quick brown fox jumps over the lazy dog'] * 20 + [str(i)])
+                     for i in range(5)],
+    'CJK': ['静かな湖のほとりで本を読む' * 10 + str(i) for i in range(5)],
+}
+
+
+def timed(func, sources, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for source in sources:
+            func(source)
+    return (time.perf_counter() - start) / (repeat * len(sources)) * 1e6
+
+
+def run(repeat=200):
+    print(f"{'input':<14} {'bytes':>6} {'ctypes (us)':>12} {'masks (us)':>11} "
+          f"{'memoized (us)':>14} {'speedup':>8}")
+    for name, sources in INPUTS.items():
+        for source in sources:
+            assert legacy_calculate_tk(source) == _calculate_tk.__wrapped__(source), source
+
+        size = sum(len(source.encode('utf-8')) for source in sources) // len(sources)
+        legacy = timed(legacy_calculate_tk, sources, repeat)
+        masks = timed(_calculate_tk.__wrapped__, sources, repeat)
+        _calculate_tk.cache_clear()
+        memoized = timed(_calculate_tk, sources, repeat)
+        print(f"{name:<14} {size:>6} {legacy:>12.1f} {masks:>11.1f} "
+              f"{memoized:>14.2f} {legacy / masks:>7.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
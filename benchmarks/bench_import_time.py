@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the add-on's startup cost
+
+Anki loads every add-on while it starts. Kind2Anki defers its own modules
+(and requests/bs4 through them) until the kind2anki menu action is used, so
+all it should cost at startup are its module-level imports outside aqt.
+This runs `python -X importtime` in fresh interpreters for:
+
+    startup   - the module-level imports of the add-on's __init__.py (aqt,
+                which Anki has loaded already, left out)
+    deferred  - kind2anki.kindleimporter, loaded when the dialog opens
+
+and prints the cumulative import time and the slowest modules of each.
+Exits with status 1 if startup exceeds the budget or pulls in the importer.
+
+Usage:
+    python benchmarks/bench_import_time.py [--budget-ms 30] [--runs 5]
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+repo_path = os.path.join(dir_path, "..")
+
+# Modules that must not be imported while Anki starts
+DEFERRED_MODULES = ("kind2anki.kindleimporter", "requests", "bs4")
+
+
+def startup_imports():
+    """Modules the add-on's __init__.py imports on load"""
+    with open(os.path.join(repo_path, "__init__.py"), "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            # Relative imports are the add-on's own kind2anki package
+            modules.add("kind2anki" if node.level else node.module)
+    return sorted(module for module in modules if module.split(".")[0] != "aqt")
+
+
+def import_time(modules):
+    """
+    Import modules in a fresh interpreter with -X importtime
+
+    Returns:
+        List of (module, cumulative microseconds, imported by -c directly)
+    """
+    code = "".join("import {}\n".format(module) for module in modules) or "pass\n"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=repo_path, capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        entries.append((fields[2].strip(), int(fields[1]), not fields[2].startswith("  ")))
+    return entries
+
+
+def measure(label, modules, runs, baseline):
+    """
+    Print the best import time of modules over a number of runs, leaving
+    out what the interpreter imports on its own (site, encodings, ...)
+
+    Returns:
+        (milliseconds, {module: cumulative microseconds})
+    """
+    best = None
+    for _ in range(runs):
+        entries = import_time(modules)
+        times = {name: cumulative for name, cumulative, _top in entries if name not in baseline}
+        total = sum(cumulative for name, cumulative, top in entries if top and name not in baseline)
+        if best is None or total < best[0]:
+            best = (total, times)
+    total, times = best
+    print(f"{label:9} {total / 1000:8.1f} ms  ({', '.join(modules) or 'nothing'})")
+    slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)[:5]
+    for name, cumulative in slowest:
+        print(f"          {cumulative / 1000:8.1f} ms  {name}")
+    return total / 1000, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--budget-ms", type=float, default=30,
+                        help="Maximum startup import time (default: 30)")
+    parser.add_argument("--runs", type=int, default=5, help="Best of N runs (default: 5)")
+    args = parser.parse_args()
+
+    baseline = {name for name, _cumulative, _top in import_time([])}
+    startup, startup_times = measure("startup", startup_imports(), args.runs, baseline)
+    measure("deferred", ["kind2anki.kindleimporter"], args.runs, baseline)
+
+    failed = False
+    leaked = [module for module in DEFERRED_MODULES if module in startup_times]
+    if leaked:
+        print("FAIL: loaded at startup: " + ", ".join(leaked))
+        failed = True
+    if startup > args.budget_ms:
+        print(f"FAIL: startup imports take {startup:.1f} ms, budget {args.budget_ms:.1f} ms")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark for adding cards to an Anki collection
+
+Compares the old path (write kind2anki_temp.txt, parse it back with Anki's
+TextImporter) with NoteImporter adding the notes in one bulk operation,
+each on a fresh temporary collection.
+
+Needs the `anki` package (pip install anki).
+
+Usage:
+    python benchmarks/bench_note_import.py [n_cards]
+"""
+
+import codecs
+import os
+import sys
+import tempfile
+import time
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.note_importer import IGNORE_MODE, NoteImporter
+
+try:
+    from anki.collection import Collection
+    from anki.importing import TextImporter
+except ImportError:
+    sys.exit("This benchmark needs the anki package: pip install anki")
+
+
+def make_rows(n_cards):
+    return [[
+        f"word{i}",
+        "adjective",
+        "/wɜːd/",
+        f"A sentence using _____ number {i}; with a semicolon.",
+        f"[sound:kind2anki_{i:020x}.mp3]",
+        "",
+        f"<b>1.</b> Definition of word{i}<hr><b>Translation:</b> słowo {i}",
+        "Book: Walden",
+        "Generated by Kind2Anki from Kindle Vocabulary Builder",
+    ] for i in range(n_cards)]
+
+
+def new_collection(folder, name):
+    col = Collection(os.path.join(folder, name + ".anki2"))
+    model = col.models.current()
+    # Give the current note type the 9 fields of the add-on's note type
+    for i in range(len(model["flds"]), 9):
+        col.models.add_field(model, col.models.new_field(f"Field {i + 1}"))
+    col.models.save(model)
+    return col, col.models.current()
+
+
+def import_text_file(col, model, rows, folder):
+    path = os.path.join(folder, "kind2anki_temp.txt")
+    with codecs.open(path, "w", encoding="utf-8") as f:
+        for fields in rows:
+            f.write(u"{}\n".format(";".join(field.replace(";", ",") for field in fields)))
+            f.flush()
+    importer = TextImporter(col, path)
+    importer.initMapping()
+    importer.allowHTML = True
+    importer.importMode = IGNORE_MODE
+    importer.delimiter = ';'
+    importer.run()
+    os.remove(path)
+    return importer.total
+
+
+def import_notes(col, model, rows, folder):
+    importer = NoteImporter(col, model, model["did"], IGNORE_MODE)
+    importer.run(rows)
+    return importer.added
+
+
+def run(n_cards=10000):
+    rows = make_rows(n_cards)
+    print(f"{'path':<18} {'cards':>7} {'seconds':>8} {'cards/s':>9}")
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for name, func in (("text file", import_text_file), ("direct", import_notes)):
+            col, model = new_collection(folder, name.replace(" ", "_"))
+            start = time.perf_counter()
+            added = func(col, model, rows, folder)
+            elapsed = time.perf_counter() - start
+            assert col.note_count() == n_cards, (name, added)
+            col.close()
+            results[name] = elapsed
+            print(f"{name:<18} {n_cards:>7} {elapsed:>8.2f} {n_cards / elapsed:>9.0f}")
+    print(f"speedup: {results['text file'] / results['direct']:.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
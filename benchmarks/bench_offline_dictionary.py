@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the offline dictionary backend
+
+Writes a synthetic JSON dictionary dump, indexes it with load_dictionary
+and measures the lookup latency (hits and misses) of the index.
+
+Usage:
+    python benchmarks/bench_offline_dictionary.py [entries] [lookups]
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.offline_dictionary import load_dictionary
+
+
+def make_dump(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(entries):
+            f.write(json.dumps({
+                "word": f"word{i}",
+                "pos": "noun",
+                "pronunciation": "/wɜːd/",
+                "definitions": [{"definition": f"meaning {j} of word {i}",
+                                 "examples": [f"An example of word{i}."]} for j in range(3)],
+            }) + "\n")
+
+
+def run(entries=100000, lookups=20000):
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, "dictionary.jsonl")
+        make_dump(source, entries)
+        print(f"{entries} entries, {os.path.getsize(source) / 1024 / 1024:.1f} MiB dump")
+
+        start = time.perf_counter()
+        dictionary = load_dictionary(source, os.path.join(folder, "index.db"))
+        print(f"first load (indexing): {time.perf_counter() - start:.2f}s")
+        dictionary.close()
+        start = time.perf_counter()
+        dictionary = load_dictionary(source, os.path.join(folder, "index.db"))
+        print(f"second load:           {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        words = [f"word{random.randrange(entries)}" for _ in range(lookups // 2)]
+        words += [f"missing{i}" for i in range(lookups // 2)]
+        random.shuffle(words)
+        timings = []
+        for word in words:
+            start = time.perf_counter()
+            dictionary.get_word_info(word)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        dictionary.close()
+
+        print(f"{lookups} lookups: mean {sum(timings) / len(timings) * 1e6:.1f}us, "
+              f"p50 {timings[len(timings) // 2] * 1e6:.1f}us, "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    run(entries, lookups)
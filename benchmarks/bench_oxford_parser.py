@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Oxford dictionary HTML parsers
+
+Parses saved dictionary pages with the BeautifulSoup parser and the lxml
+single-pass parser and checks both return the same word information.
+
+Usage:
+    python benchmarks/bench_oxford_parser.py [pages_dir] [repeat]
+
+pages_dir defaults to tests/fixtures; save real pages from
+oxfordlearnersdictionaries.com there for representative numbers.
+"""
+
+import glob
+import os
+import sys
+import time
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.oxford_dictionary import OxfordDictionary, WordNotFound
+
+
+def parse(content, parser):
+    try:
+        return OxfordDictionary.parse_page(content, parser=parser)
+    except WordNotFound:
+        return None
+
+
+def run(pages_dir, repeat=50):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        with open(path, "rb") as f:
+            pages.append((os.path.basename(path), f.read()))
+
+    print(f"{'page':<28} {'KiB':>6} {'html.parser (ms)':>17} {'lxml (ms)':>10} {'speedup':>8}")
+    for name, content in pages:
+        assert parse(content, "html.parser") == parse(content, "lxml"), name
+
+        timings = {}
+        for parser in ("html.parser", "lxml"):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                parse(content, parser)
+            timings[parser] = (time.perf_counter() - start) / repeat * 1000
+
+        print(f"{name:<28} {len(content) / 1024:>6.1f} {timings['html.parser']:>17.2f} "
+              f"{timings['lxml']:>10.2f} {timings['html.parser'] / timings['lxml']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    pages_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(dir_path, "..", "tests", "fixtures")
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    run(pages_dir, repeat)
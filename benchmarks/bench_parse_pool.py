@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark for parsing dictionary pages on a process pool
+
+Parses a corpus of saved Oxford pages in the calling process and on
+ParsePools of 1, 2, 4, ... workers (up to the number of CPU cores), checks
+every pool returns the same records, and prints the throughput and the
+speedup over parsing in-process. Parsing is CPU bound, so the speedup
+should grow nearly linearly with the workers until the cores run out.
+
+Usage:
+    python benchmarks/bench_parse_pool.py [pages_dir] [pages] [parser]
+
+pages_dir defaults to tests/fixtures; save real pages from
+oxfordlearnersdictionaries.com there for representative numbers. The
+pages found are repeated until the corpus has `pages` pages (default 400).
+parser is 'html.parser' (default) or 'lxml'.
+"""
+
+import glob
+import os
+import sys
+import time
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.parse_pool import ParsePool, parse_record
+
+
+def load_corpus(pages_dir, size):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        with open(path, "rb") as f:
+            pages.append(f.read())
+    if not pages:
+        sys.exit(f"No .html pages in {pages_dir}")
+    return [pages[i % len(pages)] for i in range(size)]
+
+
+def worker_counts():
+    counts = []
+    workers = 1
+    cores = os.cpu_count() or 1
+    while workers < cores:
+        counts.append(workers)
+        workers *= 2
+    counts.append(cores)
+    return counts
+
+
+def run(pages_dir, size=400, parser="html.parser"):
+    corpus = load_corpus(pages_dir, size)
+    megabytes = sum(len(page) for page in corpus) / 1024 / 1024
+    print(f"{len(corpus)} pages, {megabytes:.1f} MiB, parser {parser}, {os.cpu_count()} CPU cores")
+
+    start = time.perf_counter()
+    expected = [parse_record(page, parser) for page in corpus]
+    baseline = time.perf_counter() - start
+
+    print(f"{'workers':>8} {'seconds':>8} {'pages/s':>8} {'speedup':>8} {'efficiency':>11}")
+    print(f"{'in-proc':>8} {baseline:>8.2f} {len(corpus) / baseline:>8.0f} {1:>7.2f}x {'':>11}")
+    for workers in worker_counts():
+        # Workers are started (and warmed up) before the clock starts
+        pool = ParsePool(workers)
+        try:
+            start = time.perf_counter()
+            records = pool.map(corpus, parser, chunksize=4)
+            seconds = time.perf_counter() - start
+        finally:
+            pool.close()
+        assert records == expected
+        speedup = baseline / seconds
+        print(f"{workers:>8} {seconds:>8.2f} {len(corpus) / seconds:>8.0f} {speedup:>7.2f}x "
+              f"{speedup / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    pages_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(dir_path, "..", "tests", "fixtures")
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    parser = sys.argv[3] if len(sys.argv) > 3 else "html.parser"
+    run(pages_dir, size, parser)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark for reading Kindle's vocab.db
+
+Builds synthetic vocab.db files of increasing size and compares the old
+per-word lookup queries (two round trips per word) with the single joined
+query used by KindleImporter.getWordsFromDB.
+
+Usage:
+    python benchmarks/bench_vocab_db.py [max_words]
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.kindleimporter import KindleImporter
+
+
+# Subset of the schema Kindle writes to system/vocabulary/vocab.db
+VOCAB_SCHEMA = """
+    CREATE TABLE WORDS (id TEXT PRIMARY KEY NOT NULL, word TEXT, stem TEXT,
+                        lang TEXT, category INTEGER DEFAULT 0,
+                        timestamp INTEGER DEFAULT 0, profileid TEXT);
+    CREATE TABLE LOOKUPS (id TEXT PRIMARY KEY NOT NULL, word_key TEXT,
+                          book_key TEXT, dict_key TEXT, pos TEXT, usage TEXT,
+                          timestamp INTEGER DEFAULT 0);
+    CREATE TABLE BOOK_INFO (id TEXT PRIMARY KEY NOT NULL, asin TEXT, guid TEXT,
+                            lang TEXT, title TEXT, authors TEXT);
+    CREATE INDEX lookupwordkey ON LOOKUPS (word_key);
+"""
+
+
+def create_vocab_db(path, n_words, lookups_per_word=2, n_books=200):
+    now_ms = int(time.time() * 1000)
+    conn = sqlite3.connect(path)
+    conn.executescript(VOCAB_SCHEMA)
+    conn.executemany(
+        "INSERT INTO BOOK_INFO (id, asin, guid, lang, title, authors) VALUES (?, ?, ?, 'en', ?, ?)",
+        ((f"book:{b}", f"ASIN{b}", f"guid{b}", f"Book {b}", f"Author {b}") for b in range(n_books)))
+    conn.executemany(
+        "INSERT INTO WORDS (id, word, stem, lang, timestamp) VALUES (?, ?, ?, 'en', ?)",
+        ((f"en:word{i}", f"word{i}", f"word{i}", now_ms) for i in range(n_words)))
+    conn.executemany(
+        "INSERT INTO LOOKUPS (id, word_key, book_key, usage, timestamp) VALUES (?, ?, ?, ?, ?)",
+        ((f"lookup:{i}:{j}", f"en:word{i}", f"book:{(i + j) % n_books}",
+          f"A sentence using word{i} number {j}.", now_ms)
+         for i in range(n_words) for j in range(lookups_per_word)))
+    conn.commit()
+    conn.close()
+
+
+def get_words_per_word_queries(db_path, timestamp):
+    """The original N+1 implementation, kept here as the baseline"""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT word, id, lang FROM words WHERE timestamp > ?", (str(timestamp),))
+    words_and_ids = c.fetchall()
+    sentences = {}
+    book_names = {}
+    for word, word_key, lang in words_and_ids:
+        c.execute("SELECT usage, book_key FROM LOOKUPS WHERE word_key = ?", [word_key])
+        usages_and_books = c.fetchall()
+        if usages_and_books:
+            sentences[word_key] = usages_and_books[0][0]
+            book_key = usages_and_books[0][1]
+            book_names[word_key] = "Unknown Book"
+            if book_key:
+                c.execute("SELECT title FROM BOOK_INFO WHERE id = ?", [book_key])
+                book_result = c.fetchone()
+                if book_result:
+                    book_names[word_key] = book_result[0]
+        else:
+            sentences[word_key] = ""
+            book_names[word_key] = "Unknown Book"
+    conn.close()
+    return sentences, book_names
+
+
+def run(max_words=100000):
+    sizes = [n for n in (1000, 10000, 50000, 100000) if n <= max_words] or [max_words]
+    print(f"{'words':>8} {'per-word (s)':>14} {'joined (s)':>12} {'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_words in sizes:
+            db_path = os.path.join(tmp, f"vocab_{n_words}.db")
+            create_vocab_db(db_path, n_words)
+
+            importer = KindleImporter(db_path, "pl", importDays=1)
+
+            start = time.perf_counter()
+            sentences, book_names = get_words_per_word_queries(db_path, importer.timestamp)
+            old_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            importer.getWordsFromDB()
+            new_time = time.perf_counter() - start
+
+            assert importer.sentences == sentences
+            assert importer.book_names == book_names
+
+            print(f"{n_words:>8} {old_time:>14.3f} {new_time:>12.3f} {old_time / new_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
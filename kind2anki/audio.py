@@ -0,0 +1,329 @@
+# Audio download manager for Kind2Anki
+# Oxford pronunciation files are queued while cards are written and
+# downloaded concurrently in the background, instead of each download
+# stalling the import file until it finishes.
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+
+from . import transport
+from .cancellation import Cancelled
+from .enrichment import POLL_INTERVAL
+from .instrumentation import timed
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def media_filename(url):
+    """
+    Media file name for an audio URL. Names are derived from the URL, so
+    every word (and every import) using the same recording shares one file.
+    """
+    extension = os.path.splitext(urlparse(url).path)[1].lower() or ".mp3"
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:20]
+    return f"kind2anki_{digest}{extension}"
+
+
+class MediaStore:
+    """
+    Index of the audio files downloaded into a media folder
+
+    Maps each audio URL to its file name and size, so known URLs are
+    resolved with a dictionary lookup and one stat() of the file (Check
+    Media may have deleted it since). The index is a SQLite file shared by
+    all profiles; without one, the media folder is checked for the file
+    instead.
+    """
+
+    def __init__(self, media_folder, index_path=None):
+        self.media_folder = media_folder
+        self._folder_key = os.path.abspath(media_folder)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._stale = []
+        self._conn = None
+        self._entries = {}
+        if index_path:
+            folder = os.path.dirname(index_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(index_path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS media (
+                    media_folder TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (media_folder, url)
+                );
+            """)
+            self._conn.commit()
+            # One query loads the index for this media folder
+            rows = self._conn.execute(
+                "SELECT url, filename, size FROM media WHERE media_folder = ?",
+                (self._folder_key,))
+            self._entries = {url: (filename, size) for url, filename, size in rows}
+
+    def get(self, url):
+        """
+        Get the file name of an already downloaded URL
+
+        Returns:
+            File name, or None if the URL has to be downloaded
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is not None:
+            filename, size = entry
+            try:
+                if os.stat(os.path.join(self.media_folder, filename)).st_size == size:
+                    return filename
+            except OSError:
+                pass
+            # Removed or changed behind our back: forget it and download again
+            with self._lock:
+                if self._entries.get(url) == entry:
+                    del self._entries[url]
+                    self._stale.append((self._folder_key, url))
+            return None
+        if self._conn is None:
+            filename = media_filename(url)
+            if os.path.exists(os.path.join(self.media_folder, filename)):
+                return filename
+        return None
+
+    def add(self, url, filename, size):
+        """Record a finished download (written to the index by flush)"""
+        with self._lock:
+            self._entries[url] = (filename, size)
+            self._pending.append((self._folder_key, url, filename, size, time.time()))
+
+    def flush(self):
+        """Write the recorded downloads to the index in one transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            stale, self._stale = self._stale, []
+        if self._conn is None or not (pending or stale):
+            return
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM media WHERE media_folder = ? AND url = ?", stale)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO media (media_folder, url, filename, size, created) "
+                "VALUES (?, ?, ?, ?, ?)", pending)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def download_to_file(url, path, chunk_size=CHUNK_SIZE):
+    """
+    Stream a URL into path, writing it under a temporary name first so an
+    interrupted download never leaves a partial file behind
+
+    Returns:
+        Number of bytes written
+    """
+    folder = os.path.dirname(path) or "."
+    response = transport.get(url, stream=True, step='audio.request')
+    try:
+        response.raise_for_status()
+        fd, part_path = tempfile.mkstemp(dir=folder, prefix=".kind2anki-", suffix=".part")
+        size = 0
+        try:
+            with timed('audio.download'), os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    transport.check_cancelled()
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(part_path, path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return size
+    finally:
+        response.close()
+
+
+class AudioDownloader:
+    """
+    Download audio files into a media folder on a bounded thread pool
+
+    Each URL is downloaded once; every word sharing it gets the same file,
+    and URLs in the media index are not downloaded again. Failed downloads
+    are collected in errors (URL -> message) for the caller to report.
+    """
+
+    def __init__(self, media_folder, concurrency=8, index_path=None):
+        """
+        Args:
+            media_folder: Anki's media folder
+            concurrency: Maximum number of downloads at the same time
+            index_path: SQLite file indexing downloaded media (optional)
+        """
+        self.media_folder = media_folder
+        self.store = MediaStore(media_folder, index_path)
+        self.concurrency = max(1, concurrency)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._filenames = {}   # url -> filename
+        self._futures = []
+        self._pending = set()  # file names still downloading
+        self._failed = set()   # file names whose download failed
+        self.errors = {}       # url -> error message
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.queued = 0
+        self.downloaded = 0
+        self.existing = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = None
+        self.finished = None
+
+    def add(self, url):
+        """
+        Queue an audio file
+
+        Returns:
+            File name the audio will have in the media folder
+        """
+        with self._lock:
+            filename = self._filenames.get(url)
+            if filename is not None:
+                return filename
+
+            filename = self.store.get(url)
+            if filename is not None:
+                self._filenames[url] = filename
+                self.existing += 1
+                return filename
+
+            filename = media_filename(url)
+            self._filenames[url] = filename
+            path = os.path.join(self.media_folder, filename)
+
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                thread_name_prefix="kind2anki-audio")
+                self.started = time.monotonic()
+            self.queued += 1
+            self._pending.add(filename)
+            self._futures.append(self._pool.submit(self._download, url, path))
+        return filename
+
+    def is_pending(self, filename):
+        """Check whether a file returned by add is still being downloaded"""
+        with self._lock:
+            return filename in self._pending
+
+    def has_failed(self, filename):
+        """Check whether the download of a file returned by add failed (or was aborted)"""
+        with self._lock:
+            return filename in self._failed
+
+    def _download(self, url, path):
+        filename = os.path.basename(path)
+        try:
+            size = download_to_file(url, path)
+        except Cancelled:
+            with self._lock:
+                self._pending.discard(filename)
+                self._failed.add(filename)
+            return
+        except Exception as e:
+            with self._lock:
+                self._pending.discard(filename)
+                self._failed.add(filename)
+                self.errors[url] = str(e)
+                self.failed += 1
+            return
+        self.store.add(url, filename, size)
+        with self._lock:
+            self._pending.discard(filename)
+            self.downloaded += 1
+            self.bytes += size
+
+    def wait(self, progress=None):
+        """
+        Block until every queued download has finished
+
+        Args:
+            progress: Optional function called with (finished, total) downloads
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+            futures, self._futures = self._futures, []
+        if pool is not None:
+            try:
+                for done, future in enumerate(futures, 1):
+                    self._result(future)
+                    if progress is not None:
+                        progress(done, len(futures))
+            except Cancelled:
+                with self._lock:
+                    self._pool, self._futures = pool, futures
+                self.abort()
+                raise
+            pool.shutdown(wait=True)
+            self.finished = time.monotonic()
+        self.store.flush()
+
+    def _result(self, future):
+        # Wake up regularly to notice a cancelled import
+        while True:
+            try:
+                return future.result(timeout=POLL_INTERVAL)
+            except FutureTimeoutError:
+                transport.check_cancelled()
+
+    def abort(self):
+        """Drop the queued downloads and stop waiting for running ones"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.cancel()
+        with self._lock:
+            # Files still downloading are not counted on
+            self._failed.update(self._pending)
+            self._pending.clear()
+        if pool is not None:
+            pool.shutdown(wait=False)
+            self.finished = time.monotonic()
+        self.store.flush()
+
+    def close(self):
+        self.wait()
+        self.store.close()
+
+    def stats(self):
+        elapsed = 0.0
+        if self.started is not None:
+            elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            'queued': self.queued,
+            'downloaded': self.downloaded,
+            'existing': self.existing,
+            'failed': self.failed,
+            'bytes': self.bytes,
+            'seconds': elapsed,
+            'files_per_second': self.downloaded / elapsed if elapsed else 0.0,
+            'bytes_per_second': self.bytes / elapsed if elapsed else 0.0,
+        }
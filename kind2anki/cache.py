@@ -0,0 +1,250 @@
+# Persistent lookup cache for Kind2Anki
+# Dictionary entries almost never change, so results are kept in a single
+# SQLite file between imports instead of being downloaded again every run.
+
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# Returned by PersistentCache.get when the key is not cached (or expired).
+# A cached negative result (e.g. WordNotFound) is returned as None instead.
+MISS = object()
+
+
+def default_cache_path(filename):
+    """
+    Get a path inside the add-on's user_files folder, which Anki keeps
+    when the add-on is updated
+    """
+    addon_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    return os.path.join(addon_dir, "user_files", filename)
+
+
+def normalize_key(word):
+    """Normalize a word the same way it is turned into a dictionary URL"""
+    return " ".join(word.split()).replace(" ", "-").lower()
+
+
+class PersistentCache:
+    """
+    SQLite-backed key/value cache with TTL expiry and LRU eviction
+
+    Values must be JSON serializable. Several caches can share one file
+    by using different namespaces.
+    """
+
+    def __init__(self, path, namespace="default", ttl=30 * 24 * 3600,
+                 negative_ttl=7 * 24 * 3600, max_entries=50000):
+        """
+        Args:
+            path: SQLite file to store the cache in (created if missing)
+            namespace: Name separating this cache from others in the same file
+            ttl: Seconds a cached value stays valid (None to never expire)
+            negative_ttl: Seconds a cached "not found" result stays valid
+            max_entries: Maximum number of entries kept in this namespace
+        """
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, last_access);
+        """)
+        self._conn.commit()
+
+    def get(self, key):
+        """
+        Get a cached value
+
+        Returns:
+            The cached value, None for a cached negative result,
+            or MISS if there is no valid entry
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)).fetchone()
+
+            if row is not None:
+                value, created = row
+                ttl = self.ttl if value is not None else self.negative_ttl
+                if ttl is not None and now - created > ttl:
+                    self._conn.execute(
+                        "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                        (self.namespace, key))
+                    self._conn.commit()
+                    row = None
+
+            if row is None:
+                self.misses += 1
+                return MISS
+
+            self._conn.execute(
+                "UPDATE cache SET last_access = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key))
+            self._conn.commit()
+
+        if value is None:
+            self.negative_hits += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        """Store a value, or a negative result if value is None"""
+        now = time.time()
+        encoded = json.dumps(value) if value is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, encoded, now, now))
+            self._evict()
+            self._conn.commit()
+
+    def set_missing(self, key):
+        """Remember that the key has no value (negative caching)"""
+        self.set(key, None)
+
+    def _evict(self):
+        """Drop least recently used entries above max_entries"""
+        if self.max_entries is None:
+            return
+        count = self._conn.execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache WHERE namespace = ? ORDER BY last_access LIMIT ?)",
+                (self.namespace, self.namespace, excess))
+
+    def clear(self):
+        """Remove all entries in this namespace"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def stats(self):
+        """Get hit/miss counters since the cache was opened"""
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryLRU:
+    """Bounded in-memory LRU cache with the same interface as PersistentCache"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(key)
+            value = self._entries[key]
+            if value is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set_missing(self, key):
+        self.set(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+        }
+
+
+class TieredCache:
+    """
+    Memory cache in front of a persistent cache: lookups try the memory
+    tier first and fill it from the disk tier
+    """
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not MISS:
+            return value
+        value = self.disk.get(key)
+        if value is not MISS:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def set_missing(self, key):
+        self.set(key, None)
+
+    def stats(self):
+        """Combined counters: a miss is a key found in neither tier"""
+        memory = self.memory.stats()
+        disk = self.disk.stats()
+        return {
+            'hits': memory['hits'] + disk['hits'],
+            'negative_hits': memory['negative_hits'] + disk['negative_hits'],
+            'misses': disk['misses'],
+            'memory_hits': memory['hits'],
+        }
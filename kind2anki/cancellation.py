@@ -0,0 +1,39 @@
+# Cooperative cancellation for Kind2Anki
+# The UI cancels a token; the importer, the executors and the network layer
+# check it between steps (and while waiting), so a running import stops
+# promptly instead of finishing every remaining lookup.
+
+import threading
+
+
+class Cancelled(Exception):
+    """Raised when an operation notices its cancellation token was cancelled"""
+
+
+class CancellationToken:
+    """Thread safe flag an import is cancelled with"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+    def sleep(self, seconds):
+        """Sleep, waking up early (and raising Cancelled) if cancelled"""
+        if self._event.wait(seconds):
+            raise Cancelled()
+
+
+def raise_if_cancelled(token):
+    """Check an optional token"""
+    if token is not None and token.cancelled:
+        raise Cancelled()
@@ -0,0 +1,189 @@
+# Headless command line importer for Kind2Anki
+# Runs the same read -> enrich -> format pipeline as the add-on, without
+# Anki's GUI (aqt is never imported), and writes the cards to a TSV or CSV
+# file that Anki's File > Import understands. Useful for enriching large
+# vocabularies ahead of time on another machine.
+#
+# Usage:
+#     python -m kind2anki vocab.db -o cards.tsv --language pl --days 30
+
+import argparse
+import csv
+import os
+import sys
+
+from .cache import default_cache_path
+from .kindleimporter import KindleImporter
+
+
+# Fields of the 9-field note type, in the order formatCard returns them
+FIELD_NAMES = ["Word", "Word Type", "Phonetic", "Example", "Sound", "Image",
+               "Def", "Content", "Copyright"]
+
+FORMATS = {
+    'tsv': ('\t', 'tab'),
+    'csv': (',', 'comma'),
+}
+
+
+def parse_workers(value):
+    if value == "auto":
+        return value
+    try:
+        workers = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number or 'auto', got '{value}'")
+    if workers < 0:
+        raise argparse.ArgumentTypeError("must not be negative")
+    return workers
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m kind2anki",
+        description="Turn Kindle's vocab.db into an Anki import file without Anki")
+    parser.add_argument("db_path", help="Path of the Kindle's vocab.db")
+    parser.add_argument("-o", "--output", required=True, help="File the cards are written to")
+    parser.add_argument("--format", choices=sorted(FORMATS),
+                        help="Output format (default: from the output file extension, else tsv)")
+    parser.add_argument("--no-headers", action="store_true",
+                        help="Leave out the #separator/#html/#columns lines for Anki")
+    parser.add_argument("-l", "--language", default="en",
+                        help="Language translations are made into (default: en)")
+    parser.add_argument("-d", "--days", type=int, default=5,
+                        help="Import words looked up in the last N days (default: 5)")
+    parser.add_argument("--no-translate", action="store_true", help="Don't translate words")
+    parser.add_argument("--no-dictionary", action="store_true",
+                        help="Don't look words up in the Oxford dictionary")
+    parser.add_argument("--usage", action="store_true", help="Include the Kindle usage sentence")
+    parser.add_argument("--no-lemmas", action="store_true",
+                        help="Look inflected words (\"ran\", \"running\") up as they are, "
+                             "instead of by their headword")
+    parser.add_argument("--inflections", metavar="FILE",
+                        default=default_cache_path("inflections.tsv"),
+                        help="Inflection table of 'lemma form form ...' lines, overriding "
+                             "Kindle's stems (default: the add-on's, if it exists)")
+    parser.add_argument("--dictionary", metavar="FILE",
+                        help="Look words up in a local dictionary dump (.json, .jsonl, "
+                             "StarDict .ifo or .dsl) instead of the Oxford website")
+
+    performance = parser.add_argument_group("performance")
+    performance.add_argument("-j", "--concurrency", type=int, default=8,
+                             help="Words enriched at the same time (default: 8)")
+    performance.add_argument("--executor", choices=["thread", "asyncio", "serial"],
+                             default="thread", help="Enrichment executor (default: thread)")
+    performance.add_argument("--requests-per-second", type=float, default=10,
+                             help="Requests per second per host, 0 for no limit (default: 10)")
+    performance.add_argument("--batch-size", type=int, default=50,
+                             help="Words per translation request (default: 50)")
+    performance.add_argument("--html-parser", choices=["auto", "lxml", "html.parser"],
+                             default="auto", help="Dictionary page parser (default: auto)")
+    performance.add_argument("--parse-workers", type=parse_workers, default=0,
+                             help="Processes dictionary pages are parsed on, a number or "
+                                  "'auto' for one per CPU core (default: 0, parse on the "
+                                  "downloading threads)")
+
+    state = parser.add_argument_group("caches and state")
+    state.add_argument("--cache", default=default_cache_path("kind2anki_cache.db"),
+                       help="Dictionary and translation cache file (default: the add-on's)")
+    state.add_argument("--no-cache", action="store_true", help="Don't use the cache")
+    state.add_argument("--cache-days", type=int, default=30,
+                       help="Days dictionary entries are cached for (default: 30)")
+    state.add_argument("--dictionary-index",
+                       default=default_cache_path("offline_dictionary.db"),
+                       help="Index file built from --dictionary (default: the add-on's)")
+    state.add_argument("--ledger",
+                       help="Import ledger file; words marked as imported before are skipped")
+    state.add_argument("--mark-imported", action="store_true",
+                       help="Record the written words in --ledger as imported; use it once "
+                            "the file is imported into Anki, or the next run skips them")
+    state.add_argument("--journal",
+                       help="Resume journal file, so an interrupted run continues where it stopped")
+    state.add_argument("--media-dir",
+                       help="Download Oxford audio into this folder (e.g. Anki's collection.media)")
+
+    diagnostics = parser.add_argument_group("diagnostics")
+    diagnostics.add_argument("--report", help="Write a JSON timing report to this file")
+    diagnostics.add_argument("--profile", action="store_true",
+                             help="Also save a cProfile capture of the pipeline thread (not "
+                                  "the enrichment and download pools) next to the report")
+    diagnostics.add_argument("-q", "--quiet", action="store_true", help="Don't show progress")
+    return parser
+
+
+def print_progress(event):
+    sys.stderr.write("\r" + event.label().ljust(79))
+    sys.stderr.flush()
+
+
+def write_cards(rows, path, output_format, headers=True):
+    """
+    Write note field lists to a delimited file
+
+    Returns:
+        Number of cards written
+    """
+    delimiter, separator_name = FORMATS[output_format]
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if headers:
+            # File headers understood by Anki's importer (2.1.55+)
+            f.write(f"#separator:{separator_name}\n#html:true\n")
+            f.write("#columns:{}\n".format(delimiter.join(FIELD_NAMES)))
+        writer = csv.writer(f, delimiter=delimiter, lineterminator="\n")
+        for fields in rows:
+            writer.writerow(fields)
+            written += 1
+    return written
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.mark_imported and args.ledger is None:
+        parser.error("--mark-imported needs --ledger")
+    output_format = args.format
+    if output_format is None:
+        extension = os.path.splitext(args.output)[1].lstrip(".").lower()
+        output_format = extension if extension in FORMATS else "tsv"
+    if args.report is None and args.profile:
+        args.report = os.path.splitext(args.output)[0] + "_report.json"
+
+    importer = KindleImporter(
+        args.db_path, args.language,
+        includeUsage=args.usage,
+        doTranslate=not args.no_translate,
+        importDays=args.days,
+        includeDictionary=not args.no_dictionary,
+        cachePath=None if args.no_cache else args.cache,
+        cacheTTLDays=args.cache_days,
+        executor=args.executor,
+        concurrency=args.concurrency,
+        requestsPerSecond=args.requests_per_second or None,
+        htmlParser=args.html_parser,
+        parseWorkers=args.parse_workers,
+        dictionaryPath=args.dictionary,
+        dictionaryIndexPath=args.dictionary_index,
+        resolveLemmas=not args.no_lemmas,
+        inflectionsPath=args.inflections,
+        ledgerPath=args.ledger,
+        translateBatchSize=args.batch_size,
+        journalPath=args.journal,
+        progressCallback=None if args.quiet else print_progress,
+        reportPath=args.report,
+        profile=args.profile,
+        mediaFolder=args.media_dir,
+    )
+
+    with importer.profiling():
+        rows = importer.formatCards(importer.enrichWords(importer.iterWordsFromDB()))
+        written = write_cards(rows, args.output, output_format, headers=not args.no_headers)
+    if not args.quiet:
+        sys.stderr.write("\n")
+
+    importer.printStats()
+    print(f"Wrote {written} cards to {args.output}")
+    if written and args.mark_imported:
+        importer.markImported()
+    importer.writeReport()
+    return 0
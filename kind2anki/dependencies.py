@@ -0,0 +1,99 @@
+# Dependency check for Kind2Anki
+# requests and beautifulsoup4 are installed with pip the first time they are
+# missing. The check runs when the kind2anki dialog is opened (never while
+# Anki starts), looks packages up without importing them, and is remembered
+# in a marker file so later runs skip it.
+
+import importlib.util
+import json
+import os
+import sys
+
+
+# pip package -> importable module
+DEPENDENCIES = {
+    'requests': 'requests',
+    'beautifulsoup4': 'bs4',
+}
+
+# Result of the check in this process
+_checked = False
+
+
+def missing_dependencies():
+    """
+    Returns:
+        List of pip packages whose module cannot be found
+    """
+    return [package for package, module in DEPENDENCIES.items()
+            if importlib.util.find_spec(module) is None]
+
+
+def _marker_contents():
+    # A new Python (e.g. after an Anki update) has its own site-packages
+    return {
+        'python': sys.version.split()[0],
+        'executable': sys.executable,
+        'packages': sorted(DEPENDENCIES),
+    }
+
+
+def _read_marker(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_marker(path):
+    try:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(_marker_contents(), f)
+    except OSError as e:
+        print(f"Could not save dependency check: {e}")
+
+
+def forget_dependency_check(marker_path=None):
+    """Check again next time, e.g. after an import failed with ImportError"""
+    global _checked
+    _checked = False
+    if marker_path and os.path.exists(marker_path):
+        os.remove(marker_path)
+
+
+def ensure_dependencies_installed(marker_path=None):
+    """
+    Ensure required dependencies are installed for enhanced functionality
+
+    Args:
+        marker_path: File remembering a successful check between runs
+
+    Returns:
+        True if all dependencies are available
+    """
+    global _checked
+    if _checked:
+        return True
+    if marker_path and _read_marker(marker_path) == _marker_contents():
+        _checked = True
+        return True
+
+    for package in missing_dependencies():
+        import subprocess
+        try:
+            print(f"Installing {package}...")
+            subprocess.check_call([sys.executable, '-m', 'pip', 'install', package])
+            print(f"Successfully installed {package}")
+        except (OSError, subprocess.CalledProcessError):
+            print(f"Could not install {package} automatically. Please install it manually.")
+            return False
+    importlib.invalidate_caches()
+
+    _checked = True
+    if marker_path:
+        _write_marker(marker_path)
+    return True
@@ -0,0 +1,226 @@
+# Concurrent enrichment engine for Kind2Anki
+# Every word needs a dictionary lookup and a translation, which are network
+# bound. The executors below run the per-word work concurrently while still
+# yielding results in the original word order.
+
+import asyncio
+import collections
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+
+from .cancellation import Cancelled, raise_if_cancelled
+
+# How often a blocked executor checks for cancellation, in seconds
+POLL_INTERVAL = 0.1
+
+
+class RateLimiter:
+    """Limit the number of requests per second sent to each host"""
+
+    def __init__(self, requests_per_second, per_host=None):
+        """
+        Args:
+            requests_per_second: Default rate for every host (None for no limit)
+            per_host: Optional dict of host -> requests per second overrides
+        """
+        self.requests_per_second = requests_per_second
+        self.per_host = per_host or {}
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def _get_rate(self, host):
+        return self.per_host.get(host, self.requests_per_second)
+
+    def _reserve(self, url):
+        """Reserve the next free slot for the URL's host, return seconds to wait"""
+        host = urlparse(url).netloc or url
+        rate = self._get_rate(host)
+        if not rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1.0 / rate
+        return slot - now
+
+    def acquire(self, url, cancel=None):
+        """
+        Block until a request to the URL's host is allowed (raises Cancelled
+        if the optional cancellation token is cancelled while waiting)
+        """
+        delay = self._reserve(url)
+        if delay > 0:
+            if cancel is not None:
+                cancel.sleep(delay)
+            else:
+                time.sleep(delay)
+
+    async def acquire_async(self, url):
+        delay = self._reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Rate limiter shared by all network call sites (None disables limiting)
+_rate_limiter = None
+
+
+def set_rate_limiter(rate_limiter):
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+def throttle(url, cancel=None):
+    """Wait for the shared rate limiter before requesting the URL"""
+    rate_limiter = _rate_limiter
+    if rate_limiter is not None:
+        rate_limiter.acquire(url, cancel)
+
+
+class SerialExecutor:
+    """Process items one after another in the calling thread"""
+
+    def __init__(self, cancel=None):
+        self.cancel = cancel
+
+    def map(self, func, items):
+        for item in items:
+            raise_if_cancelled(self.cancel)
+            yield func(item)
+
+
+class ThreadPoolEnricher:
+    """Process items on a thread pool, yielding results in input order"""
+
+    def __init__(self, concurrency=8, window=None, cancel=None):
+        """
+        Args:
+            concurrency: Number of worker threads
+            window: Maximum items in flight (defaults to twice the concurrency)
+            cancel: Optional CancellationToken; once cancelled, map raises
+                Cancelled without waiting for the items in flight
+        """
+        self.concurrency = max(1, concurrency)
+        self.window = window or 2 * self.concurrency
+        self.cancel = cancel
+
+    def _result(self, future):
+        if self.cancel is None:
+            return future.result()
+        while True:
+            try:
+                return future.result(timeout=POLL_INTERVAL)
+            except FutureTimeoutError:
+                raise_if_cancelled(self.cancel)
+
+    def map(self, func, items):
+        pending = collections.deque()
+        pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                  thread_name_prefix="kind2anki")
+        cancelled = False
+        try:
+            for item in items:
+                raise_if_cancelled(self.cancel)
+                pending.append(pool.submit(func, item))
+                if len(pending) >= self.window:
+                    yield self._result(pending.popleft())
+            while pending:
+                yield self._result(pending.popleft())
+        except Cancelled:
+            cancelled = True
+            raise
+        finally:
+            # Consumer stopped early or an item failed: drop queued work.
+            # A cancelled run doesn't wait for requests still in flight.
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=not cancelled)
+
+
+class AsyncioEnricher:
+    """
+    Process items on an asyncio event loop, yielding results in input order
+
+    Coroutine functions are awaited directly; plain (blocking) functions are
+    run on a thread pool, with at most `concurrency` items in progress.
+    """
+
+    def __init__(self, concurrency=8, window=None, cancel=None):
+        self.concurrency = max(1, concurrency)
+        self.window = window or 2 * self.concurrency
+        self.cancel = cancel
+
+    def map(self, func, items):
+        loop = asyncio.new_event_loop()
+        pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                  thread_name_prefix="kind2anki")
+        is_coroutine = inspect.iscoroutinefunction(func)
+        pending = collections.deque()
+        cancelled = False
+
+        async def make_semaphore():
+            return asyncio.Semaphore(self.concurrency)
+
+        semaphore = loop.run_until_complete(make_semaphore())
+
+        async def run_one(item):
+            async with semaphore:
+                if is_coroutine:
+                    return await func(item)
+                return await loop.run_in_executor(pool, func, item)
+
+        def result(task):
+            if self.cancel is not None:
+                while not task.done():
+                    loop.run_until_complete(asyncio.wait({task}, timeout=POLL_INTERVAL))
+                    raise_if_cancelled(self.cancel)
+            return loop.run_until_complete(task)
+
+        try:
+            for item in items:
+                raise_if_cancelled(self.cancel)
+                pending.append(loop.create_task(run_one(item)))
+                if len(pending) >= self.window:
+                    yield result(pending.popleft())
+            while pending:
+                yield result(pending.popleft())
+        except Cancelled:
+            cancelled = True
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(
+                    asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+            pool.shutdown(wait=not cancelled)
+
+
+EXECUTORS = {
+    'serial': SerialExecutor,
+    'thread': ThreadPoolEnricher,
+    'asyncio': AsyncioEnricher,
+}
+
+
+def create_executor(kind='thread', concurrency=8, cancel=None):
+    """
+    Create an enrichment executor
+
+    Args:
+        kind: 'thread', 'asyncio' or 'serial'
+        concurrency: Maximum number of items processed at the same time
+        cancel: Optional CancellationToken to stop the executor with
+
+    Returns:
+        Executor object with a map(func, items) generator method
+    """
+    if kind not in EXECUTORS:
+        raise ValueError(f"Unknown executor '{kind}', expected one of {sorted(EXECUTORS)}")
+    if kind == 'serial' or concurrency <= 1:
+        return SerialExecutor(cancel=cancel)
+    return EXECUTORS[kind](concurrency=concurrency, cancel=cancel)
@@ -0,0 +1,102 @@
+# Import ledger for Kind2Anki
+# Remembers which Kindle words were already exported to Anki (and what they
+# looked like at the time), so incremental imports only enrich words that
+# are new or whose lookup changed since the last successful run.
+
+import hashlib
+import os
+import sqlite3
+import time
+
+
+def content_hash(*fields):
+    """Hash the card-relevant content of a vocab.db row"""
+    joined = "\x1f".join("" if field is None else str(field) for field in fields)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+class ImportLedger:
+    """SQLite file mapping Kindle word ids to the last exported content"""
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS ledger (
+                word_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                lookup_timestamp INTEGER,
+                processed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                db_path TEXT PRIMARY KEY,
+                watermark INTEGER NOT NULL,
+                finished_at REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def get_watermark(self, db_path):
+        """
+        Get the newest lookup timestamp exported from this vocab.db by the
+        last successful run, or None if it was never imported
+        """
+        row = self._conn.execute(
+            "SELECT watermark FROM runs WHERE db_path = ?",
+            (os.path.abspath(db_path),)).fetchone()
+        return row[0] if row else None
+
+    def get_hashes(self, word_keys):
+        """Get the stored content hash for each of the given word ids"""
+        hashes = {}
+        word_keys = list(word_keys)
+        # Stay below SQLite's limit on query parameters
+        for i in range(0, len(word_keys), 500):
+            chunk = word_keys[i:i + 500]
+            rows = self._conn.execute(
+                "SELECT word_key, content_hash FROM ledger WHERE word_key IN ({})".format(
+                    ",".join("?" * len(chunk))), chunk)
+            hashes.update(rows)
+        return hashes
+
+    def is_current(self, word_key, hash_value):
+        row = self._conn.execute(
+            "SELECT content_hash FROM ledger WHERE word_key = ?", (word_key,)).fetchone()
+        return row is not None and row[0] == hash_value
+
+    def record_run(self, db_path, entries, advance_watermark=True):
+        """
+        Record a successful import in one transaction
+
+        Args:
+            db_path: Path of the imported vocab.db
+            entries: Iterable of (word_key, content_hash, lookup_timestamp)
+            advance_watermark: False for a partial import, where words older
+                than the imported ones may still be missing
+        """
+        now = time.time()
+        entries = list(entries)
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO ledger (word_key, content_hash, lookup_timestamp, processed_at) "
+                "VALUES (?, ?, ?, ?)",
+                ((word_key, hash_value, timestamp, now) for word_key, hash_value, timestamp in entries))
+
+            if not advance_watermark:
+                return
+            timestamps = [timestamp for _, _, timestamp in entries if timestamp is not None]
+            previous = self.get_watermark(db_path)
+            watermark = max(timestamps + ([previous] if previous is not None else []), default=None)
+            if watermark is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO runs (db_path, watermark, finished_at) VALUES (?, ?, ?)",
+                    (os.path.abspath(db_path), watermark, now))
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM ledger").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
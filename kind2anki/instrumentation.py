@@ -0,0 +1,147 @@
+# Opt-in timing instrumentation for Kind2Anki
+# Pipeline steps (vocab.db reads, Oxford fetches and parsing, translations,
+# audio downloads, card formatting and the Anki import) are wrapped in
+# timed() blocks. Nothing is measured unless a Recorder is enabled; the
+# recorder aggregates the timings into percentiles and writes a JSON report,
+# optionally with a cProfile capture of the import thread. Network steps
+# exclude the wait for the rate limiter, which is its own step
+# ('throttle.wait'). The cProfile capture covers the thread running the
+# pipeline only: the lookups, parsing and downloads on the enrichment and
+# audio pools show up in it as waits, their time is in the steps.
+
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Collects the durations of timed() blocks, per step name"""
+
+    def __init__(self, profile=False):
+        """
+        Args:
+            profile: Also capture a cProfile of the thread calling profiling()
+        """
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._profiler = None
+        self.started = time.time()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples.setdefault(name, []).append(seconds)
+
+    @contextlib.contextmanager
+    def profiling(self):
+        """Profile the calling thread (if enabled) for the duration of the block"""
+        if not self.profile or self._profiler is not None:
+            yield
+            return
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        try:
+            yield
+        finally:
+            self._profiler.disable()
+
+    def summary(self):
+        """
+        Returns:
+            Dictionary of step name -> count, total, mean, p50, p90, p99 and
+            max, in seconds
+        """
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+        summary = {}
+        for name, values in sorted(samples.items()):
+            total = sum(values)
+            summary[name] = {
+                'count': len(values),
+                'total': total,
+                'mean': total / len(values),
+                'p50': percentile(values, 0.50),
+                'p90': percentile(values, 0.90),
+                'p99': percentile(values, 0.99),
+                'max': values[-1],
+            }
+        return summary
+
+    def write_report(self, path, extra=None):
+        """
+        Write the summary as JSON (and the cProfile data next to it, as a
+        .prof file readable with pstats or snakeviz)
+
+        Args:
+            path: Report file
+            extra: Optional dictionary of additional top-level report fields
+
+        Returns:
+            Path of the report
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        report = {
+            'started': self.started,
+            'finished': time.time(),
+            'steps': self.summary(),
+        }
+        if extra:
+            report.update(extra)
+        if self._profiler is not None:
+            profile_path = os.path.splitext(path)[0] + '.prof'
+            self._profiler.dump_stats(profile_path)
+            report['profile'] = profile_path
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return path
+
+
+# Recorder of the running import (None disables instrumentation)
+_recorder = None
+_NOT_TIMED = contextlib.nullcontext()
+
+
+def set_recorder(recorder):
+    global _recorder
+    _recorder = recorder
+
+
+def get_recorder():
+    return _recorder
+
+
+class _Timer:
+    __slots__ = ('recorder', 'name', 'start')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def timed(name):
+    """Context manager timing a pipeline step (free when not recording)"""
+    recorder = _recorder
+    if recorder is None:
+        return _NOT_TIMED
+    return _Timer(recorder, name)
@@ -0,0 +1,111 @@
+# Enrichment journal for Kind2Anki
+# Every enriched card is appended to a JSON lines file as soon as it is
+# ready, so an import that crashes or loses its connection can be restarted
+# without looking up the finished words again. The journal is removed once
+# the cards were imported successfully.
+
+import json
+import os
+import threading
+
+from .import_ledger import content_hash
+
+
+def record_hash(record):
+    """Hash the parts of a word record a card is built from"""
+    return content_hash(record["word"], record["lang"], record["sentence"], record["book_name"])
+
+
+class EnrichmentJournal:
+    """
+    JSON lines file of finished cards, keyed by Kindle word id
+
+    The first line stores the import settings; a journal written with other
+    settings (e.g. another target language) is discarded instead of resumed.
+    """
+
+    def __init__(self, path, settings=None):
+        """
+        Args:
+            path: Journal file
+            settings: JSON serializable dict of the settings cards depend on
+        """
+        self.path = path
+        self.settings = settings or {}
+        self.resumed = 0
+        self._cards = {}
+        self._file = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = iter(f)
+            try:
+                header = json.loads(next(lines))
+            except (StopIteration, ValueError):
+                return
+            if header.get("settings") != self.settings:
+                return
+            for line in lines:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line of an interrupted write
+                    continue
+                self._cards[entry["key"]] = (entry["hash"], entry["card"])
+
+    def __len__(self):
+        return len(self._cards)
+
+    def get(self, record):
+        """
+        Get the finished card for a word record
+
+        Returns:
+            Card data dictionary, or None if the word has to be enriched
+        """
+        entry = self._cards.get(record["word_key"])
+        if entry is None or entry[0] != record_hash(record):
+            return None
+        return entry[1]
+
+    def _open(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # Rewrite the file, keeping the entries that are still valid
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write(json.dumps({"settings": self.settings}) + "\n")
+        for key, (hash_value, card) in self._cards.items():
+            self._write(key, hash_value, card)
+        self._file.flush()
+
+    def _write(self, key, hash_value, card):
+        self._file.write(json.dumps(
+            {"key": key, "hash": hash_value, "card": card}, ensure_ascii=False) + "\n")
+
+    def add(self, record, card):
+        """Append a finished card and flush it to disk (thread safe)"""
+        hash_value = record_hash(record)
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._cards[record["word_key"]] = (hash_value, card)
+            self._write(record["word_key"], hash_value, card)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def clear(self):
+        """Remove the journal after a successful import"""
+        self.close()
+        self._cards = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -7,7 +7,7 @@ from aqt.qt import *
 class Ui_kind2ankiDialog(object):
     def setupUi(self, kind2ankiDialog):
         kind2ankiDialog.setObjectName("kind2ankiDialog")
-        kind2ankiDialog.resize(376, 220)  # Increased height for new checkbox
+        kind2ankiDialog.resize(376, 240)  # Increased height for new checkboxes
         self.vboxlayout = QVBoxLayout(kind2ankiDialog)
         self.vboxlayout.setObjectName("vboxlayout")
         self.groupBox = QGroupBox(kind2ankiDialog)
@@ -93,6 +93,18 @@ class Ui_kind2ankiDialog(object):
         self.includeDictionary.setObjectName("includeDictionary")
         self.gridLayout.addWidget(self.includeDictionary, 3, 0, 1, 3)
         
+        # Skip words that an earlier import already exported
+        self.incrementalImport = QCheckBox(self.groupBox)
+        self.incrementalImport.setChecked(True)
+        self.incrementalImport.setObjectName("incrementalImport")
+        self.gridLayout.addWidget(self.incrementalImport, 4, 0, 1, 3)
+        
+        # Look words up in a local dictionary file instead of online
+        self.offlineDictionary = QCheckBox(self.groupBox)
+        self.offlineDictionary.setChecked(False)
+        self.offlineDictionary.setObjectName("offlineDictionary")
+        self.gridLayout.addWidget(self.offlineDictionary, 5, 0, 1, 3)
+        
         self.toplayout.addLayout(self.gridLayout)
         self.vboxlayout.addWidget(self.groupBox)
         
@@ -130,6 +142,9 @@ class Ui_kind2ankiDialog(object):
         self.languageSelect.setItemText(6, _translate("kind2ankiDialog", "hi"))
         self.doTranslate.setText(_translate("kind2ankiDialog", "Translate"))
         self.includeDictionary.setText(_translate("kind2ankiDialog", "Include dictionary definition"))
+        self.incrementalImport.setText(_translate("kind2ankiDialog", "Skip words already imported"))
+        self.incrementalImport.setToolTip(_translate("kind2ankiDialog", "Only import words looked up since the last import; the number of days is then only used for the first import"))
+        self.offlineDictionary.setText(_translate("kind2ankiDialog", "Use offline dictionary file"))
 
 if __name__ == "__main__":
     import sys
@@ -1,4 +1,6 @@
 # coding=utf-8
+import collections
+import contextlib
 import sqlite3
 import sys
 import os
@@ -10,16 +12,23 @@ import datetime
 import time
 from urllib.parse import quote, urlencode
 
-try:
-    import requests
-except ImportError:
-    pass  # We've already tried to install it above
-
-from aqt import mw
-from functools import partial
-
-from .translate import translate
-from .oxford_dictionary import lookup_oxford_dictionary, download_audio_file
+from .translate import translate, translate_batch, TranslationCache
+from . import translate as translate_module
+from .oxford_dictionary import (lookup_oxford_dictionary, download_audio_file, set_cache, get_cache,
+                                set_parser, set_parse_pool, set_dictionary, get_dictionary)
+from .offline_dictionary import load_dictionary
+from .lemmas import LemmaResolver, LookupGroup, load_inflections
+from .parse_pool import ParsePool, resolve_workers
+from .cache import PersistentCache, default_cache_path, normalize_key
+from .import_ledger import ImportLedger, content_hash
+from .enrichment import RateLimiter, create_executor, set_rate_limiter
+from .audio import AudioDownloader
+from .note_importer import IGNORE_MODE, first_field_key
+from .journal import EnrichmentJournal
+from .progress import ProgressReporter
+from .cancellation import Cancelled, raise_if_cancelled
+from .instrumentation import Recorder, get_recorder, set_recorder, timed
+from . import transport
 
 
 def get_audio_url(word, reading=""):
@@ -62,6 +71,24 @@ def get_frequency_data(word):
     return ""
 
 
+def create_fill_in_blank(sentence, target_word):
+    """Create fill-in-the-blank by replacing target word with _____"""
+    if not sentence:
+        return sentence
+        
+    word_lower = target_word.lower()
+    words_in_sentence = sentence.split()
+    
+    for i, sentence_word in enumerate(words_in_sentence):
+        clean_word = sentence_word.strip('.,!?;:"()[]').lower()
+        if clean_word == word_lower or clean_word.startswith(word_lower):
+            punctuation = ''.join(c for c in sentence_word if not c.isalnum())
+            words_in_sentence[i] = "<b><i>_____</i></b>" + punctuation
+            break
+            
+    return " ".join(words_in_sentence)
+
+
 def translateWord(word, target_language):
     return str(translate(word, to_lang=target_language))
     
@@ -78,39 +105,61 @@ def lookupDictionary(word):
     try:
         # Use Oxford Dictionary for better definitions (request more examples)
         oxford_result = lookup_oxford_dictionary(word, max_definitions=3, max_examples_per_def=5)
-        
-        if oxford_result:
-            # Format the Oxford result
-            formatted_def = []
-            
-            # Add word type if available
-            if oxford_result['word_type']:
-                formatted_def.append(f"<i>({oxford_result['word_type']})</i>")
-            
-            # Add definitions
-            if oxford_result['definitions']:
-                for i, definition in enumerate(oxford_result['definitions'][:3], 1):
-                    formatted_def.append(f"<b>{i}.</b> {definition}")
-            
-            # Add examples if available
-            if oxford_result['examples']:
-                formatted_def.append("<br><b>Examples:</b>")
-                for example in oxford_result['examples'][:3]:
-                    formatted_def.append(f"• {example}")
-            
-            return "<br>".join(formatted_def)
-        else:
-            # Fallback to basic definition
-            return f"<i>Definition not available for '{word}'</i>"
+        return formatDictionaryDefinition(word, oxford_result)
             
     except Exception as e:
         print(f"Dictionary lookup error for '{word}': {e}")
         return f"<i>Dictionary lookup failed for '{word}'</i>"
 
 
+def formatDictionaryDefinition(word, oxford_result):
+    """
+    Format an Oxford lookup result as the dictionary definition HTML
+    
+    Args:
+        word: The word that was looked up
+        oxford_result: Result of lookup_oxford_dictionary (may be None)
+        
+    Returns:
+        Formatted definition string
+    """
+    if not oxford_result:
+        # Fallback to basic definition
+        return f"<i>Definition not available for '{word}'</i>"
+    
+    # Format the Oxford result
+    formatted_def = []
+    
+    # Add word type if available
+    if oxford_result['word_type']:
+        formatted_def.append(f"<i>({oxford_result['word_type']})</i>")
+    
+    # Add definitions
+    if oxford_result['definitions']:
+        for i, definition in enumerate(oxford_result['definitions'][:3], 1):
+            formatted_def.append(f"<b>{i}.</b> {definition}")
+    
+    # Add examples if available
+    if oxford_result['examples']:
+        formatted_def.append("<br><b>Examples:</b>")
+        for example in oxford_result['examples'][:3]:
+            formatted_def.append(f"• {example}")
+    
+    return "<br>".join(formatted_def)
+
+
 class KindleImporter():
     def __init__(self, db_path, target_language, includeUsage=False,
-                 doTranslate=True, importDays=5, includeDictionary=True):
+                 doTranslate=True, importDays=5, includeDictionary=True,
+                 cachePath=None, cacheTTLDays=30, cacheMaxEntries=50000,
+                 executor="thread", concurrency=8, requestsPerSecond=10,
+                 htmlParser="auto", ledgerPath=None, translateBatchSize=50,
+                 translationMemoryEntries=10000, mediaIndexPath=None,
+                 existingWords=None, importMode=IGNORE_MODE, journalPath=None,
+                 progressCallback=None, cancelToken=None, reportPath=None,
+                 profile=False, mediaFolder=None, parseWorkers=0,
+                 dictionaryPath=None, dictionaryIndexPath=None, resolveLemmas=True,
+                 inflectionsPath=None):
         self.db_path = db_path
         self.target_language = target_language
         self.includeUsage = includeUsage
@@ -118,6 +167,93 @@ class KindleImporter():
         self.includeDictionary = includeDictionary
         self.timestamp = self.createTimestamp(importDays) * 1000
 
+        # With a ledger, only words that are new or changed since the last
+        # successful import are enriched (importDays is used for the first run)
+        self.ledger = ImportLedger(ledgerPath) if ledgerPath else None
+        self.ledger_entries = {}
+
+        # Words whose notes are already in the collection (normalized first
+        # fields, see note_importer.load_first_fields). With importMode
+        # IGNORE_MODE they are dropped before any network request is made;
+        # otherwise they are enriched and marked as existing.
+        self.existingWords = existingWords
+        self.importMode = importMode
+        self.duplicate_words = 0
+
+        # Finished cards are journaled so an interrupted import resumes where
+        # it stopped; cards made with other settings are not reused
+        self.journal = None
+        if journalPath:
+            self.journal = EnrichmentJournal(journalPath, settings={
+                "target_language": target_language,
+                "includeUsage": includeUsage,
+                "doTranslate": doTranslate,
+                "includeDictionary": includeDictionary,
+                "resolveLemmas": resolveLemmas,
+            })
+
+        # Keep dictionary lookups and translations between runs if a cache file is given
+        if cachePath:
+            set_cache(PersistentCache(
+                cachePath, namespace="oxford",
+                ttl=cacheTTLDays * 24 * 3600, max_entries=cacheMaxEntries))
+            translate_module.set_cache(TranslationCache(
+                cachePath, memory_entries=translationMemoryEntries))
+
+        # Look words up in a local dictionary dump instead of the website; it
+        # is indexed into dictionaryIndexPath the first time it is used
+        set_dictionary(None)
+        self.dictionaryPath = dictionaryPath
+        if dictionaryPath and includeDictionary:
+            set_dictionary(load_dictionary(
+                dictionaryPath, dictionaryIndexPath or default_cache_path("offline_dictionary.db")))
+
+        # Inflected words ("ran", "running") are looked up by their lemma
+        # (Kindle's stem, or the inflection tables), and each lemma only once
+        # per import however many of its forms were looked up on the Kindle.
+        # Forms with an entry of their own ("building") are kept as they are
+        self.lemmas = None
+        if resolveLemmas:
+            dictionary = get_dictionary()
+            self.lemmas = LemmaResolver(
+                load_inflections(inflectionsPath),
+                is_headword=dictionary.__contains__ if dictionary is not None else None)
+        self.dictionaryLookups = LookupGroup()
+
+        set_parser(htmlParser)
+        # Worker processes dictionary pages are parsed on while the enrichment
+        # threads keep downloading (0 parses on the downloading threads)
+        self.parseWorkers = resolve_workers(parseWorkers)
+
+        # Words are enriched concurrently; requests to each host are rate limited
+        self.executor = executor
+        self.concurrency = concurrency
+        self.translateBatchSize = translateBatchSize
+        set_rate_limiter(RateLimiter(requestsPerSecond) if requestsPerSecond else None)
+        # Keep one pooled connection per worker for each host
+        transport.configure(pool_maxsize=max(10, concurrency))
+
+        # Cancelling the token stops the import between steps; requests not
+        # sent yet fail with Cancelled and running ones aren't waited for
+        self.cancelToken = cancelToken
+        self.cancelled = False
+        self.exported_keys = set()
+        transport.set_cancel_token(cancelToken)
+
+        # Opt-in instrumentation: time every pipeline step (and optionally
+        # profile the import thread), see writeReport
+        self.reportPath = reportPath
+        set_recorder(Recorder(profile=profile) if reportPath else None)
+        # Structured progress events (see progress.ProgressEvent) for the UI
+        self.progress = ProgressReporter(progressCallback, cache_hits=self.cacheHits)
+        self.words_total = None
+
+        # Audio files are downloaded in the background while cards are written;
+        # the media index remembers which URLs are already in the media folder
+        self.mediaIndexPath = mediaIndexPath
+        self.mediaFolder = mediaFolder
+        self.audioDownloader = None
+
     def createTimestamp(self, days):
         d = (datetime.date.today() - datetime.timedelta(days=days))
         return int(time.mktime(d.timetuple()))
@@ -125,274 +261,673 @@ class KindleImporter():
     def translateWordsFromDB(self):
         self.getWordsFromDB()
         self.translated = self.translateWords()
+        self.printStats()
+
+    def cacheHits(self):
+        """Number of dictionary lookups and translations answered from the caches"""
+        hits = 0
+        for cache in (get_cache(), translate_module.get_cache()):
+            if cache is not None:
+                stats = cache.stats()
+                hits += stats["hits"] + stats["negative_hits"]
+        return hits
+
+    def enrichTotal(self):
+        """Number of words to enrich, as far as known while reading"""
+        if self.words_total is None:
+            return None
+        return max(0, self.words_total - self.skipped_words - self.duplicate_words)
+
+    def printStats(self):
+        lookups = self.dictionaryLookups
+        if lookups.lookups:
+            print(f"Dictionary lookups: {lookups.lookups} entries looked up, "
+                  f"{lookups.shared} words shared an entry (e.g. forms of the same lemma)")
+        dictionary = get_dictionary()
+        if dictionary is not None:
+            print("Offline dictionary: {hits} found, {misses} not found".format(**dictionary.stats()))
+        cache = get_cache()
+        if cache is not None:
+            stats = cache.stats()
+            print("Dictionary cache: {hits} hits, {negative_hits} cached misses, "
+                  "{misses} downloaded".format(**stats))
+        translation_cache = translate_module.get_cache()
+        if translation_cache is not None:
+            stats = translation_cache.stats()
+            print("Translation cache: {hits} hits ({memory_hits} from memory), "
+                  "{negative_hits} cached misses, {misses} translated".format(**stats))
+        if self.audioDownloader is not None:
+            stats = self.audioDownloader.stats()
+            print("Audio: {downloaded} downloaded ({kib:.0f} KiB in {seconds:.1f}s, "
+                  "{rate:.0f} KiB/s), {existing} reused, {failed} failed".format(
+                      kib=stats["bytes"] / 1024, rate=stats["bytes_per_second"] / 1024, **stats))
+            for url, error in self.audioDownloader.errors.items():
+                print(f"Error downloading audio {url}: {error}")
+        print("HTTP: {requests} requests over {connections} connections "
+              "({reused} reused)".format(**transport.stats.as_dict()))
 
     def fetchWordsFromDBWithoutTranslation(self):
         self.getWordsFromDB()
         self.translated = len(self.words) * ['']
 
-    def getWordsFromDB(self):
+    # One set-based pass over the vocabulary: every word in the import window,
+    # joined with its first lookup (lowest rowid, i.e. the order Kindle stored
+    # them in) and the title of the book that lookup came from. last_seen is
+    # the newest time the word was looked up, used by incremental imports.
+    WORDS_QUERY = """
+        SELECT w.word, w.stem, w.id, w.lang, l.usage, b.title,
+               max(w.timestamp, COALESCE(f.last_lookup, 0)) AS last_seen
+        FROM WORDS AS w
+        LEFT JOIN (
+            SELECT word_key, MIN(rowid) AS first_lookup, MAX(timestamp) AS last_lookup
+            FROM LOOKUPS
+            GROUP BY word_key
+        ) AS f ON f.word_key = w.id
+        LEFT JOIN LOOKUPS AS l ON l.rowid = f.first_lookup
+        LEFT JOIN BOOK_INFO AS b ON b.id = l.book_key
+        WHERE {condition}
+    """
+
+    def iterWordsFromDB(self):
+        """
+        Read stage: yield one record per word in the import window, streamed
+        from the database cursor in batches
+
+        Yields:
+            Dictionary with the word, its Kindle id and the data stored for it
+        """
+        self.ledger_entries = {}
+        self.skipped_words = 0
+        self.duplicate_words = 0
+        existingWords = self.existingWords
         conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        # Get words and their IDs with timestamp filter
-        c.execute("SELECT word, id, lang FROM words WHERE timestamp > ?",
-                  (str(self.timestamp),))
-        words_and_ids = c.fetchall()
+        try:
+            c = conn.cursor()
+            watermark = self.ledger.get_watermark(self.db_path) if self.ledger is not None else None
+            if watermark is not None:
+                # Incremental run: only words looked up since the last successful
+                # import, however long ago it was (importDays is for the first run)
+                query = self.WORDS_QUERY.format(
+                    condition="max(w.timestamp, COALESCE(f.last_lookup, 0)) > ?")
+                params = (watermark,)
+            else:
+                query = self.WORDS_QUERY.format(condition="w.timestamp > ?")
+                params = (str(self.timestamp),)
+
+            # Counting first gives the progress bar its total
+            with timed('db.read'):
+                self.words_total = c.execute(
+                    "SELECT COUNT(*) FROM ({})".format(query), params).fetchone()[0]
+                c.execute(query, params)
+            self.progress.update('read', 0, self.words_total, force=True)
+
+            rows_read = 0
+            while True:
+                with timed('db.read'):
+                    rows = c.fetchmany(500)
+                if not rows:
+                    break
+                rows_read += len(rows)
+                self.progress.update('read', rows_read, self.words_total, force=True)
+                raise_if_cancelled(self.cancelToken)
+                if self.ledger is not None:
+                    known_hashes = self.ledger.get_hashes(row[2] for row in rows)
+
+                for word, stem, word_key, lang, usage, book_title, last_seen in rows:
+                    existing = bool(existingWords) and first_field_key(word) in existingWords
+                    if existing and self.importMode == IGNORE_MODE:
+                        # Would be skipped by the import anyway
+                        self.duplicate_words += 1
+                        continue
+
+                    if self.ledger is not None:
+                        hash_value = content_hash(word, lang, usage, book_title)
+                        if known_hashes.get(word_key) == hash_value:
+                            # Already exported with the same content
+                            self.skipped_words += 1
+                            continue
+                        self.ledger_entries[word_key] = (hash_value, last_seen)
+
+                    # Kindle doesn't store readings (not even for Japanese words),
+                    # so this stays empty until a proper dictionary is plugged in
+                    reading = ""
+                    yield {
+                        "word": word,
+                        "stem": stem or "",
+                        "word_key": word_key,
+                        "lang": lang if lang else "en",  # Default to English if no language
+                        "reading": reading,
+                        "sentence": usage if usage is not None else "",
+                        "book_name": book_title if book_title else "Unknown Book",
+                        "frequency": get_frequency_data(word),
+                        "audio_url": get_audio_url(word, reading),
+                        "existing": existing,
+                    }
+        finally:
+            conn.close()
+
+        if self.ledger is not None:
+            print(f"Import ledger: {len(self.ledger_entries)} new or changed words, "
+                  f"{self.skipped_words} already imported")
+        if self.duplicate_words:
+            print(f"Skipped {self.duplicate_words} words already in the collection")
+
+    def getWordsFromDB(self):
         self.words = []
         self.word_keys = []
+        self.stems = {}
         self.langs = {}
-        
-        # Filter out words that aren't in the target language 
-        # (assuming Kindle stores language info, if not, we'll store all words)
-        for word, word_id, lang in words_and_ids:
-            self.words.append(word)
-            self.word_keys.append(word_id)
-            self.langs[word_id] = lang if lang else "en"  # Default to English if no language
-        
-        # Get additional information from the database
         self.readings = {}
         self.sentences = {}
         self.book_names = {}
         self.frequencies = {}
         self.audio_urls = {}
-        
-        # Get usage sentences and book information
-        for i, word_key in enumerate(self.word_keys):
-            word = self.words[i]
-            
-            # Getting sentences/usages
-            c.execute("SELECT usage, book_key FROM LOOKUPS WHERE word_key = ?", [word_key])
-            usages_and_books = c.fetchall()
-            
-            if usages_and_books:
-                self.sentences[word_key] = usages_and_books[0][0]  # Get the first usage example
-                
-                # Get book name if available
-                book_key = usages_and_books[0][1]
-                if book_key:
-                    c.execute("SELECT title FROM BOOK_INFO WHERE id = ?", [book_key])
-                    book_result = c.fetchone()
-                    if book_result:
-                        self.book_names[word_key] = book_result[0]
-                    else:
-                        self.book_names[word_key] = "Unknown Book"
-                else:
-                    self.book_names[word_key] = "Unknown Book"
-            else:
-                self.sentences[word_key] = ""
-                self.book_names[word_key] = "Unknown Book"
-            
-            # Try to detect Japanese words and extract readings
-            # This is very basic - in a real implementation you'd use a Japanese dictionary
-            if self.langs[word_key] == "ja" or any(ord(c) > 0x3000 for c in word):
-                # For Japanese, we could try to get the reading from a dictionary
-                # For now, we'll just leave it empty as Kindle doesn't store this
-                self.readings[word_key] = ""
-            else:
-                # For non-Japanese words, reading is not applicable
-                self.readings[word_key] = ""
-            
-            # Get frequency data
-            self.frequencies[word_key] = get_frequency_data(word)
-            
-            # Generate audio URL
-            self.audio_urls[word_key] = get_audio_url(word, self.readings[word_key])
-            
-        conn.close()
+        self.existing_keys = set()
 
-    def translateWords(self):
-        translated_data = []
-        translate_func = partial(
-            translateWord, target_language=self.target_language)
-            
+        for record in self.iterWordsFromDB():
+            word_key = record["word_key"]
+            self.words.append(record["word"])
+            self.word_keys.append(word_key)
+            self.stems[word_key] = record["stem"]
+            self.langs[word_key] = record["lang"]
+            self.readings[word_key] = record["reading"]
+            self.sentences[word_key] = record["sentence"]
+            self.book_names[word_key] = record["book_name"]
+            self.frequencies[word_key] = record["frequency"]
+            self.audio_urls[word_key] = record["audio_url"]
+            if record["existing"]:
+                self.existing_keys.add(word_key)
+
+    def iterRecords(self):
+        """Yield the records of the words loaded by getWordsFromDB"""
         for word, word_key in zip(self.words, self.word_keys):
-            # Initialize card components
-            card_data = {
+            yield {
                 "word": word,
+                "stem": self.stems.get(word_key, ""),
+                "word_key": word_key,
+                "lang": self.langs.get(word_key, "en"),
                 "reading": self.readings.get(word_key, ""),
-                "translated_definition": "",
-                "dictionary_definition": "",
-                "oxford_data": None,  # Store Oxford data for enhanced processing
                 "sentence": self.sentences.get(word_key, ""),
-                "frequency": self.frequencies.get(word_key, ""),
                 "book_name": self.book_names.get(word_key, "Unknown Book"),
-                "audio_url": self.audio_urls.get(word_key, "")
+                "frequency": self.frequencies.get(word_key, ""),
+                "audio_url": self.audio_urls.get(word_key, ""),
+                "existing": word_key in self.existing_keys,
             }
-            
-            # Add dictionary lookup if enabled (do this first to get Oxford data)
-            if self.includeDictionary:
-                try:
-                    # For languages other than English, we'd need a different API
-                    # Here we assume English for the dictionary API
-                    if self.langs.get(word_key, "en") == "en":
-                        # Get Oxford data for enhanced processing (request more examples)
-                        oxford_result = lookup_oxford_dictionary(word, max_definitions=3, max_examples_per_def=5)
-                        if oxford_result:
-                            card_data["oxford_data"] = oxford_result
-                            card_data["dictionary_definition"] = lookupDictionary(word)
-                        else:
-                            card_data["dictionary_definition"] = ""
+
+    def markImported(self):
+        """
+        Record the words of this run in the import ledger. Call this only
+        after the cards were imported into Anki successfully.
+        """
+        entries = self.ledger_entries
+        if self.cancelled:
+            # Partial import: only the exported words are done, and the
+            # journal still helps the next run with the rest
+            entries = {word_key: entry for word_key, entry in entries.items()
+                       if word_key in self.exported_keys}
+        elif self.journal is not None:
+            self.journal.clear()
+        if self.ledger is None:
+            return
+        self.ledger.record_run(
+            self.db_path,
+            ((word_key, hash_value, last_seen)
+             for word_key, (hash_value, last_seen) in entries.items()),
+            advance_watermark=not self.cancelled)
+
+    def translateWords(self):
+        return list(self.enrichWords(self.iterRecords()))
+
+    def enrichWords(self, records):
+        """Enrich stage: yield card data for each record, in input order"""
+        if self.journal is not None:
+            records = self.resumeFromJournal(records)
+        if self.doTranslate and self.translateBatchSize > 1:
+            records = self.translateInBatches(records)
+        executor = create_executor(self.executor, self.concurrency, cancel=self.cancelToken)
+        pool = None
+        if self.parseWorkers and self.includeDictionary and get_dictionary() is None:
+            pool = ParsePool(self.parseWorkers)
+            set_parse_pool(pool)
+        try:
+            yield from executor.map(self.enrichWord, records)
+        finally:
+            if pool is not None:
+                set_parse_pool(None)
+                pool.close()
+
+    def resumeFromJournal(self, records):
+        """Attach the journaled card (if any) to each record as record["journaled"]"""
+        self.journal.resumed = 0
+        for record in records:
+            record["journaled"] = self.journal.get(record)
+            if record["journaled"] is not None:
+                self.journal.resumed += 1
+            yield record
+        if self.journal.resumed:
+            print(f"Resumed {self.journal.resumed} words from the journal of an interrupted import")
+
+    def translateInBatches(self, records):
+        """
+        Translate records in groups of translateBatchSize words per request,
+        storing the result in record["translation"] (None if it failed)
+        """
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.translateBatchSize:
+                yield from self._translateBatch(batch)
+                batch = []
+        if batch:
+            yield from self._translateBatch(batch)
+
+    def _translateBatch(self, batch):
+        pending = [record for record in batch if record.get("journaled") is None]
+        translations = translate_batch(
+            [record["word"] for record in pending], to_lang=self.target_language,
+            max_items=self.translateBatchSize)
+        for record, translation in zip(pending, translations):
+            record["translation"] = translation
+        return batch
+
+    def enrichWord(self, record):
+        """
+        Build the card data for one word (dictionary lookup, examples and
+        translation). Safe to call from several threads at once.
+
+        Args:
+            record: Word record from iterWordsFromDB
+
+        Returns:
+            Dictionary with the card components
+        """
+        if record.get("journaled") is not None:
+            return record["journaled"]
+
+        word = record["word"]
+        lang = record["lang"]
+
+        # Initialize card components
+        card_data = {
+            "word": word,
+            "word_key": record["word_key"],
+            "reading": record["reading"],
+            "translated_definition": "",
+            "dictionary_definition": "",
+            "oxford_data": None,  # Store Oxford data for enhanced processing
+            "sentence": record["sentence"],
+            "frequency": record["frequency"],
+            "book_name": record["book_name"],
+            "audio_url": record["audio_url"],
+            # Note for this word is already in the collection (will be updated)
+            "existing": record.get("existing", False),
+        }
+
+        # Add dictionary lookup if enabled (do this first to get Oxford data)
+        if self.includeDictionary:
+            try:
+                # For languages other than English, we'd need a different API
+                # Here we assume English for the dictionary API
+                if lang == "en":
+                    # Fetch the Oxford entry once; every dictionary-based field
+                    # (definition, examples, pronunciation, audio) is derived from it
+                    lemma = self.lemmaOf(record)
+                    card_data["lemma"] = lemma
+                    oxford_result = self.lookupWord(lemma)
+                    if oxford_result is None and lemma != word:
+                        oxford_result = self.lookupWord(word)
+                    elif oxford_result and normalize_key(lemma) != normalize_key(word):
+                        # The lemma's pronunciation and audio are not the word's
+                        oxford_result = dict(oxford_result, pronunciation='', audio_url='')
+                    if oxford_result:
+                        card_data["oxford_data"] = oxford_result
+                        card_data["dictionary_definition"] = formatDictionaryDefinition(word, oxford_result)
                     else:
-                        # For non-English words, try to get a translation first then lookup
-                        try:
-                            eng_word = translate(word, from_lang=self.langs.get(word_key, "en"), to_lang="en")
-                            card_data["dictionary_definition"] = lookupDictionary(eng_word)
-                        except:
-                            card_data["dictionary_definition"] = ""
-                except Exception:
-                    card_data["dictionary_definition"] = ""
-            
-            # Enhanced example handling - include BOTH Oxford and Kindle examples
-            oxford_result = card_data.get("oxford_data")
-            combined_examples = []
-            
-            # Helper function to create fill-in-the-blank
-            def create_fill_in_blank(sentence, target_word):
-                """Create fill-in-the-blank by replacing target word with _____"""
-                if not sentence:
-                    return sentence
-                    
-                word_lower = target_word.lower()
-                words_in_sentence = sentence.split()
-                
-                for i, sentence_word in enumerate(words_in_sentence):
-                    clean_word = sentence_word.strip('.,!?;:"()[]').lower()
-                    if clean_word == word_lower or clean_word.startswith(word_lower):
-                        punctuation = ''.join(c for c in sentence_word if not c.isalnum())
-                        words_in_sentence[i] = "<b><i>_____</i></b>" + punctuation
-                        break
-                        
-                return " ".join(words_in_sentence)
-            
-            # Collect Oxford examples if available (4-5 examples with fill-in-the-blank)
-            oxford_examples = []
-            if oxford_result and oxford_result.get('examples'):
-                # Take up to 5 Oxford examples and create fill-in-the-blank
-                oxford_examples = oxford_result['examples'][:5]
-                if oxford_examples:
-                    oxford_section = ["📖 <b>Oxford:</b>"]
-                    for i, example in enumerate(oxford_examples, 1):
-                        fill_blank_example = create_fill_in_blank(example, word)
-                        oxford_section.append(f"{i}. {fill_blank_example}")
-                    combined_examples.append("<br>".join(oxford_section))
-            
-            # Collect Kindle example if available and usage is enabled
-            kindle_example = ""
-            if self.includeUsage and card_data["sentence"]:
-                kindle_example = card_data["sentence"]
-                # Create fill-in-the-blank for Kindle example using the same helper function
-                kindle_fill_blank = create_fill_in_blank(kindle_example, word).replace(";", ",")
-                combined_examples.append(f"📚 <b>Kindle:</b><br>{kindle_fill_blank}")
-            
-            # Set the example field with combined examples
-            if combined_examples:
-                card_data["sentence"] = "<br><br>".join(combined_examples)
-                if oxford_examples and kindle_example:
-                    card_data["example_source"] = "Oxford + Kindle"
-                elif oxford_examples:
-                    card_data["example_source"] = "Oxford"
-                elif kindle_example:
-                    card_data["example_source"] = "Kindle"
+                        card_data["dictionary_definition"] = ""
                 else:
-                    card_data["example_source"] = "None"
+                    # For non-English words, try to get a translation first then lookup
+                    try:
+                        eng_word = translate(word, from_lang=lang, to_lang="en")
+                        card_data["dictionary_definition"] = lookupDictionary(eng_word)
+                    except:
+                        card_data["dictionary_definition"] = ""
+            except Exception:
+                card_data["dictionary_definition"] = ""
+        
+        # Enhanced example handling - include BOTH Oxford and Kindle examples
+        oxford_result = card_data.get("oxford_data")
+        combined_examples = []
+        
+        # Collect Oxford examples if available (4-5 examples with fill-in-the-blank)
+        oxford_examples = []
+        if oxford_result and oxford_result.get('examples'):
+            # Take up to 5 Oxford examples and create fill-in-the-blank
+            oxford_examples = oxford_result['examples'][:5]
+            if oxford_examples:
+                oxford_section = ["📖 <b>Oxford:</b>"]
+                for i, example in enumerate(oxford_examples, 1):
+                    # Oxford examples use the headword's forms
+                    fill_blank_example = create_fill_in_blank(example, card_data.get("lemma", word))
+                    oxford_section.append(f"{i}. {fill_blank_example}")
+                combined_examples.append("<br>".join(oxford_section))
+        
+        # Collect Kindle example if available and usage is enabled
+        kindle_example = ""
+        if self.includeUsage and card_data["sentence"]:
+            kindle_example = card_data["sentence"]
+            # Create fill-in-the-blank for Kindle example using the same helper function
+            kindle_fill_blank = create_fill_in_blank(kindle_example, word).replace(";", ",")
+            combined_examples.append(f"📚 <b>Kindle:</b><br>{kindle_fill_blank}")
+        
+        # Set the example field with combined examples
+        if combined_examples:
+            card_data["sentence"] = "<br><br>".join(combined_examples)
+            if oxford_examples and kindle_example:
+                card_data["example_source"] = "Oxford + Kindle"
+            elif oxford_examples:
+                card_data["example_source"] = "Oxford"
+            elif kindle_example:
+                card_data["example_source"] = "Kindle"
             else:
-                card_data["sentence"] = ""
                 card_data["example_source"] = "None"
-            
-            # Add translation if enabled
-            if self.doTranslate:
+        else:
+            card_data["sentence"] = ""
+            card_data["example_source"] = "None"
+        
+        # Add translation if enabled (already done in bulk if batching is on)
+        if self.doTranslate:
+            if "translation" in record:
+                card_data["translated_definition"] = record["translation"] or "cannot translate"
+            else:
                 try:
-                    card_data["translated_definition"] = translate_func(word)
+                    card_data["translated_definition"] = translateWord(word, self.target_language)
                 except Exception as e:
                     card_data["translated_definition"] = "cannot translate"
-            
-            translated_data.append(card_data)
-            
-        return translated_data
+
+        # Lookups fail once the import is cancelled; don't pass on a card
+        # that may be missing parts because of that
+        raise_if_cancelled(self.cancelToken)
+
+        if self.journal is not None and self.isComplete(card_data, lang):
+            self.journal.add(record, card_data)
+
+        return card_data
+
+    def lemmaOf(self, record):
+        """Headword an English word record is looked up by"""
+        if self.lemmas is None:
+            return record["word"]
+        return self.lemmas.resolve(record["word"], record.get("stem"))
+
+    def lookupWord(self, word):
+        """
+        Dictionary lookup shared by all the words resolving to the same entry
+        (the first one looks it up, the others reuse the result)
+        """
+        return self.dictionaryLookups.get(
+            normalize_key(word),
+            lambda: lookup_oxford_dictionary(word, max_definitions=3, max_examples_per_def=5))
+
+    def isComplete(self, card_data, lang):
+        """
+        Check nothing failed while enriching a card. Incomplete cards are not
+        journaled, so a resumed import tries them again (words the dictionary
+        doesn't know are cached, so retrying those is cheap).
+        """
+        if self.doTranslate and card_data["translated_definition"] == "cannot translate":
+            return False
+        if self.includeDictionary and lang == "en" and card_data["oxford_data"] is None:
+            return False
+        return True
 
     def createTemporaryFile(self):
         if len(self.words) == 0:
             return None
-            
-        path = os.path.join(tempfile.gettempdir(), "kind2anki_temp.txt")
-        
-        # Try to get Anki's media folder for audio downloads
+        return self.writeCards(self.translated)
+
+    def exportToFile(self):
+        """
+        Run the whole pipeline (read -> enrich -> format -> write) with each
+        card written as soon as it is ready, so memory use doesn't grow with
+        the size of the vocabulary
+
+        Returns:
+            Path of the import file, or None if there was nothing to import
+        """
+        with self.profiling():
+            records = self.iterWordsFromDB()
+            path = self.writeCards(self.enrichWords(records))
+        self.printStats()
+        return path
+
+    def getMediaFolder(self):
+        """Get the media folder for audio downloads (Anki's, when running in Anki)"""
+        if self.mediaFolder:
+            return self.mediaFolder
+        # Only ask aqt if Anki loaded it; never import it from headless runs
+        aqt = sys.modules.get("aqt")
         try:
-            from aqt import mw
+            mw = aqt.mw if aqt is not None else None
             if mw and mw.col:
-                media_folder = mw.col.media.dir()
-            else:
-                media_folder = None
+                return mw.col.media.dir()
         except:
-            media_folder = None
+            pass
+        return None
+
+    def exportNotes(self):
+        """
+        Run the pipeline (read -> enrich -> format) for a direct import into
+        the collection, see note_importer.NoteImporter
+
+        Returns:
+            List of field lists, one per card. If the import was cancelled,
+            the cards finished until then (and self.cancelled is set).
+        """
+        records = self.iterWordsFromDB()
+        rows = []
+        try:
+            with self.profiling():
+                for fields in self.formatCards(self.enrichWords(records)):
+                    rows.append(fields)
+        except Cancelled:
+            self.cancelled = True
+            print(f"Import cancelled after {len(rows)} cards")
+        self.printStats()
+        return rows
+
+    def profiling(self):
+        recorder = get_recorder()
+        return recorder.profiling() if recorder is not None else contextlib.nullcontext()
+
+    def writeReport(self):
+        """
+        Write the timing report of this run (if reportPath was given). Call
+        it after the Anki import, so the import step is included.
+
+        Returns:
+            Path of the report, or None if instrumentation is off
+        """
+        recorder = get_recorder()
+        if not self.reportPath or recorder is None:
+            return None
+        path = recorder.write_report(self.reportPath, extra={
+            'words': self.words_total,
+            'exported': len(self.exported_keys),
+            'cancelled': self.cancelled,
+            'executor': self.executor,
+            'concurrency': self.concurrency,
+            'parse_workers': self.parseWorkers,
+            'offline_dictionary': self.dictionaryPath,
+        })
+        print(f"Timing report written to {path}")
+        return path
+
+    def formatCards(self, cards):
+        """
+        Format stage: map each card to its note fields as it arrives, queueing
+        its audio download. A card is passed on once its audio file is in
+        place (in order), with an empty sound field if the download failed.
+        The downloads are finished when the generator is.
+
+        Args:
+            cards: Iterable of card data dictionaries
+
+        Yields:
+            List of field values for each card
+        """
+        media_folder = self.getMediaFolder()
+        if media_folder:
+            self.audioDownloader = AudioDownloader(
+                media_folder, concurrency=self.concurrency, index_path=self.mediaIndexPath)
+        self.exported_keys = set()
+        held = collections.deque()
+        done = 0
+        try:
+            try:
+                for card_data in cards:
+                    raise_if_cancelled(self.cancelToken)
+                    with timed('format'):
+                        fields = self.formatCard(card_data, media_folder)
+                    done += 1
+                    self.progress.update('enrich', done, self.enrichTotal())
+                    held.append((card_data, fields))
+                    yield from self.passOnCards(held, waitForAudio=True)
+                self.progress.update('enrich', done, self.enrichTotal(), force=True)
+                if self.audioDownloader is not None:
+                    # The import needs the audio files in place
+                    self.audioDownloader.wait(
+                        lambda finished, total: self.progress.update('audio', finished, total))
+            except Cancelled:
+                if self.audioDownloader is not None:
+                    self.audioDownloader.abort()
+                # The finished cards are still passed on, without the audio
+                # files that were not downloaded
+                yield from self.passOnCards(held)
+                raise
+            yield from self.passOnCards(held)
+        finally:
+            if self.audioDownloader is not None:
+                self.audioDownloader.close()
+
+    def passOnCards(self, held, waitForAudio=False):
+        """
+        Yield the field lists of the held (card data, fields) pairs in order
+
+        Args:
+            held: Deque of cards formatted so far
+            waitForAudio: Stop at the first card whose audio is still downloading
+        """
+        downloader = self.audioDownloader
+        while held:
+            card_data, fields = held[0]
+            sound = fields[4]
+            filename = sound[len("[sound:"):-1] if sound.startswith("[sound:") else None
+            if downloader is not None and filename is not None:
+                if waitForAudio and downloader.is_pending(filename):
+                    return
+                if downloader.has_failed(filename):
+                    fields[4] = ""
+            held.popleft()
+            yield fields
+            self.exported_keys.add(card_data.get("word_key"))
+
+    def writeCards(self, cards):
+        """
+        Write stage: write each card to the import file as it arrives
+
+        Args:
+            cards: Iterable of card data dictionaries
+
+        Returns:
+            Path of the import file, or None if no card was written
+        """
+        path = os.path.join(tempfile.gettempdir(), "kind2anki_temp.txt")
+        written = 0
         
         with codecs.open(path, "w", encoding="utf-8") as f:
-            # Write all card fields into the file
-            for card_data in self.translated:
-                # Enhanced definition field - prioritize Oxford definitions over translations
-                oxford_result = card_data.get("oxford_data")
-                definition = ""
-                
-                # First priority: Oxford dictionary definition
-                if oxford_result and oxford_result.get('definitions'):
-                    oxford_definitions = oxford_result['definitions'][:2]  # Take first 2 definitions
-                    definition_parts = []
-                    
-                    # Add word type if available
-                    if oxford_result.get('word_type'):
-                        definition_parts.append(f"<i>({oxford_result['word_type']})</i>")
-                    
-                    # Add definitions
-                    for i, def_text in enumerate(oxford_definitions, 1):
-                        definition_parts.append(f"<b>{i}.</b> {def_text}")
-                    
-                    definition = "<br>".join(definition_parts)
-                    
-                    # Add translation as supplementary information if available
-                    if card_data["translated_definition"]:
-                        definition += f"<hr><b>Translation:</b> {card_data['translated_definition']}"
-                
-                # Fallback: Use translation as primary definition
-                elif card_data["translated_definition"]:
-                    definition = card_data["translated_definition"]
-                    
-                # Last resort: Basic dictionary definition
-                elif card_data["dictionary_definition"]:
-                    definition = card_data["dictionary_definition"]
-                
-                # Enhanced word type detection using Oxford data
-                word_type = self.detect_word_type_enhanced(card_data["word"], card_data.get("oxford_data"))
-                
-                # Enhanced pronunciation using Oxford data
-                pronunciation = self.get_pronunciation_enhanced(card_data["word"], card_data.get("oxford_data"))
-                
-                # Enhanced audio handling using Oxford data
-                audio_field = self.get_audio_field_enhanced(card_data["word"], card_data.get("oxford_data"), media_folder)
-                
-                # Enhanced Content field with detailed book information
-                book_info = f"Book: {card_data['book_name']}"
-                if card_data.get("example_source") and card_data.get("example_source") != "None":
-                    book_info += f" | Example from: {card_data['example_source']}"
-                
-                # Map to user's 9-field note type:
-                # 1:Word, 2:Word Type, 3:Phonetic, 4:Example, 5:Sound, 6:Image, 7:Def, 8:Content, 9:Copyright
-                fields = [
-                    card_data["word"],                          # 1: Word
-                    word_type,                                  # 2: Word Type (enhanced with Oxford data)
-                    pronunciation or card_data["reading"],      # 3: Phonetic (enhanced with Oxford pronunciation)
-                    card_data["sentence"],                      # 4: Example (with _____ replacing word)
-                    audio_field,                               # 5: Sound (enhanced with Oxford audio)
-                    "",                                         # 6: Image (intentionally empty)
-                    definition,                                 # 7: Def (enhanced with Oxford definitions)
-                    book_info,                                 # 8: Content (enhanced book information)
-                    "Generated by Kind2Anki from Kindle Vocabulary Builder" # 9: Copyright
-                ]
-                
+            for fields in self.formatCards(cards):
                 # Write as semicolon-delimited line
                 f.write(u"{}\n".format(";".join(field.replace(";", ",") for field in fields)))
-                
+                f.flush()
+                written += 1
+        
+        if written == 0:
+            os.remove(path)
+            return None
         return path
 
+    def formatCard(self, card_data, media_folder=None):
+        """
+        Map card data to the fields of the 9-field note type
+        
+        Args:
+            card_data: Card data from enrichWord
+            media_folder: Anki's media folder for audio downloads (optional)
+            
+        Returns:
+            List of field values
+        """
+        # Enhanced definition field - prioritize Oxford definitions over translations
+        oxford_result = card_data.get("oxford_data")
+        definition = ""
+        
+        # First priority: Oxford dictionary definition
+        if oxford_result and oxford_result.get('definitions'):
+            oxford_definitions = oxford_result['definitions'][:2]  # Take first 2 definitions
+            definition_parts = []
+            
+            # Add word type if available
+            if oxford_result.get('word_type'):
+                definition_parts.append(f"<i>({oxford_result['word_type']})</i>")
+            
+            # Add definitions
+            for i, def_text in enumerate(oxford_definitions, 1):
+                definition_parts.append(f"<b>{i}.</b> {def_text}")
+            
+            definition = "<br>".join(definition_parts)
+            
+            # Add translation as supplementary information if available
+            if card_data["translated_definition"]:
+                definition += f"<hr><b>Translation:</b> {card_data['translated_definition']}"
+        
+        # Fallback: Use translation as primary definition
+        elif card_data["translated_definition"]:
+            definition = card_data["translated_definition"]
+            
+        # Last resort: Basic dictionary definition
+        elif card_data["dictionary_definition"]:
+            definition = card_data["dictionary_definition"]
+        
+        # Enhanced word type detection using Oxford data
+        word_type = self.detect_word_type_enhanced(card_data["word"], card_data.get("oxford_data"))
+        
+        # Enhanced pronunciation using Oxford data
+        pronunciation = self.get_pronunciation_enhanced(card_data["word"], card_data.get("oxford_data"))
+        
+        # Enhanced audio handling using Oxford data
+        audio_field = self.get_audio_field_enhanced(card_data["word"], card_data.get("oxford_data"), media_folder)
+        
+        # Enhanced Content field with detailed book information
+        book_info = f"Book: {card_data['book_name']}"
+        if card_data.get("example_source") and card_data.get("example_source") != "None":
+            book_info += f" | Example from: {card_data['example_source']}"
+        
+        # Map to user's 9-field note type:
+        # 1:Word, 2:Word Type, 3:Phonetic, 4:Example, 5:Sound, 6:Image, 7:Def, 8:Content, 9:Copyright
+        fields = [
+            card_data["word"],                          # 1: Word
+            word_type,                                  # 2: Word Type (enhanced with Oxford data)
+            pronunciation or card_data["reading"],      # 3: Phonetic (enhanced with Oxford pronunciation)
+            card_data["sentence"],                      # 4: Example (with _____ replacing word)
+            audio_field,                               # 5: Sound (enhanced with Oxford audio)
+            "",                                         # 6: Image (intentionally empty)
+            definition,                                 # 7: Def (enhanced with Oxford definitions)
+            book_info,                                 # 8: Content (enhanced book information)
+            "Generated by Kind2Anki from Kindle Vocabulary Builder" # 9: Copyright
+        ]
+        
+        return fields
+
     def detect_word_type(self, word):
         """
         Basic word type detection. This is a simple implementation.
@@ -468,7 +1003,12 @@ class KindleImporter():
         # Try to use Oxford audio if available
         if oxford_data and oxford_data.get('audio_url') and media_folder:
             try:
-                filename = download_audio_file(oxford_data['audio_url'], word, media_folder)
+                downloader = self.audioDownloader
+                if downloader is not None and downloader.media_folder == media_folder:
+                    # Queue the download; writeCards waits for it before returning
+                    filename = downloader.add(oxford_data['audio_url'])
+                else:
+                    filename = download_audio_file(oxford_data['audio_url'], word, media_folder)
                 if filename:
                     return f"[sound:{filename}]"
             except Exception as e:
@@ -477,30 +1017,3 @@ class KindleImporter():
         # Fallback to generic audio format
         safe_word = "".join(c for c in word if c.isalnum() or c in (' ', '-', '_')).rstrip()
         return f"[sound:{safe_word}.mp3]"
-
-def ensure_dependencies_installed():
-    """
-    Ensure required dependencies are installed for enhanced functionality
-    """
-    dependencies = ['requests', 'beautifulsoup4']
-    
-    for package in dependencies:
-        try:
-            if package == 'beautifulsoup4':
-                import bs4
-            else:
-                __import__(package)
-        except ImportError:
-            import subprocess
-            import sys
-            try:
-                print(f"Installing {package}...")
-                subprocess.check_call([sys.executable, '-m', 'pip', 'install', package])
-                print(f"Successfully installed {package}")
-            except subprocess.CalledProcessError:
-                print(f"Could not install {package} automatically. Please install it manually.")
-                return False
-    return True
-
-# Ensure dependencies are installed
-ensure_dependencies_installed()
@@ -0,0 +1,280 @@
+# Lemma resolution for Kind2Anki
+# Kindle stores the form of a word as it appeared in the book ("running",
+# "ran") next to its stem ("run"). Dictionary pages exist for headwords, so
+# each word is mapped to its lemma before it is looked up, and all the forms
+# of a lemma share one lookup: a vocabulary with "run", "ran" and "running"
+# downloads one page instead of three (two of them search redirects).
+
+import os
+import threading
+
+# Irregular English forms -> lemma, used when Kindle has no stem for a word.
+# Forms that are headwords themselves ("saw", "left", "found", "lost",
+# "broken", "people") are left out, they are looked up as they are.
+_IRREGULAR = """
+arise arose arisen
+awake awoke awoken
+be was were been am is are
+bear borne
+beat beaten
+become became
+begin began begun
+bite bitten
+bleed bled
+blow blew blown
+break broke
+breed bred
+bring brought
+build built
+burn burnt
+buy bought
+catch caught
+choose chose chosen
+cling clung
+come came
+creep crept
+deal dealt
+dig dug
+do did done does
+draw drew drawn
+dream dreamt
+drink drank
+drive drove driven
+eat ate eaten
+fight fought
+flee fled
+fling flung
+fly flew flown
+forbid forbade
+forget forgot forgotten
+forgive forgave forgiven
+freeze froze
+get got gotten
+give gave
+go went gone goes
+grow grew
+hang hung
+have has had
+hear heard
+hide hid
+hold held
+keep kept
+kneel knelt
+know knew
+lead led
+lean leant
+leap leapt
+make made
+mean meant
+meet met
+pay paid
+ride rode ridden
+ring rang
+rise risen
+run ran
+say said
+see seen
+seek sought
+sell sold
+send sent
+shake shook shaken
+shine shone
+shrink shrank shrunk
+sing sang sung
+sink sank sunk
+sit sat
+slay slain
+sleep slept
+slide slid
+sling slung
+speak spoken
+spin spun
+spit spat
+spring sprang sprung
+stand stood
+sting stung
+stink stank stunk
+stride strode stridden
+strike struck
+strive strove striven
+swear swore
+sweep swept
+swim swam swum
+swing swung
+take took taken
+teach taught
+tear tore torn
+tell told
+think thought
+throw threw thrown
+tread trod trodden
+understand understood
+wake woke woken
+wear wore
+weave wove woven
+weep wept
+win won
+wring wrung
+write wrote written
+child children
+foot feet
+goose geese
+louse lice
+man men
+mouse mice
+ox oxen
+tooth teeth
+woman women
+"""
+
+# Forms that are headwords of their own although Kindle stems them to a verb
+# ("building" -> "build"), with their plurals
+_LEXICALIZED = """
+beginning beginnings
+belonging belongings
+building buildings
+ceiling ceilings
+clothing
+drawing drawings
+ending endings
+evening evenings
+feeling feelings
+finding findings
+meaning meanings
+meeting meetings
+painting paintings
+saving savings
+setting settings
+surrounding surroundings
+understanding
+warning warnings
+wedding weddings
+interested
+tired
+worried
+"""
+
+
+def parse_inflections(text):
+    """
+    Parse an inflection table
+
+    Each line holds a lemma followed by its forms, separated by spaces or
+    tabs; lines starting with # are comments. A lemma is its own headword,
+    so a line with just a word keeps that word as it is.
+
+    Returns:
+        Dictionary of form -> lemma
+    """
+    inflections = {}
+    for line in text.splitlines():
+        parts = line.split('#', 1)[0].split()
+        if not parts:
+            continue
+        inflections.setdefault(parts[0].lower(), parts[0])
+        for form in parts[1:]:
+            inflections[form.lower()] = parts[0]
+    return inflections
+
+
+IRREGULAR_FORMS = parse_inflections(_IRREGULAR)
+LEXICALIZED_FORMS = parse_inflections(_LEXICALIZED)
+
+
+def load_inflections(path):
+    """Load a user inflection table (see parse_inflections) if the file exists"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        return parse_inflections(f.read())
+
+
+class LemmaResolver:
+    """Map the forms Kindle recorded to the headwords to look up"""
+
+    def __init__(self, inflections=None, is_headword=None):
+        """
+        Args:
+            inflections: User table of form -> lemma, overriding Kindle's stems
+            is_headword: Optional function telling whether the dictionary has
+                an entry for a form itself (e.g. "building"), which is then
+                looked up as it is
+        """
+        self.inflections = inflections or {}
+        self.is_headword = is_headword
+
+    def resolve(self, word, stem=None):
+        """
+        Get the lemma of an English word
+
+        Args:
+            word: Form looked up on the Kindle
+            stem: Kindle's stem for it (WORDS.stem), if any
+
+        Returns:
+            Lemma to look the word up by
+        """
+        key = word.strip().lower()
+        if key in self.inflections:
+            return self.inflections[key]
+        if key in LEXICALIZED_FORMS:
+            return LEXICALIZED_FORMS[key]
+        if self.is_headword is not None and self.is_headword(word):
+            return word
+        if stem and stem.strip() and " " not in word.strip():
+            return stem.strip()
+        return IRREGULAR_FORMS.get(key, word)
+
+
+class LookupGroup:
+    """
+    Run each lookup once per key, even when several threads ask for the same
+    key at the same time; the others wait for the first and share its result
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self._running = {}
+        self.lookups = 0
+        self.shared = 0
+
+    def get(self, key, lookup):
+        """
+        Args:
+            key: Lookup key (e.g. the normalized lemma)
+            lookup: Function called without arguments if the key is new
+
+        Returns:
+            Result of the (first) lookup for the key
+        """
+        with self._lock:
+            if key in self._results:
+                self.shared += 1
+                return self._results[key]
+            event = self._running.get(key)
+            if event is None:
+                event = self._running[key] = threading.Event()
+                self.lookups += 1
+                owner = True
+            else:
+                self.shared += 1
+                owner = False
+
+        if not owner:
+            event.wait()
+            with self._lock:
+                if key in self._results:
+                    return self._results[key]
+            # The first lookup failed with an exception; try again
+            return lookup()
+
+        try:
+            result = lookup()
+            with self._lock:
+                self._results[key] = result
+            return result
+        finally:
+            with self._lock:
+                del self._running[key]
+            event.set()
@@ -0,0 +1,139 @@
+# Direct note import for Kind2Anki
+# Cards are added to the collection as notes in one bulk operation, instead
+# of being written to a semicolon-delimited text file and parsed back by
+# Anki's TextImporter.
+
+import re
+
+from .instrumentation import timed
+
+try:
+    from anki.utils import strip_html_media
+except ImportError:
+    strip_html_media = None
+
+# Same values as the import modes of anki.importing.noteimp.NoteImporter
+# (and the order of the "importMode" combo box in the dialog)
+UPDATE_MODE = 0
+IGNORE_MODE = 1
+ADD_MODE = 2
+
+_HTML_RE = re.compile(r"<[^>]*>|\[sound:[^\]]*\]")
+
+
+def first_field_key(value):
+    """Normalize a first field value the way Anki compares duplicates"""
+    if strip_html_media is None:
+        return _HTML_RE.sub("", value).strip()
+    return strip_html_media(value).strip()
+
+
+def load_first_fields(col, model_id):
+    """
+    Load the first field of every note of a note type with one query
+
+    Returns:
+        Dictionary of normalized first field -> note id
+    """
+    existing = {}
+    for nid, flds in col.db.all("select id, flds from notes where mid = ?", model_id):
+        existing.setdefault(first_field_key(flds.split("\x1f", 1)[0]), nid)
+    return existing
+
+
+class NoteImporter:
+    """Add formatted cards to an Anki collection as notes"""
+
+    def __init__(self, col, model, deck_id, import_mode=IGNORE_MODE):
+        """
+        Args:
+            col: Anki collection
+            model: Note type dictionary the fields are mapped to (in order)
+            deck_id: Deck new notes are added to
+            import_mode: UPDATE_MODE, IGNORE_MODE or ADD_MODE for notes whose
+                first field is already in the collection
+        """
+        self.col = col
+        self.model = model
+        self.deck_id = deck_id
+        self.import_mode = import_mode
+        self.added = 0
+        self.updated = 0
+        self.ignored = 0
+        self.log = []
+
+    def _fill(self, note, fields):
+        for i in range(min(len(fields), len(note.fields))):
+            note.fields[i] = fields[i]
+
+    def run(self, rows):
+        """
+        Import notes
+
+        Args:
+            rows: Iterable of field lists from KindleImporter.formatCard
+
+        Returns:
+            List of log lines for the summary shown to the user
+        """
+        with timed('anki.import'):
+            return self._run(rows)
+
+    def _run(self, rows):
+        existing = {}
+        if self.import_mode != ADD_MODE:
+            existing = load_first_fields(self.col, self.model['id'])
+
+        new_notes = []
+        updated_notes = []
+        seen = set()
+        for fields in rows:
+            if not fields or not fields[0]:
+                continue
+            key = first_field_key(fields[0])
+            if self.import_mode != ADD_MODE:
+                # Like TextImporter, only the first row for a word counts
+                if key in seen:
+                    self.ignored += 1
+                    continue
+                seen.add(key)
+
+            nid = existing.get(key)
+            if nid is not None:
+                if self.import_mode == IGNORE_MODE:
+                    self.ignored += 1
+                    continue
+                note = self.col.get_note(nid)
+                self._fill(note, fields)
+                updated_notes.append(note)
+                continue
+
+            note = self.col.new_note(self.model)
+            self._fill(note, fields)
+            new_notes.append(note)
+
+        if updated_notes:
+            self.col.update_notes(updated_notes)
+        self._add_notes(new_notes)
+
+        self.added = len(new_notes)
+        self.updated = len(updated_notes)
+        self.log = ["Added {} notes.".format(self.added)]
+        if self.updated:
+            self.log.append("Updated {} existing notes.".format(self.updated))
+        if self.ignored:
+            self.log.append("Skipped {} duplicate words.".format(self.ignored))
+        return self.log
+
+    def _add_notes(self, notes):
+        if not notes:
+            return
+        try:
+            from anki.collection import AddNoteRequest
+        except ImportError:
+            # Anki before 2.1.55 has no bulk API
+            for note in notes:
+                self.col.add_note(note, self.deck_id)
+            return
+        # One backend call and one transaction for all notes
+        self.col.add_notes([AddNoteRequest(note=note, deck_id=self.deck_id) for note in notes])
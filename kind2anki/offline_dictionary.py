@@ -0,0 +1,412 @@
+# Offline dictionary backend for Kind2Anki
+# Instead of downloading a dictionary page for every word, a dictionary dump
+# supplied by the user (JSON / JSON lines, StarDict or ABBYY Lingvo DSL) is
+# loaded once into an indexed SQLite file. Lookups then return the same
+# WordInfo records as the Oxford parser, read straight from disk, so large
+# imports need no network access for definitions.
+
+import gzip
+import html
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+
+from .cache import normalize_key
+from .oxford_dictionary import WordInfo
+
+# Bump when the stored record format changes, so indexes are rebuilt
+INDEX_VERSION = 1
+
+
+def word_info_record(name, wordform=None, pronunciations=None, definitions=None,
+                     examples=None, audio_urls=None):
+    """Build a dictionary with the fields of oxford_dictionary.WordInfo"""
+    definitions = definitions or []
+    if examples is None:
+        examples = [example for definition in definitions
+                    for example in definition.get('examples', [])]
+    return {
+        'name': name,
+        'wordform': wordform,
+        'pronunciations': pronunciations or {},
+        'definitions': definitions,
+        'examples': examples,
+        'audio_urls': audio_urls or {},
+    }
+
+
+# JSON dumps
+
+def _definition(value):
+    if isinstance(value, str):
+        return {'definition': value, 'examples': []}
+    definition = {'definition': value.get('definition') or value.get('text', ''),
+                  'examples': list(value.get('examples', []))}
+    for field in ('grammar', 'labels'):
+        if value.get(field):
+            definition[field] = value[field]
+    return definition
+
+
+def _first(entry, *keys):
+    for key in keys:
+        if entry.get(key):
+            return entry[key]
+    return None
+
+
+def json_entry(headword, entry):
+    """
+    Turn one JSON dictionary entry into a WordInfo record
+
+    Entries are either WordInfo shaped (name, wordform, pronunciations,
+    definitions, examples, audio_urls), a simpler object (word, pos,
+    pronunciation, definitions as strings, audio_url), a list of definition
+    strings or a single definition string.
+    """
+    if isinstance(entry, str):
+        entry = {'definitions': [entry]}
+    elif isinstance(entry, list):
+        entry = {'definitions': entry}
+
+    name = _first(entry, 'name', 'word', 'headword') or headword
+    pronunciations = entry.get('pronunciations')
+    if not pronunciations:
+        pronunciation = _first(entry, 'pronunciation', 'ipa', 'phonetic')
+        pronunciations = {'british': pronunciation.strip('/')} if pronunciation else {}
+    audio_urls = entry.get('audio_urls')
+    if not audio_urls and entry.get('audio_url'):
+        audio_urls = {'british': entry['audio_url']}
+    definitions = [_definition(value) for value in entry.get('definitions') or []]
+    return word_info_record(
+        name, _first(entry, 'wordform', 'pos', 'word_type'), pronunciations,
+        definitions, entry.get('examples'), audio_urls)
+
+
+def read_json(path):
+    """Yield (headword, record) from a JSON or JSON lines dump"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    yield _first(entry, 'name', 'word', 'headword'), json_entry(None, entry)
+            return
+        data = json.load(f)
+    if isinstance(data, dict):
+        for headword, entry in data.items():
+            yield headword, json_entry(headword, entry)
+    else:
+        for entry in data:
+            yield _first(entry, 'name', 'word', 'headword'), json_entry(None, entry)
+
+
+# StarDict (.ifo + .idx[.gz] + .dict[.dz])
+
+_TAG = re.compile(r'<[^>]+>')
+_BREAK = re.compile(r'<br\s*/?>|</p>|</div>|</li>', re.IGNORECASE)
+
+
+def _text_definitions(text, markup):
+    if markup:
+        text = html.unescape(_TAG.sub('', _BREAK.sub('\n', text)))
+    pronunciation = None
+    definitions = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if pronunciation is None and not definitions and re.fullmatch(r'[/\[].+[/\]]', line):
+            pronunciation = line.strip('/[]')
+            continue
+        definitions.append({'definition': line, 'examples': []})
+    return pronunciation, definitions
+
+
+def _open_sibling(base, extensions):
+    for extension in extensions:
+        path = base + extension
+        if os.path.exists(path):
+            return gzip.open(path, 'rb') if extension.endswith(('.gz', '.dz')) else open(path, 'rb')
+    raise FileNotFoundError(f"No {' or '.join(base + e for e in extensions)}")
+
+
+def _stardict_fields(data, types):
+    """Split an entry into (type, text) fields, see the StarDict format"""
+    if types:
+        fields = []
+        for index, field_type in enumerate(types):
+            if index == len(types) - 1:
+                chunk, data = data, b''
+            else:
+                chunk, _, data = data.partition(b'\0')
+            fields.append((field_type, chunk))
+        return fields
+    fields = []
+    while data:
+        field_type, data = chr(data[0]), data[1:]
+        if field_type.islower():
+            chunk, _, data = data.partition(b'\0')
+        else:
+            # Upper case types are binary, prefixed with their size
+            size = struct.unpack('>I', data[:4])[0]
+            chunk, data = data[4:4 + size], data[4 + size:]
+        fields.append((field_type, chunk))
+    return fields
+
+
+def read_stardict(path):
+    """Yield (headword, record) from a StarDict dictionary, given its .ifo file"""
+    base = os.path.splitext(path)[0]
+    info = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            key, separator, value = line.strip().partition('=')
+            if separator:
+                info[key] = value
+    offset_format = '>Q' if info.get('idxoffsetbits') == '64' else '>I'
+    offset_size = struct.calcsize(offset_format)
+    types = info.get('sametypesequence', '')
+
+    with _open_sibling(base, ('.idx', '.idx.gz')) as f:
+        index = f.read()
+    with _open_sibling(base, ('.dict', '.dict.dz')) as f:
+        contents = f.read()
+
+    position = 0
+    while position < len(index):
+        end = index.index(b'\0', position)
+        headword = index[position:end].decode('utf-8')
+        position = end + 1
+        offset = struct.unpack(offset_format, index[position:position + offset_size])[0]
+        size = struct.unpack('>I', index[position + offset_size:position + offset_size + 4])[0]
+        position += offset_size + 4
+
+        pronunciation = None
+        definitions = []
+        for field_type, chunk in _stardict_fields(contents[offset:offset + size], types):
+            if field_type in 'mlgtxyh':
+                text = chunk.decode('utf-8', errors='replace')
+                if field_type == 't':
+                    pronunciation = text
+                    continue
+                found, more = _text_definitions(text, markup=field_type in 'gxh')
+                pronunciation = pronunciation or found
+                definitions.extend(more)
+        yield headword, word_info_record(
+            headword, None, {'british': pronunciation} if pronunciation else None, definitions)
+
+
+# ABBYY Lingvo DSL
+
+_DSL_MEDIA = re.compile(r'\[s\].*?\[/s\]|\{\{.*?\}\}')
+_DSL_TAG = re.compile(r'\[/?[^\[\]]*\]')
+_DSL_PART = re.compile(r'\[(p|t|ex)\](.*?)\[/\1\]')
+
+
+def _dsl_text(text):
+    text = _DSL_MEDIA.sub('', text.replace('\\[', '\0').replace('\\]', '\1'))
+    text = _DSL_TAG.sub('', text)
+    return ' '.join(text.replace('\0', '[').replace('\1', ']').replace('\\', '').split())
+
+
+def _dsl_record(headwords, body):
+    wordform = None
+    pronunciation = None
+    definitions = []
+    for line in body:
+        examples = []
+        for part, value in _DSL_PART.findall(line):
+            if part == 'p' and wordform is None:
+                wordform = _dsl_text(value)
+            elif part == 't' and pronunciation is None:
+                pronunciation = _dsl_text(value)
+            elif part == 'ex':
+                examples.append(_dsl_text(value))
+        text = _dsl_text(_DSL_PART.sub('', line))
+        if text:
+            definitions.append({'definition': text, 'examples': examples})
+        elif examples and definitions:
+            definitions[-1]['examples'].extend(examples)
+    for headword in headwords:
+        # Parts of a headword in braces are shown, but not indexed
+        name = _dsl_text(re.sub(r'\{[^}]*\}', '', headword))
+        yield name, word_info_record(
+            name, wordform, {'british': pronunciation} if pronunciation else None, definitions)
+
+
+def read_dsl(path):
+    """Yield (headword, record) from an ABBYY Lingvo .dsl (or .dsl.dz) file"""
+    opener = gzip.open if path.endswith('.dz') else open
+    with opener(path, 'rb') as f:
+        raw = f.read()
+    encoding = 'utf-16' if raw[:2] in (b'\xff\xfe', b'\xfe\xff') else 'utf-8-sig'
+
+    headwords = []
+    body = []
+    for line in raw.decode(encoding).splitlines():
+        if line.startswith('#') or not line.strip():
+            continue
+        if line[0] in ' \t':
+            body.append(line.strip())
+            continue
+        if body:
+            # A new card starts
+            yield from _dsl_record(headwords, body)
+            headwords, body = [], []
+        headwords.append(line.strip())
+    if headwords and body:
+        yield from _dsl_record(headwords, body)
+
+
+READERS = (
+    (('.json', '.jsonl', '.ndjson'), read_json),
+    (('.ifo',), read_stardict),
+    (('.dsl', '.dsl.dz'), read_dsl),
+)
+
+
+def read_entries(path):
+    """
+    Yield (headword, WordInfo record) for every entry of a dictionary dump
+
+    Raises:
+        ValueError: If the format is not supported
+    """
+    for extensions, reader in READERS:
+        if path.lower().endswith(extensions):
+            return reader(path)
+    supported = ', '.join(extension for extensions, _ in READERS for extension in extensions)
+    raise ValueError(f"Unsupported dictionary file '{path}', expected one of {supported}")
+
+
+class OfflineDictionary:
+    """
+    Indexed SQLite copy of a dictionary dump
+
+    Lookups are keyed like the Oxford URLs (see cache.normalize_key), so a
+    word is found whatever its capitalisation or spacing. Safe to use from
+    several threads.
+    """
+
+    def __init__(self, index_path):
+        """
+        Args:
+            index_path: SQLite file written by build
+        """
+        self.index_path = index_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+
+    @classmethod
+    def build(cls, source, index_path):
+        """
+        (Re)build the index of a dictionary dump
+
+        Returns:
+            Number of entries stored
+        """
+        folder = os.path.dirname(index_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        partial_path = index_path + '.part'
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+        conn = sqlite3.connect(partial_path)
+        try:
+            conn.executescript("""
+                PRAGMA journal_mode=OFF;
+                PRAGMA synchronous=OFF;
+                CREATE TABLE entries (key TEXT PRIMARY KEY, record TEXT NOT NULL) WITHOUT ROWID;
+                CREATE TABLE source (path TEXT, size INTEGER, mtime REAL, version INTEGER, built REAL);
+            """)
+            # The first entry of a headword wins (e.g. "run" verb before noun)
+            conn.executemany(
+                "INSERT OR IGNORE INTO entries (key, record) VALUES (?, ?)",
+                ((normalize_key(headword), json.dumps(record, ensure_ascii=False))
+                 for headword, record in read_entries(source) if headword))
+            stat = os.stat(source)
+            conn.execute("INSERT INTO source VALUES (?, ?, ?, ?, ?)",
+                         (os.path.abspath(source), stat.st_size, stat.st_mtime,
+                          INDEX_VERSION, time.time()))
+            conn.commit()
+            count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        finally:
+            conn.close()
+        os.replace(partial_path, index_path)
+        return count
+
+    @staticmethod
+    def is_current(source, index_path):
+        """Check whether an index was built from the dump as it is now"""
+        if not os.path.exists(index_path):
+            return False
+        try:
+            conn = sqlite3.connect(index_path)
+            try:
+                row = conn.execute("SELECT path, size, mtime, version FROM source").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.DatabaseError:
+            return False
+        stat = os.stat(source)
+        return row == (os.path.abspath(source), stat.st_size, stat.st_mtime, INDEX_VERSION)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __contains__(self, word):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (normalize_key(word),)).fetchone() is not None
+
+    def get_word_info(self, word):
+        """
+        Look a word up
+
+        Returns:
+            WordInfo record or None if the dictionary has no entry
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM entries WHERE key = ?", (normalize_key(word),)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return WordInfo.from_dict(json.loads(row[0]))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def load_dictionary(source, index_path):
+    """
+    Open the index of a dictionary dump, building it first if the dump is new
+    or changed since the index was built
+
+    Args:
+        source: Dictionary dump (.json, .jsonl, .ifo or .dsl)
+        index_path: SQLite file the index is kept in
+
+    Returns:
+        OfflineDictionary
+    """
+    if not OfflineDictionary.is_current(source, index_path):
+        print(f"Indexing dictionary {source}...")
+        start = time.perf_counter()
+        count = OfflineDictionary.build(source, index_path)
+        print(f"Indexed {count} entries in {time.perf_counter() - start:.1f}s")
+    return OfflineDictionary(index_path)
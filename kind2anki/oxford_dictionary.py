@@ -3,10 +3,81 @@
 # https://github.com/artyompetrov/AutoDefine_oxfordlearnersdictionaries
 
 import os
-import pathlib
+from typing import NamedTuple, Optional
+
 import requests
 from bs4 import BeautifulSoup as soup
-from http import cookiejar
+
+from . import oxford_lxml, transport
+from .cache import MISS, normalize_key
+from .audio import download_to_file, media_filename
+from .instrumentation import timed
+
+
+# Optional PersistentCache consulted before the dictionary is downloaded
+_cache = None
+
+
+def set_cache(cache):
+    """Use a PersistentCache for dictionary lookups (None disables caching)"""
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    return _cache
+
+
+# HTML parser used for dictionary pages: 'lxml' (fast, parses only the entry)
+# or 'html.parser' (BeautifulSoup); 'auto' picks lxml when it is installed
+PARSERS = ('auto', 'lxml', 'html.parser')
+_parser = 'auto'
+
+
+def set_parser(parser):
+    """Select the HTML parser backend used for dictionary pages"""
+    global _parser
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown parser '{parser}', expected one of {PARSERS}")
+    if parser == 'lxml' and not oxford_lxml.is_available():
+        print("lxml is not installed, falling back to html.parser")
+        parser = 'html.parser'
+    _parser = parser
+
+
+def get_parser():
+    """Get the parser backend in use ('lxml' or 'html.parser')"""
+    if _parser == 'auto':
+        return 'lxml' if oxford_lxml.is_available() else 'html.parser'
+    return _parser
+
+
+# Optional parse_pool.ParsePool pages are parsed on (None parses them in the
+# thread that downloaded them)
+_parse_pool = None
+
+
+def set_parse_pool(pool):
+    global _parse_pool
+    _parse_pool = pool
+
+
+def get_parse_pool():
+    return _parse_pool
+
+
+# Optional offline_dictionary.OfflineDictionary words are looked up in instead
+# of the website (None looks them up online)
+_dictionary = None
+
+
+def set_dictionary(dictionary):
+    global _dictionary
+    _dictionary = dictionary
+
+
+def get_dictionary():
+    return _dictionary
 
 
 class WordNotFound(Exception):
@@ -14,15 +85,38 @@ class WordNotFound(Exception):
     pass
 
 
-class BlockAll(cookiejar.CookiePolicy):
-    """Policy to block cookies"""
-    return_ok = set_ok = domain_return_ok = path_return_ok = lambda self, *args: False
-    netscape = True
-    rfc2965 = hide_cookie2 = False
+class WordInfo(NamedTuple):
+    """Word information parsed from one dictionary page (read-only)"""
+    name: Optional[str]
+    wordform: Optional[str]
+    pronunciations: Optional[dict]
+    definitions: Optional[list]
+    examples: Optional[list]
+    audio_urls: Optional[dict]
+    
+    def get(self, key, default=None):
+        """Dictionary-style access, so results can be used like the old dicts"""
+        return getattr(self, key, default)
+    
+    def as_dict(self):
+        return self._asdict()
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data.get(field) for field in cls._fields})
+
 
+def is_empty(word_info):
+    """Check whether a WordInfo (or its dict) has neither a name nor definitions"""
+    return not word_info.get('name') and not word_info.get('definitions')
 
-class OxfordDictionary:
-    """Oxford Learner's Dictionary API for retrieving word information"""
+
+class OxfordPageParser:
+    """
+    Parses one downloaded dictionary page with BeautifulSoup
+    
+    Every lookup gets its own parser, so lookups can run in parallel threads.
+    """
     
     # CSS Selectors for extracting data from Oxford pages
     entry_selector = '#entryContent > .entry'
@@ -43,75 +137,29 @@ class OxfordDictionary:
     definitions_selector = '.senses_multiple .sense > .def'
     examples_selector = '.senses_multiple .sense > .examples .x'
     
-    soup_data = None
+    def __init__(self, content):
+        self.document = soup(content, 'html.parser')
     
-    @classmethod
-    def get_url(cls, word, is_search=True):
-        """Get URL for word definition"""
-        if is_search:
-            baseurl = 'https://www.oxfordlearnersdictionaries.com/search/english/?q='
-        else:
-            baseurl = 'https://www.oxfordlearnersdictionaries.com/definition/english/'
-        return baseurl + word.replace(" ", "-").lower()
+    def is_no_exact_match(self):
+        """Check if the "No exact match found" message exists"""
+        no_exact = self.document.select_one('#search-results > h1')
+        return no_exact is not None and bool(no_exact.string) and no_exact.string.startswith('No exact match found')
     
-    @classmethod
-    def get_word_info(cls, word):
-        """
-        Get comprehensive word information from Oxford Learner's Dictionary
-        
-        Args:
-            word: The word to look up
-            
-        Returns:
-            Dictionary containing word information or None if not found
-        """
-        try:
-            # Set up request session with cookie blocking
-            req = requests.Session()
-            req.cookies.set_policy(BlockAll())
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            # First try direct search
-            word_to_search = word.replace(" ", "-").lower()
-            page_html = req.get(cls.get_url(word_to_search), headers=headers, timeout=10)
-            
-            if page_html.status_code == 404:
-                raise WordNotFound(f"Word '{word}' not found")
-            
-            cls.soup_data = soup(page_html.content, 'html.parser')
-            
-            # Check if "No exact match found" message exists
-            no_exact = cls.soup_data.select_one('#search-results > h1')
-            if no_exact is not None and no_exact.string and no_exact.string.startswith('No exact match found'):
-                raise WordNotFound(f"No exact match found for '{word}'")
-            
-            # Clean up unwanted content
-            cls._clean_soup_data()
-            
-            # Extract word information
-            word_info = {
-                'name': cls._get_name(),
-                'wordform': cls._get_wordform(),
-                'pronunciations': cls._get_pronunciations(),
-                'definitions': cls._get_definitions_full(),
-                'examples': cls._get_examples(),
-                'audio_urls': cls._get_audio_urls()
-            }
-            
-            return word_info
-            
-        except requests.RequestException as e:
-            print(f"Network error looking up '{word}': {e}")
-            return None
-        except Exception as e:
-            print(f"Error looking up '{word}': {e}")
-            return None
+    def parse(self):
+        """Extract word information from the page"""
+        # Clean up unwanted content
+        self._clean_document()
+        
+        return WordInfo(
+            name=self._get_name(),
+            wordform=self._get_wordform(),
+            pronunciations=self._get_pronunciations(),
+            definitions=self._get_definitions_full(),
+            examples=self._get_examples(),
+            audio_urls=self._get_audio_urls()
+        )
     
-    @classmethod
-    def _clean_soup_data(cls):
+    def _clean_document(self):
         """Remove unnecessary tags to prevent false positive results"""
         selectors_to_remove = [
             '[title="Oxford Collocations Dictionary"]',
@@ -123,19 +171,18 @@ class OxfordDictionary:
         
         for selector in selectors_to_remove:
             try:
-                for tag in cls.soup_data.select(selector):
+                for tag in self.document.select(selector):
                     tag.decompose()
             except:
                 pass
     
-    @classmethod
-    def _get_name(cls):
+    def _get_name(self):
         """Get the word name"""
-        if cls.soup_data is None:
+        if self.document is None:
             return None
         
         try:
-            name = cls.soup_data.select(cls.title_selector)[0]
+            name = self.document.select(self.title_selector)[0]
             # Remove span tags but keep text
             for span_tag in name.select('span'):
                 span_tag.replace_with('')
@@ -143,28 +190,26 @@ class OxfordDictionary:
         except (IndexError, AttributeError):
             return None
     
-    @classmethod
-    def _get_wordform(cls):
+    def _get_wordform(self):
         """Get word form (noun, verb, adjective, etc.)"""
-        if cls.soup_data is None:
+        if self.document is None:
             return None
         
         try:
-            return cls.soup_data.select(cls.wordform_selector)[0].text.strip()
+            return self.document.select(self.wordform_selector)[0].text.strip()
         except (IndexError, AttributeError):
             return None
     
-    @classmethod
-    def _get_pronunciations(cls):
+    def _get_pronunciations(self):
         """Get pronunciation information"""
-        if cls.soup_data is None:
+        if self.document is None:
             return None
         
         pronunciations = {}
         
         try:
             # British pronunciation
-            br_phon = cls.soup_data.select(cls.br_pronounce_selector)
+            br_phon = self.document.select(self.br_pronounce_selector)
             if br_phon:
                 pronunciations['british'] = br_phon[0].text.strip()
         except (IndexError, AttributeError):
@@ -172,7 +217,7 @@ class OxfordDictionary:
         
         try:
             # American pronunciation
-            am_phon = cls.soup_data.select(cls.am_pronounce_selector)
+            am_phon = self.document.select(self.am_pronounce_selector)
             if am_phon:
                 pronunciations['american'] = am_phon[0].text.strip()
         except (IndexError, AttributeError):
@@ -180,17 +225,16 @@ class OxfordDictionary:
         
         return pronunciations if pronunciations else None
     
-    @classmethod
-    def _get_audio_urls(cls):
+    def _get_audio_urls(self):
         """Get audio URLs for pronunciation"""
-        if cls.soup_data is None:
+        if self.document is None:
             return None
         
         audio_urls = {}
         
         try:
             # British audio
-            br_audio = cls.soup_data.select(cls.br_pronounce_audio_mp3_selector)
+            br_audio = self.document.select(self.br_pronounce_audio_mp3_selector)
             if br_audio and 'data-src-mp3' in br_audio[0].attrs:
                 audio_urls['british'] = br_audio[0].attrs['data-src-mp3']
         except (IndexError, AttributeError):
@@ -198,7 +242,7 @@ class OxfordDictionary:
         
         try:
             # American audio
-            am_audio = cls.soup_data.select(cls.am_pronounce_audio_mp3_selector)
+            am_audio = self.document.select(self.am_pronounce_audio_mp3_selector)
             if am_audio and 'data-src-mp3' in am_audio[0].attrs:
                 audio_urls['american'] = am_audio[0].attrs['data-src-mp3']
         except (IndexError, AttributeError):
@@ -206,17 +250,16 @@ class OxfordDictionary:
         
         return audio_urls if audio_urls else None
     
-    @classmethod
-    def _get_definitions_full(cls):
+    def _get_definitions_full(self):
         """Get comprehensive definitions with examples"""
-        if cls.soup_data is None:
+        if self.document is None:
             return None
         
         definitions = []
         
         try:
             # Try multiple definition selectors
-            definition_tags = cls.soup_data.select('.sense')
+            definition_tags = self.document.select('.sense')
             
             for def_tag in definition_tags:
                 definition_info = {}
@@ -260,15 +303,14 @@ class OxfordDictionary:
         
         return definitions if definitions else None
     
-    @classmethod
-    def _get_examples(cls):
+    def _get_examples(self):
         """Get all examples (simple list)"""
-        if cls.soup_data is None:
+        if self.document is None:
             return None
         
         examples = []
         try:
-            example_tags = cls.soup_data.select(cls.examples_selector)
+            example_tags = self.document.select(self.examples_selector)
             for tag in example_tags:
                 examples.append(tag.text.strip())
         except (IndexError, AttributeError):
@@ -277,6 +319,121 @@ class OxfordDictionary:
         return examples if examples else None
 
 
+class OxfordDictionary:
+    """Oxford Learner's Dictionary API for retrieving word information"""
+    
+    base_url = 'https://www.oxfordlearnersdictionaries.com'
+    
+    @classmethod
+    def get_url(cls, word, is_search=True):
+        """Get URL for word definition"""
+        if is_search:
+            baseurl = cls.base_url + '/search/english/?q='
+        else:
+            baseurl = cls.base_url + '/definition/english/'
+        return baseurl + word.replace(" ", "-").lower()
+    
+    @classmethod
+    def get_word_info(cls, word):
+        """
+        Get comprehensive word information from Oxford Learner's Dictionary,
+        using the lookup cache if one is set
+        
+        Args:
+            word: The word to look up
+            
+        Returns:
+            WordInfo record or None if not found
+        """
+        cache = _cache
+        key = normalize_key(word)
+        if cache is not None:
+            cached = cache.get(key)
+            # Empty records cached before they were rejected are fetched again
+            if cached is not MISS and (cached is None or not is_empty(cached)):
+                return WordInfo.from_dict(cached) if cached is not None else None
+        
+        try:
+            word_info = cls._fetch_word_info(word)
+        except WordNotFound as e:
+            print(f"Error looking up '{word}': {e}")
+            if cache is not None:
+                cache.set_missing(key)
+            return None
+        except requests.RequestException as e:
+            print(f"Network error looking up '{word}': {e}")
+            return None
+        except Exception as e:
+            print(f"Error looking up '{word}': {e}")
+            return None
+        
+        if is_empty(word_info):
+            # Not an entry page (e.g. a captcha or maintenance page); don't
+            # cache it, so the word is looked up again next time
+            print(f"Error looking up '{word}': the page has no dictionary entry")
+            return None
+        if cache is not None:
+            cache.set(key, word_info.as_dict())
+        return word_info
+    
+    @classmethod
+    def _fetch_word_info(cls, word):
+        """
+        Download and parse the dictionary page for a word
+        
+        Raises:
+            WordNotFound: If the dictionary has no entry for the word
+        """
+        # First try direct search
+        word_to_search = word.replace(" ", "-").lower()
+        page_html = transport.get(cls.get_url(word_to_search), step='oxford.fetch')
+        content = page_html.content
+        
+        if page_html.status_code == 404:
+            raise WordNotFound(f"Word '{word}' not found")
+        if page_html.status_code != 200:
+            # transport hands back 429/5xx responses once its retries are
+            # used up; their error pages must not be parsed (or cached)
+            raise requests.HTTPError(
+                f"HTTP {page_html.status_code} looking up '{word}'", response=page_html)
+        
+        with timed('oxford.parse'):
+            pool = _parse_pool
+            if pool is None:
+                return cls.parse_page(content, word)
+            word_info = pool.parse(content, get_parser())
+        if word_info is None:
+            raise WordNotFound(f"No exact match found for '{word}'")
+        return WordInfo.from_dict(word_info)
+    
+    @classmethod
+    def parse_page(cls, content, word="", parser=None):
+        """
+        Extract word information from a downloaded dictionary page
+        
+        Args:
+            content: Raw HTML of the page
+            word: The word that was looked up (for error messages)
+            parser: 'lxml' or 'html.parser' (defaults to the one set with set_parser)
+            
+        Returns:
+            WordInfo record
+            
+        Raises:
+            WordNotFound: If the page says there is no exact match
+        """
+        if (parser or get_parser()) == 'lxml':
+            word_info = oxford_lxml.parse_page(content)
+            if word_info is None:
+                raise WordNotFound(f"No exact match found for '{word}'")
+            return WordInfo.from_dict(word_info)
+        
+        page = OxfordPageParser(content)
+        if page.is_no_exact_match():
+            raise WordNotFound(f"No exact match found for '{word}'")
+        return page.parse()
+
+
 def lookup_oxford_dictionary(word, max_definitions=3, max_examples_per_def=2):
     """
     Main function to lookup a word in Oxford Learner's Dictionary
@@ -290,7 +447,11 @@ def lookup_oxford_dictionary(word, max_definitions=3, max_examples_per_def=2):
         Dictionary with formatted word information
     """
     try:
-        word_info = OxfordDictionary.get_word_info(word)
+        dictionary = _dictionary
+        if dictionary is not None:
+            word_info = dictionary.get_word_info(word)
+        else:
+            word_info = OxfordDictionary.get_word_info(word)
         
         if not word_info:
             return None
@@ -353,7 +514,7 @@ def download_audio_file(audio_url, word, media_folder):
     
     Args:
         audio_url: URL of the audio file
-        word: Word for naming the file
+        word: Word the audio belongs to (for error messages)
         media_folder: Path to Anki's media folder
         
     Returns:
@@ -363,28 +524,15 @@ def download_audio_file(audio_url, word, media_folder):
         return None
     
     try:
-        # Create safe filename
-        safe_word = "".join(c for c in word if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        filename = f"{safe_word}_oxford.mp3"
+        filename = media_filename(audio_url)
         filepath = os.path.join(media_folder, filename)
         
         # Don't download if file already exists
         if os.path.exists(filepath):
             return filename
         
-        # Download the audio file
-        req = requests.Session()
-        req.cookies.set_policy(BlockAll())
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        
-        response = req.get(audio_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        # Save to media folder
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
+        # Stream the audio file into the media folder
+        download_to_file(audio_url, filepath)
         
         return filename
         
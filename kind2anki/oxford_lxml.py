@@ -0,0 +1,207 @@
+# Fast lxml-based parser for Oxford Learner's Dictionary pages
+# Produces the same word_info dictionary as the BeautifulSoup parser in
+# oxford_dictionary.py, but only parses the #entryContent part of the page
+# and collects every field in a single pass over the tree.
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+# Boxes removed before extraction to prevent false positive results
+REMOVED_TITLES = frozenset([
+    'Oxford Collocations Dictionary',
+    'British/American',
+    'Express Yourself',
+    'Collocations',
+    'Word Origin',
+])
+
+ENTRY_MARKER = b'id="entryContent"'
+
+
+def is_available():
+    return lxml is not None
+
+
+def _text(element, skip_spans=False):
+    """
+    Get the text of an element, leaving out removed boxes and comments
+    (and nested <span> tags if skip_spans is set, like the headword)
+    """
+    parts = [element.text or '']
+    for child in element:
+        if isinstance(child.tag, str) and child.get('title') not in REMOVED_TITLES \
+                and not (skip_spans and child.tag == 'span'):
+            parts.append(_text(child, skip_spans))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+def _is_no_exact_match(root):
+    for h1 in root.iterfind('.//h1'):
+        parent = h1.getparent()
+        if parent is not None and parent.get('id') == 'search-results':
+            # Matches BeautifulSoup's .string, which is only set for
+            # headings with a single text child
+            if len(h1) == 0 and (h1.text or '').startswith('No exact match found'):
+                return True
+    return False
+
+
+class _Sense:
+    __slots__ = ('depth', 'info', 'examples', 'has_grammar', 'has_labels')
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.info = {}
+        self.examples = []
+        self.has_grammar = False
+        self.has_labels = False
+
+
+def _extract(entry):
+    """Walk the entry content once and collect every field"""
+    result = {
+        'name': None,
+        'wordform': None,
+        'pronunciations': {},
+        'definitions': [],
+        'examples': [],
+        'audio_urls': {},
+    }
+    senses = []        # every .sense in document order
+    open_senses = []   # .sense elements enclosing the current node
+    open_examples = [] # (depth, counts_for_flat_list) for enclosing .examples
+    state = {'top': 0, 'multiple': 0, 'geo': []}
+
+    def walk(element, depth, parent_is_multiple_sense):
+        if not isinstance(element.tag, str):
+            return
+        if element.get('title') in REMOVED_TITLES:
+            return
+
+        classes = element.get('class', '').split()
+        geo = element.get('geo')
+        is_top = 'top-container' in classes
+        is_multiple = 'senses_multiple' in classes
+        is_sense = 'sense' in classes
+        is_examples = 'examples' in classes
+
+        if state['top']:
+            if 'headword' in classes and result['name'] is None:
+                result['name'] = _text(element, skip_spans=True).strip()
+            if 'pos' in classes and result['wordform'] is None:
+                result['wordform'] = _text(element).strip()
+
+        geos = state['geo']
+        if 'phon' in classes:
+            for geo_value, key in (('br', 'british'), ('n_am', 'american')):
+                if geo_value in geos and key not in result['pronunciations']:
+                    result['pronunciations'][key] = _text(element).strip()
+        if element.get('data-src-mp3') is not None:
+            for geo_value, key in (('br', 'british'), ('n_am', 'american')):
+                if geo_value in geos and key not in result['audio_urls']:
+                    result['audio_urls'][key] = element.get('data-src-mp3')
+
+        if open_senses:
+            if 'def' in classes:
+                text = None
+                for sense in open_senses:
+                    if 'definition' not in sense.info:
+                        text = _text(element).strip() if text is None else text
+                        sense.info['definition'] = text
+            if 'grammar' in classes:
+                for sense in open_senses:
+                    if not sense.has_grammar:
+                        sense.has_grammar = True
+                        sense.info['grammar'] = _text(element).strip()
+            if 'labels' in classes:
+                for sense in open_senses:
+                    if not sense.has_labels:
+                        sense.has_labels = True
+                        sense.info['labels'] = _text(element).strip()
+            if 'x' in classes and open_examples:
+                text = _text(element).strip()
+                for sense in open_senses:
+                    if any(ex_depth > sense.depth for ex_depth, _ in open_examples):
+                        sense.examples.append(text)
+                if any(flat for _, flat in open_examples):
+                    result['examples'].append(text)
+
+        if is_top:
+            state['top'] += 1
+        if is_multiple:
+            state['multiple'] += 1
+        if geo is not None:
+            state['geo'].append(geo)
+        if is_sense:
+            sense = _Sense(depth)
+            senses.append(sense)
+            open_senses.append(sense)
+        if is_examples:
+            open_examples.append((depth, parent_is_multiple_sense))
+
+        child_is_multiple_sense = is_sense and state['multiple'] > 0
+        for child in element:
+            walk(child, depth + 1, child_is_multiple_sense)
+
+        if is_examples:
+            open_examples.pop()
+        if is_sense:
+            open_senses.pop()
+        if geo is not None:
+            state['geo'].pop()
+        if is_multiple:
+            state['multiple'] -= 1
+        if is_top:
+            state['top'] -= 1
+
+    walk(entry, 0, False)
+
+    for sense in senses:
+        if 'definition' not in sense.info:
+            continue
+        info = sense.info
+        ordered = {'definition': info['definition']}
+        if 'grammar' in info:
+            ordered['grammar'] = info['grammar']
+        if 'labels' in info:
+            ordered['labels'] = info['labels']
+        if sense.examples:
+            ordered['examples'] = sense.examples
+        result['definitions'].append(ordered)
+
+    return {key: value or None if key not in ('name', 'wordform') else value
+            for key, value in result.items()}
+
+
+def parse_page(content):
+    """
+    Parse an Oxford dictionary page
+
+    Args:
+        content: Raw HTML bytes of the page
+
+    Returns:
+        word_info dictionary, or None if the page says "No exact match found"
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+
+    marker = content.find(ENTRY_MARKER)
+    if marker < 0:
+        # Search result pages have no entry; parse them fully to find out why
+        root = lxml.html.document_fromstring(content)
+        if _is_no_exact_match(root):
+            return None
+        return _extract(root)
+
+    # Only parse from the opening tag of #entryContent onwards; lxml closes
+    # the unterminated ancestors itself
+    start = content.rfind(b'<', 0, marker)
+    parser = etree.HTMLParser(encoding='utf-8', remove_comments=True)
+    root = etree.fromstring(b'<html><body>' + content[start:], parser)
+    entry = root.find('.//*[@id="entryContent"]')
+    return _extract(entry if entry is not None else root)
@@ -0,0 +1,75 @@
+# Process pool for parsing dictionary pages
+# Downloads are I/O bound and run on the enrichment threads, but parsing a
+# page is CPU bound and the GIL lets only one thread parse at a time. With a
+# ParsePool the fetching threads hand the raw HTML to worker processes and
+# wait for a compact result record, so parsing uses every CPU core.
+#
+# The workers are started with the "spawn" method (forking a process that
+# runs threads is unsafe), so they only cost their start-up time once per
+# pool. Inside Anki the pool is off by default: there the interpreter that
+# would be spawned is Anki itself.
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def parse_record(content, parser):
+    """
+    Parse one dictionary page (runs in a worker process)
+
+    Returns:
+        WordInfo fields as a dictionary, or None if the page has no entry
+    """
+    from .oxford_dictionary import OxfordDictionary, WordNotFound
+    try:
+        return OxfordDictionary.parse_page(content, parser=parser).as_dict()
+    except WordNotFound:
+        return None
+
+
+def _warm_up():
+    # Import the parsers while the pool starts instead of on the first page
+    from . import oxford_dictionary  # noqa: F401
+
+
+def resolve_workers(workers):
+    """Turn a worker count setting ('auto', 0 or a number) into a number"""
+    if workers == 'auto':
+        return os.cpu_count() or 1
+    return max(0, int(workers or 0))
+
+
+class ParsePool:
+    """Parse dictionary pages on a pool of worker processes"""
+
+    def __init__(self, workers):
+        """
+        Args:
+            workers: Number of worker processes
+        """
+        self.workers = max(1, workers)
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"))
+        # Start the workers now, so the first pages don't wait for them
+        for future in [self._pool.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+
+    def parse(self, content, parser):
+        """
+        Parse a page in a worker process; only the calling thread waits for
+        the result, the other threads keep downloading
+
+        Returns:
+            Same as parse_record
+        """
+        return self._pool.submit(parse_record, content, parser).result()
+
+    def map(self, contents, parser, chunksize=1):
+        """Parse several pages, returning the records in order"""
+        return list(self._pool.map(parse_record, contents,
+                                   [parser] * len(contents), chunksize=chunksize))
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
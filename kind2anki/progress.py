@@ -0,0 +1,94 @@
+# Progress reporting for Kind2Anki
+# KindleImporter reports structured progress events (stage, items done out
+# of total, throughput, ETA and cache hits) to a callback, which the add-on
+# forwards to Anki's progress bar.
+
+import threading
+import time
+from typing import NamedTuple, Optional
+
+
+STAGE_LABELS = {
+    'read': "Reading vocab.db",
+    'enrich': "Looking up words",
+    'audio': "Downloading audio",
+}
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return "{}:{:02d}".format(seconds // 60, seconds % 60)
+
+
+class ProgressEvent(NamedTuple):
+    stage: str
+    done: int
+    total: Optional[int]
+    rate: float                 # items per second since the stage started
+    eta: Optional[float]        # seconds left, None if unknown
+    cache_hits: int = 0
+
+    def label(self):
+        """Human readable description, e.g. for the progress dialog"""
+        text = STAGE_LABELS.get(self.stage, self.stage)
+        if self.total:
+            text += ": {}/{}".format(self.done, self.total)
+        else:
+            text += ": {}".format(self.done)
+        details = ["{:.1f}/s".format(self.rate)]
+        if self.eta is not None:
+            details.append("ETA " + format_duration(self.eta))
+        if self.cache_hits:
+            details.append("{} cache hits".format(self.cache_hits))
+        return "{} ({})".format(text, ", ".join(details))
+
+
+class ProgressReporter:
+    """
+    Turn stage counters into ProgressEvents for a callback, sending at most
+    one event per min_interval seconds (except for the first and last ones)
+    """
+
+    def __init__(self, callback=None, min_interval=0.25, cache_hits=None):
+        """
+        Args:
+            callback: Function called with each ProgressEvent (None to disable)
+            min_interval: Minimum seconds between two events
+            cache_hits: Function returning the number of cache hits so far
+        """
+        self.callback = callback
+        self.min_interval = min_interval
+        self.cache_hits = cache_hits
+        self._lock = threading.Lock()
+        self._started = {}
+        self._last_sent = 0.0
+        self.last_event = None
+
+    def update(self, stage, done, total=None, force=False):
+        """
+        Report the progress of a stage
+
+        Args:
+            stage: 'read', 'enrich' or 'audio'
+            done: Items finished so far
+            total: Total number of items, if known
+            force: Send the event even if the last one was sent just now
+        """
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            started = self._started.setdefault(stage, now)
+            if not force and done and now - self._last_sent < self.min_interval:
+                return
+            self._last_sent = now
+
+        elapsed = now - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if total is not None and rate > 0:
+            eta = max(0, total - done) / rate
+        cache_hits = self.cache_hits() if self.cache_hits is not None else 0
+        event = ProgressEvent(stage, done, total, rate, eta, cache_hits)
+        self.last_event = event
+        self.callback(event)
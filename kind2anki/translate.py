@@ -8,10 +8,12 @@ https://github.com/sloria/TextBlob/blob/dev/textblob/translate.py
 Adapted from Terry Yin's google-translate-python.
 Language detection added by Steven Loria.
 """
-import ctypes
+import functools
 import json
-from urllib import request
-from urllib.parse import urlencode
+import threading
+
+from . import transport
+from .cache import MISS, MemoryLRU, PersistentCache, TieredCache
 
 
 class TranslatorError(Exception):
@@ -37,7 +39,84 @@ headers = {
 }
 
 
+class TranslationCache(object):
+    """Disk-backed translation cache with an in-memory LRU in front of it.
+
+    Every (source language, target language) pair gets its own namespace
+    in the cache file. Texts the translator returned unchanged are cached
+    as negative entries, so they raise NotTranslated without a request.
+    """
+
+    def __init__(self, path, memory_entries=10000, ttl=90 * 24 * 3600,
+                 negative_ttl=7 * 24 * 3600, max_entries=200000):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def namespace(self, from_lang, to_lang):
+        """Get the tiered cache for one language pair"""
+        name = 'translate:{}:{}'.format(from_lang, to_lang)
+        with self._lock:
+            if name not in self._namespaces:
+                disk = PersistentCache(self.path, namespace=name, ttl=self.ttl,
+                                       negative_ttl=self.negative_ttl,
+                                       max_entries=self.max_entries)
+                self._namespaces[name] = TieredCache(MemoryLRU(self.memory_entries), disk)
+            return self._namespaces[name]
+
+    def stats(self):
+        """Counters summed over all language pairs"""
+        totals = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'memory_hits': 0}
+        with self._lock:
+            caches = list(self._namespaces.values())
+        for cache in caches:
+            for key, value in cache.stats().items():
+                totals[key] += value
+        return totals
+
+
+_cache = None
+
+
+def set_cache(cache):
+    """Use a TranslationCache for translations (None disables caching)"""
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    return _cache
+
+
+def _cache_key(source):
+    return ' '.join(source.split())
+
+
 def translate(source, from_lang='auto', to_lang='en', host=None, type_=None):
+    cache = _cache.namespace(from_lang, to_lang) if _cache is not None else None
+    if cache is not None:
+        cached = cache.get(_cache_key(source))
+        if cached is not MISS:
+            if cached is None:
+                raise NotTranslated('Translation API returned the input string unchanged.')
+            return cached
+
+    try:
+        result = _translate(source, from_lang, to_lang, host, type_)
+    except NotTranslated:
+        if cache is not None:
+            cache.set_missing(_cache_key(source))
+        raise
+    if cache is not None:
+        cache.set(_cache_key(source), result)
+    return result
+
+
+def _translate(source, from_lang='auto', to_lang='en', host=None, type_=None):
     data = {"q": source}
     url = u'{url}&sl={from_lang}&tl={to_lang}&hl={to_lang}&tk={tk}'.format(
         url=_base_url,
@@ -62,6 +141,93 @@ def translate(source, from_lang='auto', to_lang='en', host=None, type_=None):
     _validate_translation(source, result)
     return result
 
+# Limits for packing several words into one request
+BATCH_DELIMITER = '\n'
+MAX_BATCH_CHARS = 4500
+MAX_BATCH_ITEMS = 100
+
+
+def translate_batch(words, from_lang='auto', to_lang='en', host=None, type_=None,
+                    max_chars=MAX_BATCH_CHARS, max_items=MAX_BATCH_ITEMS):
+    """Translate many words with as few requests as possible.
+
+    Words are joined with newlines into payloads of at most max_items words
+    and max_chars characters, and the translated text is split back into
+    lines. If a response doesn't split into one line per word, the words of
+    that payload are translated one by one instead. Words found in the
+    translation cache are not sent at all.
+
+    Returns a list with the translation of each word, or None for words
+    that could not be translated.
+    """
+    # Line breaks inside a word would break the splitting
+    sources = [' '.join(word.split()) for word in words]
+    results = [None] * len(sources)
+    cache = _cache.namespace(from_lang, to_lang) if _cache is not None else None
+
+    # Only words that aren't cached are sent
+    pending = []
+    for i, source in enumerate(sources):
+        cached = cache.get(source) if cache is not None else MISS
+        if cached is MISS:
+            pending.append(i)
+        else:
+            results[i] = cached
+
+    for batch in _make_batches([sources[i] for i in pending], max_chars, max_items):
+        batch = [pending[j] for j in batch]
+        parts = None
+        if len(batch) > 1:
+            try:
+                joined = BATCH_DELIMITER.join(sources[i] for i in batch)
+                parts = _translate(joined, from_lang, to_lang, host, type_).split(BATCH_DELIMITER)
+            except Exception:
+                parts = None
+
+        if parts is not None and len(parts) == len(batch):
+            for i, part in zip(batch, parts):
+                part = part.strip()
+                if part and part != sources[i].strip():
+                    results[i] = part
+                    if cache is not None:
+                        cache.set(sources[i], part)
+                elif cache is not None:
+                    cache.set_missing(sources[i])
+            continue
+
+        # Mismatch or failure: fall back to one request per word
+        for i in batch:
+            try:
+                results[i] = _translate(sources[i], from_lang, to_lang, host, type_)
+                if cache is not None:
+                    cache.set(sources[i], results[i])
+            except NotTranslated:
+                results[i] = None
+                if cache is not None:
+                    cache.set_missing(sources[i])
+            except Exception:
+                results[i] = None
+
+    return results
+
+
+def _make_batches(sources, max_chars, max_items):
+    """Group word indices into batches that respect the size limits"""
+    batch = []
+    size = 0
+    for i, source in enumerate(sources):
+        extra = len(source) + (len(BATCH_DELIMITER) if batch else 0)
+        if batch and (len(batch) >= max_items or size + extra > max_chars):
+            yield batch
+            batch = []
+            size = 0
+            extra = len(source)
+        batch.append(i)
+        size += extra
+    if batch:
+        yield batch
+
+
 def _validate_translation(source, result):
     """Validate API returned expected schema, and that the translated text
     is different than the original string.
@@ -72,40 +238,57 @@ def _validate_translation(source, result):
         raise NotTranslated('Translation API returned the input string unchanged.')
 
 def _request(url, host=None, type_=None, data=None):
-    encoded_data = urlencode(data).encode('utf-8')
-    req = request.Request(url=url, headers=headers, data=encoded_data)
-    if host or type_:
-        req.set_proxy(host=host, type=type_)
-    resp = request.urlopen(req)
-    content = resp.read()
-    return content.decode('utf-8')
+    proxies = None
+    if host:
+        proxy = '{}://{}'.format(type_ or 'http', host)
+        proxies = {'http': proxy, 'https': proxy}
+    resp = transport.post(url, headers=headers, data=data, proxies=proxies, step='translate.request')
+    resp.raise_for_status()
+    return resp.content.decode('utf-8')
 
 
+_MASK = 0xFFFFFFFF
+_TKK = (406398, 561666268 + 1526272306)
+
+
+def _compile_ops(ops):
+    """Decode an operation string like "+-a^+6" into (add, shift_right, amount) steps"""
+    steps = []
+    for c in range(0, len(ops) - 2, 3):
+        amount = ops[c + 2]
+        amount = ord(amount) - 87 if amount >= 'a' else int(amount)
+        steps.append((ops[c] == '+', ops[c + 1] == '+', amount))
+    return tuple(steps)
+
+
+_BYTE_OPS = _compile_ops("+-a^+6")
+_FINAL_OPS = _compile_ops("+-3^+b+-f")
+
+
+def _rl(a, steps):
+    """Apply decoded operations to a (all arithmetic on unsigned 32-bit ints)"""
+    for add, shift_right, amount in steps:
+        d = a >> amount if shift_right else (a << amount) & _MASK
+        a = (a + d) & _MASK if add else a ^ d
+    return a
+
+
+@functools.lru_cache(maxsize=4096)
 def _calculate_tk(source):
     """Reverse engineered cross-site request protection."""
     # Source: https://github.com/soimort/translate-shell/issues/94#issuecomment-165433715
     # Source: http://www.liuxiatool.com/t.php
 
-    tkk = [406398, 561666268 + 1526272306]
-    b = tkk[0]
-    d = source.encode('utf-8')
-
-    def RL(a, b):
-        for c in range(0, len(b) - 2, 3):
-            d = b[c + 2]
-            d = ord(d) - 87 if d >= 'a' else int(d)
-            xa = ctypes.c_uint32(a).value
-            d = xa >> d if b[c + 1] == '+' else xa << d
-            a = a + d & 4294967295 if b[c] == '+' else a ^ d
-        return ctypes.c_int32(a).value
-
+    b = _TKK[0]
     a = b
+    for di in source.encode('utf-8'):
+        a = _rl((a + di) & _MASK, _BYTE_OPS)
 
-    for di in d:
-        a = RL(a + di, "+-a^+6")
-
-    a = RL(a, "+-3^+b+-f")
-    a ^= tkk[1]
+    a = _rl(a, _FINAL_OPS)
+    # Back to a signed 32-bit value before mixing in the key
+    if a & 0x80000000:
+        a -= 0x100000000
+    a ^= _TKK[1]
     a = a if a >= 0 else ((a & 2147483647) + 2147483648)
     a %= pow(10, 6)
 
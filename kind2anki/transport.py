@@ -0,0 +1,205 @@
+# Shared HTTP transport for Kind2Anki
+# One pooled requests.Session is used for Oxford pages, audio files and
+# translations, so connections (and their TLS handshakes) are reused across
+# words instead of being opened again for every request.
+
+import threading
+from http import cookiejar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from .cancellation import raise_if_cancelled
+from .enrichment import throttle
+from .instrumentation import timed
+
+
+DEFAULT_TIMEOUT = 10
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+
+
+class BlockAll(cookiejar.CookiePolicy):
+    """Policy to block cookies"""
+    return_ok = set_ok = domain_return_ok = path_return_ok = lambda self, *args: False
+    netscape = True
+    rfc2965 = hide_cookie2 = False
+
+
+class TransportStats:
+    """Counters showing how well connections are reused"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.connections = 0
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'connections': self.connections,
+                'reused': max(0, self.requests - self.connections),
+            }
+
+
+stats = TransportStats()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        stats.count_connection()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        stats.count_connection()
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter that records requests and newly opened connections"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        stats.count_request()
+        return super().send(request, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+_settings = {
+    'pool_connections': 10,
+    'pool_maxsize': 10,
+    'retries': 3,
+    'backoff_factor': 0.5,
+    'timeout': DEFAULT_TIMEOUT,
+}
+
+
+# Cancellation token of the running import (None when nothing can cancel)
+_cancel_token = None
+
+
+def set_cancel_token(token):
+    """
+    Make every request check a CancellationToken: requests not sent yet and
+    rate limiter waits raise Cancelled once it is cancelled
+    """
+    global _cancel_token
+    _cancel_token = token
+
+
+def check_cancelled():
+    """Raise Cancelled if the running import was cancelled"""
+    raise_if_cancelled(_cancel_token)
+
+
+def configure(**settings):
+    """
+    Change the transport settings; the shared session is rebuilt on next use
+
+    Args:
+        pool_connections: Number of hosts to keep connection pools for
+        pool_maxsize: Connections kept open per host (match the concurrency)
+        retries: Retries for connection errors and 429/5xx responses
+        backoff_factor: Exponential backoff between retries, in seconds
+        timeout: Default request timeout, in seconds
+    """
+    global _session
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise TypeError(f"Unknown transport settings: {sorted(unknown)}")
+    with _session_lock:
+        _settings.update(settings)
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _create_session():
+    session = requests.Session()
+    session.cookies.set_policy(BlockAll())
+    session.headers['User-Agent'] = USER_AGENT
+    retry = Retry(
+        total=_settings['retries'],
+        backoff_factor=_settings['backoff_factor'],
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'POST']),
+        raise_on_status=False,
+    )
+    adapter = PooledAdapter(
+        pool_connections=_settings['pool_connections'],
+        pool_maxsize=_settings['pool_maxsize'],
+        max_retries=retry,
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """Get the shared, connection pooling session"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _create_session()
+        return _session
+
+
+def request(method, url, step=None, **kwargs):
+    """
+    Send a request through the shared session, respecting the rate limiter
+
+    Accepts the same keyword arguments as requests.Session.request; the
+    default timeout from configure() is used unless one is given. The wait
+    for the rate limiter is timed as 'throttle.wait', the request itself
+    (without that wait) as step, if one is given.
+    """
+    kwargs.setdefault('timeout', _settings['timeout'])
+    cancel = _cancel_token
+    raise_if_cancelled(cancel)
+    with timed('throttle.wait'):
+        throttle(url, cancel)
+    if step is None:
+        return get_session().request(method, url, **kwargs)
+    with timed(step):
+        return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def close():
+    """Close all pooled connections"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
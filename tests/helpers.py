@@ -0,0 +1,30 @@
+# Helpers shared by the test modules (imported with tests/ on sys.path)
+import sqlite3
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        pass
+
+
+def make_vocab_db(path, words, lookups, books):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE WORDS (id TEXT PRIMARY KEY NOT NULL, word TEXT, stem TEXT,
+                            lang TEXT, category INTEGER DEFAULT 0,
+                            timestamp INTEGER DEFAULT 0, profileid TEXT);
+        CREATE TABLE LOOKUPS (id TEXT PRIMARY KEY NOT NULL, word_key TEXT,
+                              book_key TEXT, dict_key TEXT, pos TEXT, usage TEXT,
+                              timestamp INTEGER DEFAULT 0);
+        CREATE TABLE BOOK_INFO (id TEXT PRIMARY KEY NOT NULL, asin TEXT, guid TEXT,
+                                lang TEXT, title TEXT, authors TEXT);
+    """)
+    conn.executemany("INSERT INTO WORDS (id, word, stem, lang, timestamp) VALUES (?, ?, ?, ?, ?)", words)
+    conn.executemany("INSERT INTO LOOKUPS (id, word_key, book_key, usage) VALUES (?, ?, ?, ?)", lookups)
+    conn.executemany("INSERT INTO BOOK_INFO (id, title) VALUES (?, ?)", books)
+    conn.commit()
+    conn.close()
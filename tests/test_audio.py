@@ -0,0 +1,161 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import transport
+from kind2anki.audio import AudioDownloader, media_filename
+from kind2anki.enrichment import set_rate_limiter
+from kind2anki.kindleimporter import KindleImporter
+
+
+class AudioHandler(BaseHTTPRequestHandler):
+    """Serves a slow 200 KiB "mp3" for every path, 404 for /missing.mp3"""
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    requests = []
+    active = 0
+    max_active = 0
+
+    def do_GET(self):
+        with AudioHandler.lock:
+            AudioHandler.requests.append(self.path)
+            AudioHandler.active += 1
+            AudioHandler.max_active = max(AudioHandler.max_active, AudioHandler.active)
+        try:
+            time.sleep(0.05)
+            if self.path == "/missing.mp3":
+                body, status = b"not found", 404
+            else:
+                body, status = self.path.encode("utf-8") * (200 * 1024 // len(self.path)), 200
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with AudioHandler.lock:
+                AudioHandler.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def audio_server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), AudioHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    set_rate_limiter(None)
+    AudioHandler.requests = []
+    AudioHandler.max_active = 0
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    transport.close()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_downloads_concurrently_and_deduplicates(audio_server, tmp_path):
+    downloader = AudioDownloader(str(tmp_path), concurrency=4)
+    filenames = [downloader.add(f"{audio_server}/word{i}.mp3") for i in range(12)]
+    # Same URL (e.g. for another form of the word) reuses the first file
+    assert downloader.add(f"{audio_server}/word0.mp3") == filenames[0]
+    downloader.wait()
+
+    assert sorted(AudioHandler.requests) == sorted(f"/word{i}.mp3" for i in range(12))
+    assert 1 < AudioHandler.max_active <= 4
+    for i, filename in enumerate(filenames):
+        assert filename == media_filename(f"{audio_server}/word{i}.mp3")
+        with open(tmp_path / filename, "rb") as f:
+            assert f.read(len(f"/word{i}.mp3")) == f"/word{i}.mp3".encode("utf-8")
+
+    stats = downloader.stats()
+    assert stats["downloaded"] == 12 and stats["failed"] == 0
+    assert stats["bytes"] == sum(os.path.getsize(tmp_path / name) for name in filenames)
+    assert stats["bytes_per_second"] > 0
+
+
+def test_failed_downloads_leave_no_files(audio_server, tmp_path):
+    present = media_filename(f"{audio_server}/present.mp3")
+    (tmp_path / present).write_bytes(b"old")
+    downloader = AudioDownloader(str(tmp_path), concurrency=2)
+    downloader.add(f"{audio_server}/missing.mp3")
+    downloader.add(f"{audio_server}/present.mp3")
+    downloader.wait()
+
+    assert os.listdir(tmp_path) == [present]
+    assert (tmp_path / present).read_bytes() == b"old"
+    stats = downloader.stats()
+    assert (stats["failed"], stats["existing"], stats["downloaded"]) == (1, 1, 0)
+
+
+def test_media_index_skips_known_urls(audio_server, tmp_path):
+    media = tmp_path / "media"
+    media.mkdir()
+    index_path = str(tmp_path / "media_index.db")
+    urls = [f"{audio_server}/a.mp3", f"{audio_server}/b.mp3"]
+
+    downloader = AudioDownloader(str(media), index_path=index_path)
+    filenames = [downloader.add(url) for url in urls]
+    downloader.close()
+    assert len(AudioHandler.requests) == 2
+
+    # A later import resolves both URLs from the index without downloading
+    downloader = AudioDownloader(str(media), index_path=index_path)
+    assert [downloader.add(url) for url in urls] == filenames
+    downloader.close()
+    assert len(AudioHandler.requests) == 2
+    assert downloader.stats()["existing"] == 2
+
+    # Another media folder (profile) has its own entries
+    other = tmp_path / "other"
+    other.mkdir()
+    downloader = AudioDownloader(str(other), index_path=index_path)
+    downloader.add(urls[0])
+    downloader.close()
+    assert len(AudioHandler.requests) == 3
+
+
+def test_files_deleted_from_media_folder_are_downloaded_again(audio_server, tmp_path):
+    media = tmp_path / "media"
+    media.mkdir()
+    index_path = str(tmp_path / "media_index.db")
+    urls = [f"{audio_server}/a.mp3", f"{audio_server}/b.mp3"]
+
+    downloader = AudioDownloader(str(media), index_path=index_path)
+    filenames = [downloader.add(url) for url in urls]
+    downloader.close()
+
+    # Check Media deleted one file and another one was truncated
+    os.remove(media / filenames[0])
+    with open(media / filenames[1], "wb") as f:
+        f.write(b"x")
+
+    downloader = AudioDownloader(str(media), index_path=index_path)
+    assert [downloader.add(url) for url in urls] == filenames
+    downloader.close()
+    assert len(AudioHandler.requests) == 4
+    assert downloader.stats()["existing"] == 0
+    assert (media / filenames[0]).stat().st_size > 1
+    assert (media / filenames[1]).stat().st_size > 1
+
+
+def test_cards_with_failed_audio_have_no_sound(audio_server, tmp_path):
+    def card(word):
+        return {"word": word, "word_key": f"en:{word}", "reading": "", "sentence": "",
+                "book_name": "Walden", "translated_definition": "", "dictionary_definition": "",
+                "oxford_data": {"audio_url": f"{audio_server}/{word}.mp3"}}
+
+    importer = KindleImporter(str(tmp_path / "vocab.db"), "pl", mediaFolder=str(tmp_path),
+                              mediaIndexPath=str(tmp_path / "media.db"), requestsPerSecond=None)
+    rows = list(importer.formatCards([card("serene"), card("missing"), card("placid")]))
+
+    assert [row[0] for row in rows] == ["serene", "missing", "placid"]
+    assert rows[0][4] == f"[sound:{media_filename(f'{audio_server}/serene.mp3')}]"
+    assert rows[1][4] == ""
+    assert os.path.exists(tmp_path / media_filename(f"{audio_server}/placid.mp3"))
+    assert list(importer.audioDownloader.errors) == [f"{audio_server}/missing.mp3"]
@@ -0,0 +1,92 @@
+import os
+import sys
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import cache as cache_module
+from kind2anki import oxford_dictionary
+from kind2anki.cache import MISS, MemoryLRU, PersistentCache, TieredCache
+from kind2anki.oxford_dictionary import OxfordDictionary, WordInfo, WordNotFound
+
+
+def test_cache_roundtrip_and_persistence(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = PersistentCache(path, namespace="oxford")
+    assert cache.get("serene") is MISS
+    cache.set("serene", {"name": "serene", "definitions": [{"definition": "calm"}]})
+    cache.close()
+
+    reopened = PersistentCache(path, namespace="oxford")
+    assert reopened.get("serene")["definitions"][0]["definition"] == "calm"
+    assert PersistentCache(path, namespace="other").get("serene") is MISS
+    assert reopened.stats() == {"hits": 1, "negative_hits": 0, "misses": 0}
+
+
+def test_cache_ttl_expiry(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = PersistentCache(str(tmp_path / "cache.db"), ttl=60, negative_ttl=10)
+    cache.set("serene", {"name": "serene"})
+    cache.set_missing("qwzx")
+
+    now[0] += 30
+    assert cache.get("serene") == {"name": "serene"}
+    assert cache.get("qwzx") is MISS
+    now[0] += 31
+    assert cache.get("serene") is MISS
+    assert len(cache) == 0
+
+
+def test_cache_lru_eviction(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = PersistentCache(str(tmp_path / "cache.db"), max_entries=2)
+    for key in ("a", "b"):
+        now[0] += 1
+        cache.set(key, key)
+    now[0] += 1
+    cache.get("a")  # "b" is now the least recently used entry
+    now[0] += 1
+    cache.set("c", "c")
+
+    assert len(cache) == 2
+    assert cache.get("b") is MISS
+    assert cache.get("a") == "a"
+
+
+def test_oxford_lookup_uses_cache(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_fetch(word):
+        calls.append(word)
+        if word == "qwzx":
+            raise WordNotFound(word)
+        return WordInfo(word, "adjective", None, None, None, None)
+
+    monkeypatch.setattr(OxfordDictionary, "_fetch_word_info", staticmethod(fake_fetch))
+    cache = PersistentCache(str(tmp_path / "cache.db"), namespace="oxford")
+    oxford_dictionary.set_cache(cache)
+    try:
+        for _ in range(3):
+            assert OxfordDictionary.get_word_info("Serene").wordform == "adjective"
+            assert OxfordDictionary.get_word_info("qwzx") is None
+    finally:
+        oxford_dictionary.set_cache(None)
+
+    assert calls == ["Serene", "qwzx"]
+    assert cache.stats() == {"hits": 2, "negative_hits": 2, "misses": 2}
+
+
+def test_memory_lru_in_front_of_disk(tmp_path):
+    disk = PersistentCache(str(tmp_path / "cache.db"))
+    tiered = TieredCache(MemoryLRU(max_entries=2), disk)
+    for key in ("a", "b", "c"):
+        tiered.set(key, key.upper())
+    tiered.set_missing("d")
+
+    assert len(tiered.memory) == 2
+    assert tiered.get("a") == "A"  # evicted from memory, found on disk
+    assert tiered.get("a") == "A"  # now served from memory
+    assert tiered.get("d") is None
+    assert tiered.get("e") is MISS
+    assert tiered.stats() == {"hits": 2, "negative_hits": 1, "misses": 1, "memory_hits": 1}
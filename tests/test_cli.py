@@ -0,0 +1,58 @@
+import csv
+import json
+import os
+import sys
+import time
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import instrumentation, translate
+from kind2anki.cli import FIELD_NAMES, main
+
+sys.path.insert(0, dir_path)
+from helpers import make_vocab_db
+
+
+def test_cli_writes_anki_import_file(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    make_vocab_db(
+        db_path,
+        words=[("en:serene", "serene", "serene", "en", now),
+               ("en:placid", "placid", "placid", "en", now)],
+        lookups=[("l1", "en:serene", "b1", "A serene lake, calm; still."),
+                 ("l2", "en:placid", "b1", "A placid river.")],
+        books=[("b1", "Walden")],
+    )
+    monkeypatch.setattr(translate, "_request", lambda url, host=None, type_=None, data=None:
+                        json.dumps([["\n".join("tak" for _ in data["q"].split("\n")), "en"]]))
+    output = str(tmp_path / "cards.csv")
+    report = str(tmp_path / "report.json")
+
+    assert main([db_path, "-o", output, "-l", "pl", "--days", "1", "--no-dictionary",
+                 "--no-cache", "--requests-per-second", "0", "-j", "2", "-q",
+                 "--ledger", str(tmp_path / "ledger.db"), "--report", report]) == 0
+    instrumentation.set_recorder(None)
+
+    with open(output, encoding="utf-8", newline="") as f:
+        lines = f.read().splitlines()
+    assert lines[:3] == ["#separator:comma", "#html:true", "#columns:" + ",".join(FIELD_NAMES)]
+    rows = list(csv.reader(lines[3:]))
+    assert sorted(row[0] for row in rows) == ["placid", "serene"]
+    assert all(len(row) == 9 and row[6] == "tak" for row in rows)
+    assert os.path.exists(report)
+    assert "aqt" not in sys.modules
+
+    # Words are only recorded in the ledger with --mark-imported
+    assert main([db_path, "-o", output, "--days", "1", "--no-dictionary", "--no-translate",
+                 "--no-cache", "-q", "--no-headers", "--mark-imported",
+                 "--ledger", str(tmp_path / "ledger.db")]) == 0
+    with open(output, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 2
+
+    # The ledger makes the next run incremental
+    assert main([db_path, "-o", output, "--days", "1", "--no-dictionary", "--no-translate",
+                 "--no-cache", "-q", "--no-headers",
+                 "--ledger", str(tmp_path / "ledger.db")]) == 0
+    with open(output, encoding="utf-8") as f:
+        assert f.read() == ""
@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.cancellation import CancellationToken, Cancelled
+from kind2anki.enrichment import RateLimiter, create_executor
+
+
+def slow_square(n):
+    time.sleep(0.05 if n % 2 else 0.01)
+    return n * n
+
+
+async def async_square(n):
+    import asyncio
+    await asyncio.sleep(0.05 if n % 2 else 0.01)
+    return n * n
+
+
+@pytest.mark.parametrize("kind", ["serial", "thread", "asyncio"])
+def test_executor_preserves_order(kind):
+    executor = create_executor(kind, concurrency=8)
+    assert list(executor.map(slow_square, range(20))) == [n * n for n in range(20)]
+
+
+def test_asyncio_executor_awaits_coroutines():
+    executor = create_executor("asyncio", concurrency=8)
+    assert list(executor.map(async_square, range(20))) == [n * n for n in range(20)]
+
+
+@pytest.mark.parametrize("kind", ["thread", "asyncio"])
+def test_executor_limits_concurrency(kind):
+    active = [0]
+    peak = [0]
+    lock = threading.Lock()
+
+    def work(n):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return n
+
+    start = time.perf_counter()
+    assert list(create_executor(kind, concurrency=4).map(work, range(40))) == list(range(40))
+    elapsed = time.perf_counter() - start
+
+    assert peak[0] == 4
+    assert elapsed < 40 * 0.02 / 2  # roughly latency * n / concurrency
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = RateLimiter(20)
+    start = time.perf_counter()
+    for _ in range(5):
+        limiter.acquire("https://www.oxfordlearnersdictionaries.com/search/english/?q=a")
+    limiter.acquire("http://translate.google.com/translate_a/t")
+    elapsed = time.perf_counter() - start
+
+    # 4 intervals of 50ms on the first host, the other host is not delayed
+    assert 0.18 < elapsed < 0.4
+
+
+@pytest.mark.parametrize("kind", ["thread", "asyncio"])
+def test_cancel_does_not_wait_for_stuck_items(kind):
+    token = CancellationToken()
+    release = threading.Event()
+
+    def stuck(n):
+        if n == 3:
+            token.cancel()
+        if n >= 2:
+            release.wait(5)
+        return n
+
+    executor = create_executor(kind, concurrency=4, cancel=token)
+    results = []
+    start = time.monotonic()
+    with pytest.raises(Cancelled):
+        for result in executor.map(stuck, range(20)):
+            results.append(result)
+    assert time.monotonic() - start < 2
+    # Items finished before the cancel may or may not have been yielded
+    assert results in ([], [0], [0, 1])
+    release.set()
+
+
+def test_rate_limiter_wait_is_cancellable():
+    token = CancellationToken()
+    limiter = RateLimiter(0.1)
+    limiter.acquire("http://example.com/a", token)
+    threading.Timer(0.1, token.cancel).start()
+    start = time.monotonic()
+    with pytest.raises(Cancelled):
+        limiter.acquire("http://example.com/b", token)
+    assert time.monotonic() - start < 2
@@ -0,0 +1,48 @@
+import json
+import os
+import sys
+import time
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import instrumentation
+from kind2anki.instrumentation import Recorder, percentile, set_recorder, timed
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([3], 0.9) == 3
+    assert percentile([], 0.5) is None
+
+
+def test_timed_is_a_no_op_when_disabled():
+    set_recorder(None)
+    with timed('step'):
+        pass
+    assert instrumentation.get_recorder() is None
+
+
+def test_report(tmp_path):
+    recorder = Recorder(profile=True)
+    set_recorder(recorder)
+    try:
+        with recorder.profiling():
+            for _ in range(10):
+                with timed('oxford.fetch'):
+                    time.sleep(0.001)
+            with timed('format'):
+                pass
+        path = recorder.write_report(str(tmp_path / "report.json"), extra={'words': 10})
+    finally:
+        set_recorder(None)
+
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    fetch = report['steps']['oxford.fetch']
+    assert fetch['count'] == 10 and fetch['p50'] >= 0.001
+    assert fetch['p50'] <= fetch['p90'] <= fetch['p99'] <= fetch['max']
+    assert report['steps']['format']['count'] == 1
+    assert report['words'] == 10
+    assert os.path.exists(report['profile'])
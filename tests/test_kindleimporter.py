@@ -0,0 +1,524 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import requests
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import instrumentation, oxford_dictionary, translate, transport
+from kind2anki.cancellation import CancellationToken
+from kind2anki.kindleimporter import KindleImporter
+
+sys.path.insert(0, dir_path)
+from helpers import FakeResponse, make_vocab_db
+
+FIXTURES = os.path.join(dir_path, "fixtures")
+
+
+def test_get_words_from_db(tmp_path):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    make_vocab_db(
+        db_path,
+        words=[
+            ("en:serene", "serene", "serene", "en", now),
+            ("en:lonely", "lonely", "lonely", None, now),
+            ("en:orphan", "orphan", "orphan", "en", now),
+            ("en:ancient", "ancient", "ancient", "en", 0),
+        ],
+        lookups=[
+            ("l1", "en:serene", "b1", "The lake was serene."),
+            ("l2", "en:serene", "b2", "A serene smile."),
+            ("l3", "en:lonely", "missing", "A lonely road."),
+            ("l4", "en:ancient", "b1", "An ancient city."),
+        ],
+        books=[("b1", "Walden"), ("b2", "Emma")],
+    )
+
+    importer = KindleImporter(db_path, "pl", importDays=1)
+    importer.getWordsFromDB()
+
+    assert sorted(importer.words) == ["lonely", "orphan", "serene"]
+    assert importer.sentences["en:serene"] == "The lake was serene."
+    assert importer.book_names["en:serene"] == "Walden"
+    assert importer.sentences["en:lonely"] == "A lonely road."
+    assert importer.book_names["en:lonely"] == "Unknown Book"
+    assert importer.langs["en:lonely"] == "en"
+    assert importer.sentences["en:orphan"] == ""
+    assert importer.book_names["en:orphan"] == "Unknown Book"
+
+
+def test_each_word_is_fetched_once(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    words = ["serene", "placid", "tranquil"]
+    make_vocab_db(
+        db_path,
+        words=[(f"en:{w}", w, w, "en", now) for w in words],
+        lookups=[(f"l{i}", f"en:{w}", "b1", f"It was {w}.") for i, w in enumerate(words)],
+        books=[("b1", "Walden")],
+    )
+    with open(os.path.join(FIXTURES, "oxford_serene.html"), "rb") as f:
+        page = f.read()
+
+    oxford_calls = []
+    translate_calls = []
+
+    def fake_get(session, method, url, *args, **kwargs):
+        oxford_calls.append(url)
+        return FakeResponse(page)
+
+    def fake_request(url, host=None, type_=None, data=None):
+        translate_calls.append(url)
+        return json.dumps(["\n".join("spokojny" for _ in data["q"].split("\n"))])
+
+    monkeypatch.setattr(requests.Session, "request", fake_get)
+    monkeypatch.setattr(translate, "_request", fake_request)
+
+    importer = KindleImporter(db_path, "pl", importDays=1, requestsPerSecond=None)
+    importer.translateWordsFromDB()
+
+    assert len(oxford_calls) == len(words)
+    assert len(translate_calls) == 1  # all three words in one batch
+    assert [card["word"] for card in importer.translated] == importer.words
+    for card in importer.translated:
+        assert card["oxford_data"]["word_type"] == "adjective"
+        assert "calm and peaceful" in card["dictionary_definition"]
+        assert card["translated_definition"] == "spokojny"
+
+
+def test_incremental_import_skips_exported_words(tmp_path):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    ledger_path = str(tmp_path / "ledger.db")
+    make_vocab_db(
+        db_path,
+        words=[("en:serene", "serene", "serene", "en", now - 10),
+               ("en:placid", "placid", "placid", "en", now - 10)],
+        lookups=[("l1", "en:serene", "b1", "The lake was serene."),
+                 ("l2", "en:placid", "b1", "A placid river.")],
+        books=[("b1", "Walden")],
+    )
+
+    importer = KindleImporter(db_path, "pl", importDays=1, ledgerPath=ledger_path)
+    importer.getWordsFromDB()
+    assert sorted(importer.words) == ["placid", "serene"]
+    importer.markImported()
+
+    # Nothing new: the next run has nothing to enrich
+    importer = KindleImporter(db_path, "pl", importDays=1, ledgerPath=ledger_path)
+    importer.getWordsFromDB()
+    assert importer.words == []
+
+    # A new word and an existing word with a changed lookup are picked up
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO WORDS (id, word, stem, lang, timestamp) VALUES "
+                 "('en:tranquil', 'tranquil', 'tranquil', 'en', ?)", (now,))
+    conn.execute("UPDATE LOOKUPS SET usage = 'The lake was very serene.', timestamp = ? "
+                 "WHERE id = 'l1'", (now,))
+    conn.execute("UPDATE LOOKUPS SET timestamp = ? WHERE id = 'l2'", (now,))
+    conn.commit()
+    conn.close()
+
+    importer = KindleImporter(db_path, "pl", importDays=1, ledgerPath=ledger_path)
+    importer.getWordsFromDB()
+    assert sorted(importer.words) == ["serene", "tranquil"]
+    assert importer.skipped_words == 1
+
+
+def test_incremental_import_ignores_import_days(tmp_path):
+    now = int(time.time() * 1000)
+    day = 24 * 60 * 60 * 1000
+    db_path = str(tmp_path / "vocab.db")
+    ledger_path = str(tmp_path / "ledger.db")
+    make_vocab_db(
+        db_path,
+        words=[("en:serene", "serene", "serene", "en", now - 5 * day)],
+        lookups=[("l1", "en:serene", "b1", "The lake was serene.")],
+        books=[("b1", "Walden")],
+    )
+    importer = KindleImporter(db_path, "pl", importDays=10, ledgerPath=ledger_path)
+    importer.getWordsFromDB()
+    importer.markImported()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO WORDS (id, word, stem, lang, timestamp) VALUES "
+                 "('en:placid', 'placid', 'placid', 'en', ?)", (now - 3 * day,))
+    conn.execute("INSERT INTO WORDS (id, word, stem, lang, timestamp) VALUES "
+                 "('en:tranquil', 'tranquil', 'tranquil', 'en', ?)", (now,))
+    conn.commit()
+    conn.close()
+
+    # A missed run loses nothing: words older than importDays but newer than
+    # the last import are still picked up
+    importer = KindleImporter(db_path, "pl", importDays=1, ledgerPath=ledger_path)
+    importer.getWordsFromDB()
+    assert sorted(importer.words) == ["placid", "tranquil"]
+
+
+def test_export_streams_cards_to_file(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    words = [f"word{i:03d}" for i in range(100)]
+    make_vocab_db(
+        db_path,
+        words=[(f"en:{w}", w, w, "en", now) for w in words],
+        lookups=[(f"l{i}", f"en:{w}", "b1", f"Using {w} here.") for i, w in enumerate(words)],
+        books=[("b1", "Walden")],
+    )
+    monkeypatch.setattr(translate, "_request", lambda url, *args, **kwargs: '["tak"]')
+
+    importer = KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              concurrency=4, requestsPerSecond=None, translateBatchSize=5)
+    read = []
+    iter_words = importer.iterWordsFromDB
+
+    def counting_iter():
+        for record in iter_words():
+            read.append(record["word"])
+            yield record
+
+    monkeypatch.setattr(importer, "iterWordsFromDB", counting_iter)
+    format_card = importer.formatCard
+    read_at_first_write = []
+
+    def watching_format(card_data, media_folder=None):
+        if not read_at_first_write:
+            read_at_first_write.append(len(read))
+        return format_card(card_data, media_folder)
+
+    monkeypatch.setattr(importer, "formatCard", watching_format)
+
+    path = importer.exportToFile()
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    os.remove(path)
+
+    assert [line.split(";")[0] for line in lines] == sorted(words)
+    assert all("tak" in line for line in lines)
+    # The first card was written long before the whole vocabulary was read
+    assert read_at_first_write[0] <= 20
+
+
+def test_export_notes_keeps_fields_intact(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    make_vocab_db(
+        db_path,
+        words=[("en:serene", "serene", "serene", "en", now)],
+        lookups=[("l1", "en:serene", "b1", "Calm; serene; quiet.")],
+        books=[("b1", "Walden")],
+    )
+    monkeypatch.setattr(translate, "_request", lambda url, *args, **kwargs: '["spokojny; cichy"]')
+
+    importer = KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              requestsPerSecond=None)
+    rows = importer.exportNotes()
+
+    assert len(rows) == 1 and len(rows[0]) == 9
+    assert rows[0][0] == "serene"
+    # No text file round trip, so semicolons don't have to be replaced
+    assert "spokojny; cichy" in rows[0][6]
+
+
+def test_words_in_collection_are_filtered_before_enrichment(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    make_vocab_db(
+        db_path,
+        words=[("en:serene", "serene", "serene", "en", now),
+               ("en:tranquil", "tranquil", "tranquil", "en", now)],
+        lookups=[("l1", "en:serene", "b1", "A serene lake."),
+                 ("l2", "en:tranquil", "b1", "A tranquil evening.")],
+        books=[("b1", "Walden")],
+    )
+    translated = []
+
+    def fake_request(url, host=None, type_=None, data=None):
+        translated.append(data["q"])
+        return json.dumps([["\n".join("tak" for _ in data["q"].split("\n")), "en"]])
+
+    monkeypatch.setattr(translate, "_request", fake_request)
+
+    # Ignore mode: existing words never reach the network
+    importer = KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              requestsPerSecond=None, existingWords={"serene"}, importMode=1)
+    rows = importer.exportNotes()
+    assert [row[0] for row in rows] == ["tranquil"]
+    assert importer.duplicate_words == 1
+    assert translated == ["tranquil"]
+
+    # Update mode: they are enriched and marked
+    importer = KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              requestsPerSecond=None, existingWords={"serene"}, importMode=0,
+                              translateBatchSize=1)
+    cards = list(importer.enrichWords(importer.iterWordsFromDB()))
+    assert {card["word"]: card["existing"] for card in cards} == {"serene": True, "tranquil": False}
+
+
+def test_interrupted_import_resumes_from_journal(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    journal_path = str(tmp_path / "journal.jsonl")
+    words = [f"word{i}" for i in range(6)]
+    make_vocab_db(
+        db_path,
+        words=[(f"en:{w}", w, w, "en", now) for w in words],
+        lookups=[(f"l{i}", f"en:{w}", "b1", f"Using {w}.") for i, w in enumerate(words)],
+        books=[("b1", "Walden")],
+    )
+    translated = []
+
+    def fake_request(url, host=None, type_=None, data=None):
+        translated.append(data["q"])
+        return json.dumps([["tak " + data["q"], "en"]])
+
+    monkeypatch.setattr(translate, "_request", fake_request)
+
+    def make_importer(**kwargs):
+        return KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              executor="serial", requestsPerSecond=None,
+                              translateBatchSize=1, journalPath=journal_path, **kwargs)
+
+    # First attempt stops after the first three cards
+    importer = make_importer()
+    cards = importer.enrichWords(importer.iterWordsFromDB())
+    assert [next(cards)["word"] for _ in range(3)] == words[:3]
+    cards.close()
+    importer.journal.close()
+
+    # The restart only translates the words that weren't finished
+    translated.clear()
+    importer = make_importer()
+    rows = importer.exportNotes()
+    assert [row[0] for row in rows] == words
+    assert all("tak word" in row[6] for row in rows)
+    assert translated == words[3:]
+    assert importer.journal.resumed == 3
+
+    # A different target language doesn't reuse the journal
+    other = KindleImporter(db_path, "de", importDays=1, journalPath=journal_path)
+    assert len(other.journal) == 0
+
+    importer.markImported()
+    assert not os.path.exists(journal_path)
+
+
+def test_progress_events(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    words = [f"word{i}" for i in range(5)]
+    make_vocab_db(
+        db_path,
+        words=[(f"en:{w}", w, w, "en", now) for w in words],
+        lookups=[(f"l{i}", f"en:{w}", "b1", f"Using {w}.") for i, w in enumerate(words)],
+        books=[("b1", "Walden")],
+    )
+    monkeypatch.setattr(translate, "_request", lambda url, *args, **kwargs: '["tak"]')
+    events = []
+
+    importer = KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              doTranslate=False, requestsPerSecond=None,
+                              existingWords={"word0"}, progressCallback=events.append)
+    importer.exportNotes()
+
+    assert (events[0].stage, events[0].done, events[0].total) == ("read", 0, 5)
+    assert [(e.done, e.total) for e in events if e.stage == "read"][-1] == (5, 5)
+    assert (events[-1].stage, events[-1].done, events[-1].total) == ("enrich", 4, 4)
+
+
+def test_read_progress_follows_fetched_rows(tmp_path):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    words = [f"word{i}" for i in range(1200)]
+    make_vocab_db(
+        db_path,
+        words=[(f"en:{w}", w, w, "en", now) for w in words],
+        lookups=[(f"l{i}", f"en:{w}", "b1", f"Using {w}.") for i, w in enumerate(words)],
+        books=[("b1", "Walden")],
+    )
+    events = []
+
+    importer = KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              doTranslate=False, requestsPerSecond=None,
+                              existingWords=set(words), progressCallback=events.append)
+    importer.exportNotes()
+
+    assert [e.done for e in events if e.stage == "read"] == [0, 500, 1000, 1200]
+
+
+def test_cancelled_import_returns_finished_cards(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    ledger_path = str(tmp_path / "ledger.db")
+    words = [f"word{i}" for i in range(10)]
+    make_vocab_db(
+        db_path,
+        words=[(f"en:{w}", w, w, "en", now) for w in words],
+        lookups=[(f"l{i}", f"en:{w}", "b1", f"Using {w}.") for i, w in enumerate(words)],
+        books=[("b1", "Walden")],
+    )
+    token = CancellationToken()
+
+    def fake_request(url, host=None, type_=None, data=None):
+        if data["q"] == "word3":
+            token.cancel()
+        return json.dumps([["tak", "en"]])
+
+    monkeypatch.setattr(translate, "_request", fake_request)
+
+    importer = KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              executor="serial", requestsPerSecond=None, translateBatchSize=1,
+                              ledgerPath=ledger_path, cancelToken=token)
+    rows = importer.exportNotes()
+    transport.set_cancel_token(None)
+
+    assert importer.cancelled
+    assert [row[0] for row in rows] == words[:3]
+
+    # Only the imported words count as done
+    importer.markImported()
+    importer = KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              requestsPerSecond=None, doTranslate=False, ledgerPath=ledger_path)
+    assert [row[0] for row in importer.exportNotes()] == words[3:]
+
+
+def test_timing_report(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    report_path = str(tmp_path / "report.json")
+    make_vocab_db(
+        db_path,
+        words=[("en:serene", "serene", "serene", "en", now)],
+        lookups=[("l1", "en:serene", "b1", "A serene lake.")],
+        books=[("b1", "Walden")],
+    )
+    monkeypatch.setattr(requests.Session, "request", lambda session, method, url, **kwargs:
+                        FakeResponse(b'[["spokojny", "en"]]'))
+
+    importer = KindleImporter(db_path, "pl", importDays=1, includeDictionary=False,
+                              requestsPerSecond=None, reportPath=report_path)
+    importer.exportNotes()
+    importer.writeReport()
+    instrumentation.set_recorder(None)
+
+    with open(report_path, encoding="utf-8") as f:
+        steps = json.load(f)["steps"]
+    assert {"db.read", "throttle.wait", "translate.request", "format"} <= set(steps)
+    assert steps["format"]["count"] == 1
+
+
+def test_offline_dictionary_import(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    make_vocab_db(
+        db_path,
+        words=[("en:serene", "serene", "serene", "en", now), ("en:qwzx", "qwzx", "qwzx", "en", now)],
+        lookups=[("l1", "en:serene", "b1", "It was serene."), ("l2", "en:qwzx", "b1", "qwzx")],
+        books=[("b1", "Walden")],
+    )
+    dictionary_path = str(tmp_path / "dictionary.json")
+    with open(dictionary_path, "w", encoding="utf-8") as f:
+        json.dump({"serene": {"pos": "adjective", "definitions": ["calm and peaceful"]}}, f)
+
+    def no_network(session, method, url, *args, **kwargs):
+        raise AssertionError(f"requested {url}")
+
+    monkeypatch.setattr(requests.Session, "request", no_network)
+    importer = KindleImporter(
+        db_path, "pl", doTranslate=False, importDays=1, requestsPerSecond=None,
+        dictionaryPath=dictionary_path, dictionaryIndexPath=str(tmp_path / "index.db"))
+    try:
+        cards = {card["word"]: card for card in importer.enrichWords(importer.iterWordsFromDB())}
+    finally:
+        oxford_dictionary.get_dictionary().close()
+        oxford_dictionary.set_dictionary(None)
+
+    assert cards["serene"]["oxford_data"]["word_type"] == "adjective"
+    assert "calm and peaceful" in cards["serene"]["dictionary_definition"]
+    assert cards["qwzx"]["oxford_data"] is None
+
+
+def read_pages(*names):
+    pages = {}
+    for name in names:
+        with open(os.path.join(FIXTURES, f"oxford_{name}.html"), "rb") as f:
+            pages[name] = f.read()
+    return pages
+
+
+def fake_oxford(pages, calls):
+    """Serve the given Oxford pages, and the search's "no exact match" page for other words"""
+    with open(os.path.join(FIXTURES, "oxford_no_match.html"), "rb") as f:
+        no_match = f.read()
+
+    def fake_get(session, method, url, *args, **kwargs):
+        calls.append(url)
+        return FakeResponse(pages.get(url.rsplit("=", 1)[1], no_match))
+    return fake_get
+
+
+def test_forms_of_a_lemma_share_one_lookup(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    # (word, Kindle stem)
+    forms = [("run", "run"), ("running", "run"), ("ran", ""), ("Runs", "run"), ("serene", "serene")]
+    make_vocab_db(
+        db_path,
+        words=[(f"en:{w}", w, stem, "en", now) for w, stem in forms],
+        lookups=[(f"l{i}", f"en:{w}", "b1", f"She was {w}.") for i, (w, _) in enumerate(forms)],
+        books=[("b1", "Walden")],
+    )
+    pages = read_pages("run", "serene")
+    oxford_calls = []
+    monkeypatch.setattr(requests.Session, "request", fake_oxford(pages, oxford_calls))
+    importer = KindleImporter(db_path, "pl", doTranslate=False, importDays=1, requestsPerSecond=None)
+    cards = list(importer.enrichWords(importer.iterWordsFromDB()))
+
+    assert sorted(url.rsplit("=", 1)[1] for url in oxford_calls) == ["run", "serene"]
+    assert [card["word"] for card in cards] == [w for w, _ in forms]
+    assert [card["lemma"] for card in cards] == ["run", "run", "run", "run", "serene"]
+    assert all(card["oxford_data"]["word_type"] == "verb" for card in cards[:4])
+    assert importer.dictionaryLookups.shared == 3
+    # ...without passing off the pronunciation and audio of "run" as their own
+    assert cards[0]["oxford_data"]["audio_url"]
+    assert all(card["oxford_data"]["pronunciation"] == "" for card in cards[1:4])
+    assert all(card["oxford_data"]["audio_url"] == "" for card in cards[1:4])
+
+    # Without lemmas every form is looked up as it is
+    oxford_calls.clear()
+    pages.update({name: pages["run"] for name in ("running", "ran", "runs")})
+    importer = KindleImporter(db_path, "pl", doTranslate=False, importDays=1,
+                              requestsPerSecond=None, resolveLemmas=False)
+    list(importer.enrichWords(importer.iterWordsFromDB()))
+    assert len(oxford_calls) == len(forms)
+
+
+def test_lexicalized_forms_keep_their_own_entry(tmp_path, monkeypatch):
+    now = int(time.time() * 1000)
+    db_path = str(tmp_path / "vocab.db")
+    forms = [("building", "build"), ("build", "build")]
+    make_vocab_db(
+        db_path,
+        words=[(f"en:{w}", w, stem, "en", now) for w, stem in forms],
+        lookups=[(f"l{i}", f"en:{w}", "b1", f"They {w}.") for i, (w, _) in enumerate(forms)],
+        books=[("b1", "Walden")],
+    )
+    pages = read_pages("building", "run")
+    pages["build"] = pages.pop("run")
+    oxford_calls = []
+    monkeypatch.setattr(requests.Session, "request", fake_oxford(pages, oxford_calls))
+
+    importer = KindleImporter(db_path, "pl", doTranslate=False, importDays=1, requestsPerSecond=None)
+    building, build = importer.enrichWords(importer.iterWordsFromDB())
+
+    assert building["lemma"] == "building"
+    assert building["oxford_data"]["word_type"] == "noun"
+    assert building["oxford_data"]["pronunciation"] == "/ˈbɪldɪŋ/"
+    assert building["oxford_data"]["audio_url"].endswith("building__us_1.mp3")
+    assert "a structure such as a house" in building["dictionary_definition"]
+    assert build["oxford_data"]["word_type"] == "verb"
+    assert len(oxford_calls) == 2
@@ -0,0 +1,76 @@
+import os
+import sys
+import threading
+import time
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.enrichment import create_executor
+from kind2anki.lemmas import IRREGULAR_FORMS, LemmaResolver, LookupGroup, load_inflections
+
+
+def test_resolve_order(tmp_path):
+    table = tmp_path / "inflections.tsv"
+    table.write_text("# lemma\tforms\nbuilding\tbuildings\nlie lay lain\n", encoding="utf-8")
+    resolver = LemmaResolver(load_inflections(str(table)))
+
+    # Kindle's stem, then the built-in irregular forms
+    assert resolver.resolve("running", "run") == "run"
+    assert resolver.resolve("ran", "") == "run"
+    assert resolver.resolve("Children", None) == "child"
+    assert resolver.resolve("serene", None) == "serene"
+    # The user's table overrides Kindle's stem, also for its lemmas
+    assert resolver.resolve("buildings", "build") == "building"
+    assert resolver.resolve("building", "build") == "building"
+    assert resolver.resolve("lay", "lay") == "lie"
+    # Phrases are looked up as they are
+    assert resolver.resolve("give up", "give") == "give up"
+    assert load_inflections(str(tmp_path / "missing.tsv")) == {}
+    assert "saw" not in IRREGULAR_FORMS
+
+
+def test_headwords_are_not_lemmatized():
+    headwords = {"painter"}
+    resolver = LemmaResolver(is_headword=headwords.__contains__)
+    assert resolver.resolve("painter", "paint") == "painter"
+    assert resolver.resolve("paints", "paint") == "paint"
+    # Lexicalized forms are kept without a dictionary telling so
+    resolver = LemmaResolver()
+    assert resolver.resolve("meaning", "mean") == "meaning"
+    assert resolver.resolve("Feelings", "feel") == "feeling"
+    assert resolver.resolve("means", "mean") == "mean"
+
+
+def test_lookup_group_runs_each_key_once():
+    calls = []
+    lock = threading.Lock()
+
+    def lookup(key):
+        def run():
+            with lock:
+                calls.append(key)
+            time.sleep(0.01)
+            return key.upper()
+        return run
+
+    group = LookupGroup()
+    keys = ["run", "run", "go", "run", "go", "serene"] * 5
+    results = list(create_executor("thread", concurrency=8).map(
+        lambda key: group.get(key, lookup(key)), keys))
+
+    assert results == [key.upper() for key in keys]
+    assert sorted(calls) == ["go", "run", "serene"]
+    assert group.lookups == 3 and group.shared == len(keys) - 3
+
+
+def test_lookup_group_retries_after_error():
+    group = LookupGroup()
+
+    def fail():
+        raise RuntimeError("offline")
+
+    try:
+        group.get("run", fail)
+    except RuntimeError:
+        pass
+    assert group.get("run", lambda: "found") == "found"
@@ -0,0 +1,109 @@
+import os
+import sys
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.note_importer import (
+    ADD_MODE, IGNORE_MODE, UPDATE_MODE, NoteImporter, first_field_key, load_first_fields)
+
+
+class FakeNote:
+    def __init__(self, nid, fields):
+        self.id = nid
+        self.fields = list(fields)
+
+
+class FakeDB:
+    def __init__(self, col):
+        self.col = col
+        self.queries = 0
+
+    def all(self, sql, mid):
+        self.queries += 1
+        return [(nid, "\x1f".join(note.fields)) for nid, note in self.col.notes.items()
+                if self.col.note_types[nid] == mid]
+
+
+class FakeCollection:
+    """The parts of anki.collection.Collection used by NoteImporter"""
+
+    def __init__(self):
+        self.notes = {}
+        self.note_types = {}
+        self.decks = {}
+        self.db = FakeDB(self)
+        self.updates = []
+
+    def new_note(self, model):
+        note = FakeNote(0, [""] * len(model["flds"]))
+        note.mid = model["id"]
+        return note
+
+    def add_note(self, note, deck_id):
+        note.id = len(self.notes) + 1
+        self.notes[note.id] = note
+        self.note_types[note.id] = note.mid
+        self.decks[note.id] = deck_id
+
+    def get_note(self, nid):
+        return FakeNote(nid, self.notes[nid].fields)
+
+    def update_notes(self, notes):
+        self.updates.append(len(notes))
+        for note in notes:
+            self.notes[note.id].fields = note.fields
+
+
+MODEL = {"id": 7, "did": 1, "flds": [{"name": "Word"}, {"name": "Def"}]}
+
+
+def make_collection():
+    col = FakeCollection()
+    note = col.new_note(MODEL)
+    note.fields = ["<b>serene</b>", "calm"]
+    col.add_note(note, 1)
+    other = col.new_note({"id": 8, "flds": MODEL["flds"]})
+    other.fields = ["tranquil", "quiet"]
+    col.add_note(other, 1)
+    return col
+
+
+ROWS = [["serene", "peaceful", "ignored"], ["tranquil", "still"], ["serene", "again"]]
+
+
+def test_first_field_key():
+    assert first_field_key(" <b>serene</b>[sound:x.mp3] ") == "serene"
+    assert load_first_fields(make_collection(), 7) == {"serene": 1}
+
+
+def test_ignore_mode_skips_existing_words():
+    col = make_collection()
+    importer = NoteImporter(col, MODEL, deck_id=5, import_mode=IGNORE_MODE)
+    importer.run(ROWS)
+
+    assert (importer.added, importer.updated, importer.ignored) == (1, 0, 2)
+    assert col.notes[3].fields == ["tranquil", "still"]
+    assert col.decks[3] == 5
+    assert col.notes[1].fields == ["<b>serene</b>", "calm"]
+    assert col.db.queries == 1
+
+
+def test_update_mode_updates_existing_notes():
+    col = make_collection()
+    importer = NoteImporter(col, MODEL, deck_id=5, import_mode=UPDATE_MODE)
+    importer.run(ROWS)
+
+    assert (importer.added, importer.updated, importer.ignored) == (1, 1, 1)
+    assert col.notes[1].fields == ["serene", "peaceful"]
+    assert col.updates == [1]
+
+
+def test_add_mode_adds_everything():
+    col = make_collection()
+    importer = NoteImporter(col, MODEL, deck_id=5, import_mode=ADD_MODE)
+    log = importer.run(ROWS)
+
+    assert importer.added == 3
+    assert len(col.notes) == 5
+    assert col.db.queries == 0
+    assert log == ["Added 3 notes."]
@@ -0,0 +1,162 @@
+import gzip
+import json
+import os
+import struct
+import sys
+
+import pytest
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import oxford_dictionary
+from kind2anki.offline_dictionary import OfflineDictionary, load_dictionary, read_entries
+
+RUN_ENTRY = {
+    "name": "run",
+    "wordform": "verb",
+    "pronunciations": {"british": "rʌn", "american": "rʌn"},
+    "definitions": [
+        {"definition": "to move using your legs, going faster than when you walk",
+         "grammar": "[intransitive]",
+         "examples": ["They ran for the bus.", "I had to run to catch the bus."]},
+    ],
+    "audio_urls": {"american": "https://example.com/run__us_1.mp3"},
+}
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    return str(path)
+
+
+def write_stardict(folder, entries, compress=False):
+    """Write a StarDict dictionary with sametypesequence=m"""
+    index = b""
+    contents = b""
+    for headword, text in sorted(entries.items()):
+        data = text.encode("utf-8")
+        index += headword.encode("utf-8") + b"\0" + struct.pack(">II", len(contents), len(data))
+        contents += data
+    with open(os.path.join(folder, "test.idx"), "wb") as f:
+        f.write(index)
+    if compress:
+        with gzip.open(os.path.join(folder, "test.dict.dz"), "wb") as f:
+            f.write(contents)
+    else:
+        with open(os.path.join(folder, "test.dict"), "wb") as f:
+            f.write(contents)
+    ifo = os.path.join(folder, "test.ifo")
+    with open(ifo, "w", encoding="utf-8") as f:
+        f.write("StarDict's dict ifo file\nversion=2.4.2\nbookname=Test\n"
+                f"wordcount={len(entries)}\nidxfilesize={len(index)}\nsametypesequence=m\n")
+    return ifo
+
+
+def test_json_formats(tmp_path):
+    full = dict(read_entries(write_json(tmp_path / "full.json", [RUN_ENTRY])))
+    assert full["run"]["definitions"] == RUN_ENTRY["definitions"]
+    assert full["run"]["examples"] == RUN_ENTRY["definitions"][0]["examples"]
+
+    simple = dict(read_entries(write_json(tmp_path / "simple.json", {
+        "serene": {"pos": "adjective", "pronunciation": "/səˈriːn/",
+                   "definitions": ["calm and peaceful"], "audio_url": "serene.mp3"},
+        "placid": "calm and not easily excited",
+    })))
+    assert simple["serene"]["wordform"] == "adjective"
+    assert simple["serene"]["pronunciations"] == {"british": "səˈriːn"}
+    assert simple["serene"]["audio_urls"] == {"british": "serene.mp3"}
+    assert simple["placid"]["definitions"] == [{"definition": "calm and not easily excited", "examples": []}]
+
+    lines = tmp_path / "dump.jsonl"
+    lines.write_text(json.dumps({"word": "tranquil", "definitions": ["quiet and peaceful"]}) + "\n\n",
+                     encoding="utf-8")
+    assert [headword for headword, _ in read_entries(str(lines))] == ["tranquil"]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_stardict(tmp_path, compress):
+    ifo = write_stardict(str(tmp_path), {
+        "run": "[rʌn]\nto move using your legs\nto manage a business",
+        "serene": "calm and peaceful",
+    }, compress)
+    entries = dict(read_entries(ifo))
+    assert entries["run"]["pronunciations"] == {"british": "rʌn"}
+    assert [d["definition"] for d in entries["run"]["definitions"]] == [
+        "to move using your legs", "to manage a business"]
+    assert entries["serene"]["definitions"][0]["definition"] == "calm and peaceful"
+
+
+def test_dsl(tmp_path):
+    dsl = tmp_path / "test.dsl"
+    dsl.write_text(
+        '#NAME "Test"\n#INDEX_LANGUAGE "English"\n\n'
+        "run\nrunning{s}\n"
+        "\t[p]verb[/p] [t]rʌn[/t]\n"
+        "\t[m1]1. [trn]to move using your legs[/trn][/m]\n"
+        "\t[m2][ex][lang id=1033]They ran for the bus.[/lang][/ex][/m]\n"
+        "\t[m1]2. to manage \\[a business\\] [s]run.wav[/s][/m]\n"
+        "serene\n"
+        "\t[m1]calm and peaceful[/m]\n",
+        encoding="utf-16")
+    entries = dict(read_entries(str(dsl)))
+    assert set(entries) == {"run", "running", "serene"}
+    run = entries["run"]
+    assert run["wordform"] == "verb"
+    assert run["pronunciations"] == {"british": "rʌn"}
+    assert run["definitions"] == [
+        {"definition": "1. to move using your legs", "examples": ["They ran for the bus."]},
+        {"definition": "2. to manage [a business]", "examples": []},
+    ]
+    assert entries["serene"]["definitions"][0]["definition"] == "calm and peaceful"
+
+
+def test_unsupported_format(tmp_path):
+    with pytest.raises(ValueError):
+        read_entries(str(tmp_path / "dictionary.txt"))
+
+
+def test_index_is_built_once(tmp_path):
+    source = write_json(tmp_path / "dictionary.json", [RUN_ENTRY])
+    index_path = str(tmp_path / "index.db")
+
+    dictionary = load_dictionary(source, index_path)
+    assert len(dictionary) == 1
+    word_info = dictionary.get_word_info("Run")
+    assert word_info.definitions == RUN_ENTRY["definitions"]
+    assert word_info.audio_urls == RUN_ENTRY["audio_urls"]
+    assert dictionary.get_word_info("walk") is None
+    assert dictionary.stats() == {"hits": 1, "misses": 1}
+    dictionary.close()
+    assert OfflineDictionary.is_current(source, index_path)
+
+    # A changed dump is indexed again
+    write_json(tmp_path / "dictionary.json", [RUN_ENTRY, dict(RUN_ENTRY, name="walk")])
+    os.utime(source, (0, 0))
+    assert not OfflineDictionary.is_current(source, index_path)
+    dictionary = load_dictionary(source, index_path)
+    assert dictionary.get_word_info("walk").name == "walk"
+    dictionary.close()
+
+
+def test_lookup_uses_offline_dictionary(tmp_path, monkeypatch):
+    source = write_json(tmp_path / "dictionary.json", [RUN_ENTRY])
+    dictionary = load_dictionary(source, str(tmp_path / "index.db"))
+
+    def no_network(cls, word):
+        raise AssertionError("looked up online")
+
+    monkeypatch.setattr(oxford_dictionary.OxfordDictionary, "get_word_info", classmethod(no_network))
+    oxford_dictionary.set_dictionary(dictionary)
+    try:
+        result = oxford_dictionary.lookup_oxford_dictionary("run")
+        assert oxford_dictionary.lookup_oxford_dictionary("walk") is None
+    finally:
+        oxford_dictionary.set_dictionary(None)
+        dictionary.close()
+
+    assert result["word_type"] == "verb"
+    assert result["pronunciation"] == "/rʌn/"
+    assert result["definitions"] == [
+        "([intransitive]) to move using your legs, going faster than when you walk"]
+    assert result["audio_url"] == "https://example.com/run__us_1.mp3"
@@ -0,0 +1,88 @@
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import oxford_dictionary, transport
+from kind2anki.enrichment import create_executor, set_rate_limiter
+from kind2anki.oxford_dictionary import OxfordDictionary
+from kind2anki.parse_pool import ParsePool
+
+with open(os.path.join(dir_path, "fixtures", "oxford_serene.html"), "rb") as f:
+    TEMPLATE = f.read()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves the 'serene' fixture page rewritten for the requested word"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        word = parse_qs(urlparse(self.path).query)["q"][0]
+        body = TEMPLATE.replace(b"serene", word.encode("utf-8"))
+        time.sleep(random.uniform(0, 0.005))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fixture_server(monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(OxfordDictionary, "base_url", f"http://127.0.0.1:{httpd.server_address[1]}")
+    set_rate_limiter(None)
+    oxford_dictionary.set_cache(None)
+    transport.configure(pool_maxsize=32)
+    yield
+    transport.configure(pool_maxsize=10)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("parser", ["html.parser", "lxml"])
+def test_concurrent_lookups_are_not_mixed_up(fixture_server, parser):
+    if parser == "lxml":
+        pytest.importorskip("lxml")
+    oxford_dictionary.set_parser(parser)
+    words = [f"word{i}" for i in range(300)]
+    try:
+        results = list(create_executor("thread", concurrency=32).map(OxfordDictionary.get_word_info, words))
+    finally:
+        oxford_dictionary.set_parser("auto")
+
+    for word, word_info in zip(words, results):
+        assert word_info.name == word
+        assert word_info.audio_urls["american"].endswith(f"{word}__us_1.mp3")
+        assert word_info.examples[1] == f"She has a {word} smile."
+        assert all(word in example
+                   for definition in word_info.definitions
+                   for example in definition["examples"])
+
+
+def test_lookups_parsed_on_process_pool(fixture_server):
+    words = [f"word{i}" for i in range(60)]
+    pool = ParsePool(2)
+    oxford_dictionary.set_parse_pool(pool)
+    try:
+        results = list(create_executor("thread", concurrency=8).map(OxfordDictionary.get_word_info, words))
+    finally:
+        oxford_dictionary.set_parse_pool(None)
+        pool.close()
+
+    for word, word_info in zip(words, results):
+        assert word_info.name == word
+        assert word_info.examples[1] == f"She has a {word} smile."
@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import oxford_dictionary, transport
+from kind2anki.cache import MISS, PersistentCache
+from kind2anki.oxford_dictionary import OxfordDictionary, WordNotFound
+from kind2anki.parse_pool import ParsePool
+
+sys.path.insert(0, dir_path)
+from helpers import FakeResponse
+
+FIXTURES = os.path.join(dir_path, "fixtures")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.db"), namespace="oxford")
+    oxford_dictionary.set_cache(cache)
+    yield cache
+    oxford_dictionary.set_cache(None)
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("page", ["oxford_serene.html", "oxford_run.html"])
+def test_lxml_parser_matches_html_parser(page):
+    pytest.importorskip("lxml")
+    content = read_fixture(page)
+    expected = OxfordDictionary.parse_page(content, parser="html.parser")
+    assert OxfordDictionary.parse_page(content, parser="lxml") == expected
+    assert expected.definitions
+
+
+def test_parse_page_fields():
+    word_info = OxfordDictionary.parse_page(read_fixture("oxford_run.html"))
+    assert word_info.name == "run"
+    assert word_info.wordform == "verb"
+    assert word_info.pronunciations == {"british": "rʌn", "american": "rʌn"}
+    assert word_info.audio_urls["american"].endswith("run__us_1.mp3")
+    assert word_info.definitions[0] == {
+        "definition": "to move using your legs, going faster than when you walk",
+        "grammar": "[intransitive]",
+        "examples": ["They ran for the bus.", "I had to run to catch the bus."],
+    }
+    # Boxes like "Collocations" and "Express Yourself" are left out
+    assert "run a marathon (collocation box)" not in word_info.examples
+    assert all(d["definition"] != "should be removed" for d in word_info.definitions)
+
+
+@pytest.mark.parametrize("parser", ["html.parser", "lxml"])
+def test_no_exact_match(parser):
+    if parser == "lxml":
+        pytest.importorskip("lxml")
+    with pytest.raises(WordNotFound):
+        OxfordDictionary.parse_page(read_fixture("oxford_no_match.html"), "qwzx", parser=parser)
+
+
+def test_parse_pool_returns_compact_records():
+    pages = [read_fixture(name) for name in ("oxford_run.html", "oxford_no_match.html", "oxford_serene.html")]
+    pool = ParsePool(2)
+    try:
+        records = pool.map(pages, "html.parser")
+    finally:
+        pool.close()
+    assert records[1] is None
+    assert records[0] == OxfordDictionary.parse_page(pages[0], parser="html.parser").as_dict()
+    assert records[2]["name"] == "serene"
+
+
+def test_pages_without_an_entry_are_not_cached(cache, monkeypatch):
+    page = b"<html><body><h1>Please try again later</h1></body></html>"
+    monkeypatch.setattr(transport, "get", lambda url, **kwargs: FakeResponse(page))
+    assert OxfordDictionary.get_word_info("serene") is None
+    assert cache.get("serene") is MISS
+
+    # An empty record cached by an older version is looked up again
+    cache.set("serene", {"name": None, "definitions": None})
+    monkeypatch.setattr(transport, "get",
+                        lambda url, **kwargs: FakeResponse(read_fixture("oxford_serene.html")))
+    assert OxfordDictionary.get_word_info("serene").name == "serene"
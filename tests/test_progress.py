@@ -0,0 +1,26 @@
+import os
+import sys
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki.progress import ProgressEvent, ProgressReporter
+
+
+def test_event_label():
+    event = ProgressEvent('enrich', 120, 500, 12.0, 31.6, cache_hits=80)
+    assert event.label() == "Looking up words: 120/500 (12.0/s, ETA 0:32, 80 cache hits)"
+    assert ProgressEvent('audio', 3, None, 1.5, None).label() == "Downloading audio: 3 (1.5/s)"
+
+
+def test_reporter_throttles_events():
+    events = []
+    reporter = ProgressReporter(events.append, min_interval=60, cache_hits=lambda: 7)
+    for done in range(100):
+        reporter.update('enrich', done, 100)
+    reporter.update('enrich', 100, 100, force=True)
+
+    assert [event.done for event in events] == [0, 100]
+    assert events[-1].eta == 0 and events[-1].rate > 0
+    assert events[-1].cache_hits == 7
+    # Without a callback nothing is computed
+    ProgressReporter(None, cache_hits=lambda: 1 / 0).update('enrich', 1, 2, force=True)
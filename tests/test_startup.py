@@ -0,0 +1,67 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import dependencies
+
+
+ADDON_INIT = os.path.join(dir_path, "..", "__init__.py")
+
+
+def module_level_imports(path):
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    imports = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append("." * node.level + (node.module or ""))
+    return imports
+
+
+def test_addon_defers_its_own_modules():
+    # Only aqt and the standard library may be imported while Anki starts
+    imports = module_level_imports(ADDON_INIT)
+    assert "aqt" in imports
+    assert not [name for name in imports if name.startswith(".")]
+
+
+def test_importing_the_package_stays_light():
+    code = ("import sys; import kind2anki.cancellation, kind2anki.dependencies; "
+            "print(sorted(m for m in ('requests', 'bs4', 'kind2anki.kindleimporter') "
+            "if m in sys.modules))")
+    output = subprocess.check_output([sys.executable, "-c", code],
+                                     cwd=os.path.join(dir_path, ".."), text=True)
+    assert output.strip() == "[]"
+
+
+def test_dependency_check_is_remembered(tmp_path, monkeypatch):
+    marker = str(tmp_path / "dependencies.json")
+    monkeypatch.setattr(dependencies, "_checked", False)
+    monkeypatch.setattr(dependencies, "DEPENDENCIES", {"json": "json"})
+
+    assert dependencies.ensure_dependencies_installed(marker)
+    with open(marker) as f:
+        assert json.load(f)["packages"] == ["json"]
+
+    # Neither this process nor the next one looks the packages up again
+    def fail():
+        raise AssertionError("dependencies checked twice")
+    monkeypatch.setattr(dependencies, "missing_dependencies", fail)
+    assert dependencies.ensure_dependencies_installed(marker)
+    monkeypatch.setattr(dependencies, "_checked", False)
+    assert dependencies.ensure_dependencies_installed(marker)
+
+    dependencies.forget_dependency_check(marker)
+    assert not os.path.exists(marker)
+
+
+def test_missing_dependencies(monkeypatch):
+    monkeypatch.setattr(dependencies, "DEPENDENCIES",
+                        {"json": "json", "no-such-package": "no_such_module_kind2anki"})
+    assert dependencies.missing_dependencies() == ["no-such-package"]
@@ -1,11 +1,110 @@
 import sys
 import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
 
 # not elegant, but avoids importing PyQT etc.
 dir_path = os.path.dirname(os.path.realpath(__file__))
-sys.path.insert(0, os.path.join(dir_path, "..", "kind2anki"))
-from translate import translate
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import translate as translate_module
+from kind2anki.enrichment import set_rate_limiter
+from kind2anki.translate import NotTranslated, TranslationCache, translate, translate_batch
 
 
 def test_translation_works():
-    assert translate('nothing', to_lang='pl').lower() == 'nic'
\ No newline at end of file
+    assert translate('nothing', to_lang='pl').lower() == 'nic'
+
+
+@pytest.mark.parametrize('source, token', [
+    ('nothing', '102199.506953'),
+    ('house\ncat\ndog', '757835.893749'),
+    ('静かな湖', '158326.284936'),
+    ('żółć', '486278.88312'),
+    ('😀 emoji', '451641.55111'),
+    ('', '263193.145255'),
+])
+def test_calculate_tk_matches_original_algorithm(source, token):
+    assert translate_module._calculate_tk.__wrapped__(source) == token
+    assert translate_module._calculate_tk(source) == token
+
+
+DICTIONARY = {'nothing': 'nic', 'house': 'dom', 'cat': 'kot', 'dog': 'pies'}
+
+
+class TranslateHandler(BaseHTTPRequestHandler):
+    """Stand-in for the translate endpoint, translating line by line"""
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        source = parse_qs(self.rfile.read(length).decode('utf-8'))['q'][0]
+        TranslateHandler.requests.append(source)
+        lines = [DICTIONARY.get(line, line) for line in source.split('\n')]
+        if 'garbled' in source and len(lines) > 1:
+            lines = lines[:-1]  # response doesn't match the request
+        body = json.dumps([['\n'.join(lines), 'en']]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def translate_server(monkeypatch):
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), TranslateHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(translate_module, '_base_url',
+                        'http://127.0.0.1:{}/translate_a/t?client=webapp'.format(httpd.server_address[1]))
+    set_rate_limiter(None)
+    TranslateHandler.requests = []
+    yield TranslateHandler.requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_translate_batch_packs_words(translate_server):
+    words = ['nothing', 'house', 'cat', 'dog', 'unknownword']
+    assert translate_batch(words, to_lang='pl', max_items=2) == ['nic', 'dom', 'kot', 'pies', None]
+    assert len(translate_server) == 3
+
+
+def test_translate_batch_respects_size_limit(translate_server):
+    translate_batch(['nothing', 'house', 'cat'], to_lang='pl', max_chars=len('nothing\nhouse'))
+    assert translate_server == ['nothing\nhouse', 'cat']
+
+
+def test_translate_batch_falls_back_on_mismatch(translate_server):
+    assert translate_batch(['cat', 'garbled', 'dog'], to_lang='pl') == ['kot', None, 'pies']
+    assert translate_server == ['cat\ngarbled\ndog', 'cat', 'garbled', 'dog']
+
+
+def test_translation_cache(translate_server, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    translate_module.set_cache(TranslationCache(path))
+    try:
+        assert translate_batch(['house', 'cat', 'unknownword'], to_lang='pl') == ['dom', 'kot', None]
+        assert translate('house', to_lang='pl') == 'dom'
+        with pytest.raises(NotTranslated):
+            translate('unknownword', to_lang='pl')
+        assert len(translate_server) == 1
+
+        # Other language pairs don't share entries
+        translate('house', to_lang='de')
+        assert len(translate_server) == 2
+        assert translate_module.get_cache().stats()['memory_hits'] == 1
+
+        # A new cache on the same file serves from disk
+        translate_module.set_cache(TranslationCache(path))
+        assert translate_batch(['house', 'cat', 'unknownword'], to_lang='pl') == ['dom', 'kot', None]
+        assert len(translate_server) == 2
+    finally:
+        translate_module.set_cache(None)
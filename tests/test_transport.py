@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(dir_path, ".."))
+from kind2anki import oxford_dictionary, transport
+from kind2anki.cache import MISS, PersistentCache
+from kind2anki.enrichment import RateLimiter, set_rate_limiter
+from kind2anki.instrumentation import Recorder, set_recorder
+from kind2anki.oxford_dictionary import OxfordDictionary
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    failures_left = 0
+    requests = 0
+
+    def do_GET(self):
+        if self.path.startswith("/search/"):
+            # Dictionary overloaded for good
+            Handler.requests += 1
+            status, body = 503, b"<html><body>Service unavailable</body></html>"
+        elif self.path == "/flaky" and Handler.failures_left > 0:
+            Handler.failures_left -= 1
+            status, body = 503, b"busy"
+        else:
+            status, body = 200, b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "session=abc")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    transport.configure(backoff_factor=0)
+    transport.stats.reset()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    transport.close()
+    transport.configure(backoff_factor=0.5)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_connections_are_reused(server):
+    for _ in range(5):
+        assert transport.get(server + "/page").content == b"ok"
+
+    assert transport.stats.as_dict() == {"requests": 5, "connections": 1, "reused": 4}
+    assert len(transport.get_session().cookies) == 0
+
+
+def test_retries_server_errors(server):
+    Handler.failures_left = 2
+    response = transport.get(server + "/flaky")
+    assert response.status_code == 200
+    assert Handler.failures_left == 0
+
+
+def test_exhausted_retries_are_not_cached(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(OxfordDictionary, "base_url", server)
+    cache = PersistentCache(str(tmp_path / "cache.db"), namespace="oxford")
+    oxford_dictionary.set_cache(cache)
+    transport.configure(retries=2)
+    Handler.requests = 0
+    try:
+        assert OxfordDictionary.get_word_info("serene") is None
+    finally:
+        oxford_dictionary.set_cache(None)
+        transport.configure(retries=3)
+
+    assert Handler.requests == 3
+    assert cache.get("serene") is MISS
+
+
+def test_rate_limit_wait_is_timed_apart_from_the_request(server):
+    recorder = Recorder()
+    set_recorder(recorder)
+    set_rate_limiter(RateLimiter(5))
+    try:
+        for _ in range(3):
+            transport.get(server + "/page", step="page.fetch")
+    finally:
+        set_rate_limiter(None)
+        set_recorder(None)
+
+    steps = recorder.summary()
+    assert steps["page.fetch"]["count"] == steps["throttle.wait"]["count"] == 3
+    # Two of the requests waited 0.2s for their slot, outside of page.fetch
+    assert steps["throttle.wait"]["total"] >= 0.35
+    assert steps["page.fetch"]["max"] < 0.15